@@ -0,0 +1,42 @@
+'''
+Frames per second of animation rendered frame by frame with get_window_content
+and in batches with get_frames_content
+run from the repository root: python -m benchmarks.bench_batch
+'''
+import argparse
+import copy
+import time
+import numpy as np
+from src.camera import RayMarchCamera, stack_frames
+from src.example_worlds import world_1, world_2, world_3, world_4
+
+def make_camera(width: int, height: int, backend: str) -> RayMarchCamera:
+    return RayMarchCamera(pos=np.array([0, 0, 0], dtype=np.float64), target=np.array([10, 0, 0], dtype=np.float64),
+                          screne_width=width, screne_height=height, backend=backend)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--width', type=int, default=160)
+    parser.add_argument('--height', type=int, default=120)
+    parser.add_argument('--frames', type=int, default=200)
+    parser.add_argument('--backend', default=None)
+    args = parser.parse_args()
+
+    print(f"{'world':>8} {'single, fps':>12} {'batched, fps':>13} {'speedup':>8}")
+    for name, world in (('world_1', world_1), ('world_2', world_2), ('world_3', world_3), ('world_4', world_4)):
+        camera = make_camera(args.width, args.height, args.backend)
+        #warm up compilation of both kernels
+        camera.get_window_content(args.width, args.height, world.objects)
+        camera.get_frames_content(args.width, args.height, stack_frames(copy.deepcopy(world), 1))
+
+        single_world = copy.deepcopy(world)
+        start = time.perf_counter()
+        for frame in range(args.frames):
+            single_world.animate(frame / 5)
+            camera.get_window_content(args.width, args.height, single_world.objects)
+        single_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        camera.get_frames_content(args.width, args.height, stack_frames(copy.deepcopy(world), args.frames))
+        batched_time = time.perf_counter() - start
+        print(f"{name:>8} {args.frames / single_time:12.1f} {args.frames / batched_time:13.1f} {single_time / batched_time:8.2f}")
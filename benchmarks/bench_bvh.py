@@ -0,0 +1,60 @@
+'''
+Scaling of render time with number of objects with and without BVH
+run from the repository root: python -m benchmarks.bench_bvh
+'''
+import argparse
+import time
+import numpy as np
+from src.camera import RayMarchCamera
+from src.ray_marchobject import Sphere, Box
+
+def random_scene(count: int, seed: int = 0) -> list:
+    '''
+    Spheres and boxes scattered in front of the camera, their size shrinks with count so density stays similar
+    '''
+    rng = np.random.default_rng(seed)
+    size = 2.0 / np.cbrt(count)
+    objects = []
+    for i in range(count):
+        center = rng.uniform([5, -8, -8], [30, 8, 8])
+        color = rng.uniform(0, 1, 3)
+        if i % 2 == 0:
+            objects.append(Sphere(center=center, radius=size * rng.uniform(0.5, 1), color=color))
+        else:
+            objects.append(Box(center=center, half_sides=size * rng.uniform(0.3, 0.7, 3), color=color,
+                               rotation_dir=np.array([0, 1, 0]), rotation_angle=rng.uniform(0, 90)))
+    return objects
+
+def frame_time(camera: RayMarchCamera, width: int, height: int, objects: list, repeats: int) -> float:
+    camera.get_window_content(width, height, objects)
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        camera.get_window_content(width, height, objects)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--width', type=int, default=160)
+    parser.add_argument('--height', type=int, default=120)
+    parser.add_argument('--counts', type=int, nargs='+', default=[10, 100, 1000, 10000])
+    parser.add_argument('--max-linear', type=int, default=1000, help='largest scene rendered without BVH')
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--backend', default=None)
+    args = parser.parse_args()
+
+    print(f"{'objects':>8} {'linear, ms':>12} {'bvh, ms':>12} {'speedup':>8}")
+    for count in args.counts:
+        objects = random_scene(count)
+        results = {}
+        for use_bvh in (False, True):
+            if not use_bvh and count > args.max_linear:
+                continue
+            camera = RayMarchCamera(pos=np.array([0, 0, 0], dtype=np.float64), target=np.array([10, 0, 0], dtype=np.float64),
+                                    screne_width=args.width, screne_height=args.height, backend=args.backend, use_bvh=use_bvh)
+            results[use_bvh] = frame_time(camera, args.width, args.height, objects, args.repeats)
+        linear = results.get(False)
+        linear_text = f"{linear * 1000:12.1f}" if linear else f"{'-':>12}"
+        speedup = f"{linear / results[True]:8.1f}" if linear else f"{'-':>8}"
+        print(f"{count:>8} {linear_text} {results[True] * 1000:12.1f} {speedup}")
@@ -0,0 +1,29 @@
+'''
+Steps per pixel and frame time with cone marched depth prepass for different tile sizes
+run from the repository root: python -m benchmarks.bench_prepass
+'''
+import argparse
+import numpy as np
+from src.camera import RayMarchCamera
+from src.example_worlds import world_1, world_2, world_3, world_4
+from benchmarks.bench_stepping import render
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--width', type=int, default=160)
+    parser.add_argument('--height', type=int, default=120)
+    parser.add_argument('--tiles', type=int, nargs='+', default=[0, 4, 8, 16])
+    parser.add_argument('--backend', default=None)
+    args = parser.parse_args()
+
+    print(f"{'world':>8} {'tile':>5} {'steps':>7} {'ms':>8} {'mean diff':>10} {'changed':>8}")
+    for name, world in (('world_1', world_1), ('world_2', world_2), ('world_3', world_3), ('world_4', world_4)):
+        expected = None
+        for tile in args.tiles:
+            camera = RayMarchCamera(pos=np.array([0, 0, 0], dtype=np.float64), target=np.array([10, 0, 0], dtype=np.float64),
+                                    screne_width=args.width, screne_height=args.height, backend=args.backend, depth_prepass_tile=tile)
+            image, stats, frame_time = render(camera, args.width, args.height, world.objects)
+            if expected is None:
+                expected = image.astype(np.int64)
+            difference = np.abs(image.astype(np.int64) - expected)
+            print(f"{name:>8} {tile:>5} {stats[..., 0].mean():7.1f} {frame_time * 1000:8.1f} {difference.mean():10.2f} {np.mean(difference > 8):8.3f}")
@@ -0,0 +1,41 @@
+'''
+First frame (compilation) and steady frame time of generic and scene-specialised kernels
+run from the repository root: python -m benchmarks.bench_specialise
+'''
+import argparse
+import time
+import numpy as np
+from src.camera import RayMarchCamera
+from src.example_worlds import world_1, world_2, world_3, world_4
+from benchmarks.bench_bvh import random_scene
+
+def first_and_steady(camera: RayMarchCamera, width: int, height: int, objects: list, repeats: int) -> tuple:
+    start = time.perf_counter()
+    camera.get_window_content(width, height, objects)
+    first = time.perf_counter() - start
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        camera.get_window_content(width, height, objects)
+        times.append(time.perf_counter() - start)
+    return first, min(times)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--width', type=int, default=160)
+    parser.add_argument('--height', type=int, default=120)
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--backend', default=None)
+    args = parser.parse_args()
+
+    scenes = [('world_1', world_1.objects), ('world_2', world_2.objects), ('world_3', world_3.objects),
+              ('world_4', world_4.objects), ('mixed 100', random_scene(100))]
+    print(f"{'scene':>10} {'generic first':>14} {'generic, ms':>12} {'special first':>14} {'special, ms':>12} {'speedup':>8}")
+    for name, objects in scenes:
+        results = []
+        for specialise in (False, True):
+            camera = RayMarchCamera(pos=np.array([0, 0, 0], dtype=np.float64), target=np.array([10, 0, 0], dtype=np.float64),
+                                    screne_width=args.width, screne_height=args.height, backend=args.backend, specialise=specialise)
+            results.append(first_and_steady(camera, args.width, args.height, objects, args.repeats))
+        (generic_first, generic), (special_first, special) = results
+        print(f"{name:>10} {generic_first * 1000:14.0f} {generic * 1000:12.1f} {special_first * 1000:14.0f} {special * 1000:12.1f} {generic / special:8.2f}")
@@ -0,0 +1,38 @@
+'''
+Average number of steps, share of rays which ran out of steps and image difference
+of enhanced stepping (over-relaxation, relative hit epsilon) against plain sphere tracing
+run from the repository root: python -m benchmarks.bench_stepping
+'''
+import argparse
+import time
+import numpy as np
+from src.camera import RayMarchCamera
+from src.example_worlds import world_1, world_2, world_3, world_4
+from src.ray_march_cuda import march_out_of_steps, over_relaxation
+
+def render(camera: RayMarchCamera, width: int, height: int, objects: list, **march_params) -> tuple:
+    camera.get_window_content(width, height, objects, **march_params)
+    start = time.perf_counter()
+    image = camera.get_window_content(width, height, objects, record_march_stats=True, **march_params)
+    return image, camera.march_stats, time.perf_counter() - start
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--width', type=int, default=160)
+    parser.add_argument('--height', type=int, default=120)
+    parser.add_argument('--relaxation', type=float, default=over_relaxation)
+    parser.add_argument('--backend', default=None)
+    args = parser.parse_args()
+
+    print(f"{'world':>8} {'sphere steps':>13} {'enhanced steps':>15} {'sphere out':>11} {'enhanced out':>13} "
+          f"{'sphere, ms':>11} {'enhanced, ms':>13} {'mean diff':>10} {'changed':>8}")
+    for name, world in (('world_1', world_1), ('world_2', world_2), ('world_3', world_3), ('world_4', world_4)):
+        camera = RayMarchCamera(pos=np.array([0, 0, 0], dtype=np.float64), target=np.array([10, 0, 0], dtype=np.float64),
+                                screne_width=args.width, screne_height=args.height, backend=args.backend)
+        sphere_image, sphere_stats, sphere_time = render(camera, args.width, args.height, world.objects)
+        enhanced_image, enhanced_stats, enhanced_time = render(camera, args.width, args.height, world.objects,
+                                                               stepping='enhanced', relaxation=args.relaxation)
+        difference = np.abs(sphere_image.astype(np.int64) - enhanced_image.astype(np.int64))
+        print(f"{name:>8} {sphere_stats[..., 0].mean():13.1f} {enhanced_stats[..., 0].mean():15.1f} "
+              f"{np.mean(sphere_stats[..., 1] == march_out_of_steps):11.3f} {np.mean(enhanced_stats[..., 1] == march_out_of_steps):13.3f} "
+              f"{sphere_time * 1000:11.1f} {enhanced_time * 1000:13.1f} {difference.mean():10.2f} {np.mean(difference > 8):8.3f}")
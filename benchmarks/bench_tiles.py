@@ -0,0 +1,47 @@
+'''
+Scaling of TileScheduler with number of worker processes on the cpu backend,
+compared with single get_window_content call (numba threads of one process)
+run from the repository root: python -m benchmarks.bench_tiles
+'''
+import argparse
+import multiprocessing
+import time
+import numpy as np
+from src.camera import RayMarchCamera
+from src.tile_scheduler import TileScheduler
+from src.example_worlds import world_1, world_2, world_3, world_4
+
+def best_time(render, repeats: int) -> float:
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        render()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--width', type=int, default=320)
+    parser.add_argument('--height', type=int, default=240)
+    parser.add_argument('--tile-size', type=int, default=32)
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--workers', type=int, nargs='+', default=sorted({1, 2, 4, multiprocessing.cpu_count()}))
+    args = parser.parse_args()
+
+    worlds = (('world_1', world_1), ('world_2', world_2), ('world_3', world_3), ('world_4', world_4))
+    camera = RayMarchCamera(pos=np.array([0, 0, 0], dtype=np.float64), target=np.array([10, 0, 0], dtype=np.float64),
+                            screne_width=args.width, screne_height=args.height, backend='cpu')
+    print(f"{multiprocessing.cpu_count()} cores, {args.width}x{args.height}, tiles {args.tile_size}")
+    print(f"{'world':>8} {'camera, ms':>11}" + "".join(f" {f'{workers} workers, ms':>16}" for workers in args.workers))
+    results = {name: [] for name, _ in worlds}
+    for name, world in worlds:
+        camera.get_window_content(args.width, args.height, world.objects)
+        results[name].append(best_time(lambda: camera.get_window_content(args.width, args.height, world.objects), args.repeats))
+    for workers in args.workers:
+        with TileScheduler(camera, args.width, args.height, workers=workers, tile_size=args.tile_size) as scheduler:
+            for name, world in worlds:
+                #first frame compiles kernel in workers and measures cost of tiles
+                scheduler.render(world.objects)
+                results[name].append(best_time(lambda: scheduler.render(world.objects), args.repeats))
+    for name, times in results.items():
+        print(f"{name:>8} {times[0] * 1000:11.1f}" + "".join(f" {t * 1000:16.1f}" for t in times[1:]))
@@ -0,0 +1,197 @@
+'''
+Benchmark suite: throughput of every SDF (distance_from_*_obj) and frame time of every example world
+for different resolutions and numbers of objects (copies of the scene).
+Time of the first call (which compiles kernels) is stored separately from steady state (median of repeats).
+Results are written as JSON and two result files can be compared to find regressions.
+run from the repository root:
+    python -m benchmarks.suite --output cpu.json
+    NUMBA_ENABLE_CUDASIM=1 python -m benchmarks.suite --backend cuda --output sim.json
+    python -m benchmarks.suite --compare baseline.json cpu.json
+'''
+import argparse
+import copy
+import json
+import math
+import multiprocessing
+import platform
+import sys
+import time
+import numba
+import numpy as np
+from numba import cuda, njit, prange, float32, float64
+import src.ray_march_cuda as ray_march_cuda
+from src.ray_march_cuda import object_distances
+from src.ray_march_cpu import parallel_jit
+from src.jit_variants import JitVariant
+from src.camera import RayMarchCamera
+from src.example_worlds import worlds
+from src.ray_marchobject import Sphere, FuzzySphere, Box, RoundBox, FrameBox, Torus, Cylinder, Cone, PlaneY
+
+numba_floats = {np.dtype(np.float32): float32, np.dtype(np.float64): float64}
+
+#one object of every type, SDFs are evaluated at random points around them
+sample_objects = [
+    Sphere(np.array([0, 0, 0]), 1),
+    FuzzySphere(np.array([0, 0, 0]), 1, multipy_x=1, multipy_y=1, multipy_z=1),
+    Box(np.array([0, 0, 0]), np.array([1, 0.5, 0.5]), np.array([0, 1, 0]), 30),
+    RoundBox(np.array([0, 0, 0]), np.array([1, 0.5, 0.5]), 0.1),
+    FrameBox(np.array([0, 0, 0]), np.array([1, 1, 1]), 0.1, rotation_dir=np.array([1, 1, 0]), rotation_angle=45),
+    Torus(np.array([0, 0, 0]), np.array([1, 0.3])),
+    Cylinder(np.array([0, 0, 0]), 1, 1, rotation_dir=np.array([0, 1, 0]), rotation_angle=30),
+    Cone(np.array([0, 0, 0]), np.array([np.cos(np.pi / 6), np.sin(np.pi / 6)]), 1, rotation_dir=np.array([0, 1, 0])),
+    PlaneY(0),
+]
+
+@cuda.jit(device=True)
+def sdf(pos_x, pos_y, pos_z, obj):
+    #replaced by measured distance_from_*_obj in every variant
+    return 0.0
+
+def sdf_rows(points, obj, out):
+    for i in prange(points.shape[0]):
+        out[i] = sdf(points[i, 0], points[i, 1], points[i, 2], obj)
+
+@cuda.jit
+def sdf_kernel(points, obj, out):
+    i = cuda.grid(1)
+    if i < points.shape[0]:
+        out[i] = sdf(points[i, 0], points[i, 1], points[i, 2], obj)
+
+def measure(run, repeats: int) -> dict:
+    '''
+    Time of the first run (with compilation) and median of the next repeats
+    '''
+    start = time.perf_counter()
+    run()
+    first = time.perf_counter() - start
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+    median = float(np.median(times))
+    return {'first_s': first, 'compile_s': max(0.0, first - median), 'median_s': median, 'min_s': min(times)}
+
+def bench_sdfs(backend: str, dtype, points: int, repeats: int) -> dict:
+    results = {}
+    rng = np.random.default_rng(0)
+    positions = rng.uniform(-3, 3, (points, 3)).astype(dtype)
+    out = np.zeros(points, dtype=dtype)
+    for obj in sample_objects:
+        name = object_distances[obj.id]
+        row = obj.to_array().astype(dtype)
+        if backend == 'cpu':
+            kernel = JitVariant(njit, real=numba_floats[np.dtype(dtype)], sdf=getattr(ray_march_cuda, name)).compile(sdf_rows, parallel_jit)
+            run = lambda: kernel(positions, row, out)
+        else:
+            kernel = JitVariant(cuda.jit(device=True), real=numba_floats[np.dtype(dtype)], sdf=getattr(ray_march_cuda, name)).compile(sdf_kernel, cuda.jit)
+            d_positions, d_row, d_out = cuda.to_device(positions), cuda.to_device(row), cuda.to_device(out)
+            blocks = math.ceil(points / 128)
+            def run():
+                kernel[blocks, 128](d_positions, d_row, d_out)
+                cuda.synchronize()
+        result = measure(run, repeats)
+        result['points_per_s'] = points / result['median_s']
+        results[f"sdf/{name}"] = result
+    return results
+
+def replicate(objects: list, copies: int) -> list:
+    '''
+    Copies of the scene placed side by side along z axis
+    '''
+    scene = []
+    for i in range(copies):
+        offset = np.array([0, 0, 4.0 * (i - (copies - 1) / 2)])
+        for obj in objects:
+            obj = copy.deepcopy(obj)
+            if hasattr(obj, 'center'):
+                obj.center = obj.center + offset
+            scene.append(obj)
+    return scene
+
+def bench_frames(backend: str, dtype, resolutions: list, copies: list, repeats: int) -> dict:
+    results = {}
+    for name, world in worlds.items():
+        for width, height in resolutions:
+            for count in copies:
+                objects = replicate(world.objects, count)
+                camera = RayMarchCamera(pos=np.array([0, 0, 0], dtype=np.float64), target=np.array([10, 0, 0], dtype=np.float64),
+                                        screne_width=width, screne_height=height, backend=backend, precision=dtype)
+                result = measure(lambda: camera.get_window_content(width, height, objects), repeats)
+                result['objects'] = len(objects)
+                result['pixels_per_s'] = width * height / result['median_s']
+                results[f"frame/{name}/{width}x{height}/x{count}"] = result
+    return results
+
+def compare(baseline: dict, current: dict, threshold: float) -> int:
+    '''
+    Prints ratio of steady state times of results present in both runs, returns number of regressions
+    '''
+    regressions = 0
+    print(f"baseline: {baseline['meta']}\ncurrent:  {current['meta']}")
+    print(f"{'benchmark':<45} {'baseline, ms':>13} {'current, ms':>12} {'ratio':>7}")
+    for key in sorted(set(baseline['results']) & set(current['results'])):
+        old, new = baseline['results'][key]['median_s'], current['results'][key]['median_s']
+        ratio = new / old
+        flag = ''
+        if ratio > 1 + threshold:
+            flag = 'REGRESSION'
+            regressions += 1
+        elif ratio < 1 - threshold:
+            flag = 'faster'
+        print(f"{key:<45} {old * 1000:13.3f} {new * 1000:12.3f} {ratio:7.2f} {flag}")
+    missing = set(baseline['results']) ^ set(current['results'])
+    if missing:
+        print(f"{len(missing)} benchmarks are only in one of the runs")
+    print(f"{regressions} regressions over {threshold:.0%}")
+    return regressions
+
+def resolution(text: str) -> tuple:
+    width, height = text.lower().split('x')
+    return int(width), int(height)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--backend', choices=('cpu', 'cuda'), default='cpu')
+    parser.add_argument('--precision', choices=('float64', 'float32'), default='float64')
+    parser.add_argument('--points', type=int, default=None, help="points per SDF, 2^18 (256 on cuda simulator)")
+    parser.add_argument('--resolutions', type=resolution, nargs='+', default=None, help="like 160x120")
+    parser.add_argument('--copies', type=int, nargs='+', default=None, help="numbers of copies of every scene")
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--skip-sdf', action='store_true')
+    parser.add_argument('--skip-frames', action='store_true')
+    parser.add_argument('--output', default=None, help="JSON file with results")
+    parser.add_argument('--compare', nargs=2, metavar=('BASELINE', 'CURRENT'), help="compare two JSON result files")
+    parser.add_argument('--threshold', type=float, default=0.1, help="relative slowdown reported as regression")
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0]) as file:
+            baseline = json.load(file)
+        with open(args.compare[1]) as file:
+            current = json.load(file)
+        sys.exit(1 if compare(baseline, current, args.threshold) else 0)
+
+    simulator = args.backend == 'cuda' and numba.config.ENABLE_CUDASIM
+    points = args.points or (256 if simulator else 2**18)
+    resolutions = args.resolutions or ([(16, 12), (32, 24)] if simulator else [(80, 60), (160, 120), (320, 240)])
+    copies = args.copies or ([1, 2] if simulator else [1, 4, 16])
+    dtype = np.dtype(args.precision)
+
+    results = {}
+    if not args.skip_sdf:
+        results.update(bench_sdfs(args.backend, dtype, points, args.repeats))
+    if not args.skip_frames:
+        results.update(bench_frames(args.backend, dtype, resolutions, copies, args.repeats))
+    meta = {
+        'backend': args.backend, 'simulator': bool(simulator), 'precision': args.precision, 'points': points,
+        'repeats': args.repeats, 'cores': multiprocessing.cpu_count(), 'numba': numba.__version__,
+        'python': platform.python_version(), 'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+    }
+
+    print(f"{'benchmark':<45} {'compile, s':>11} {'median, ms':>11}")
+    for key, result in results.items():
+        print(f"{key:<45} {result['compile_s']:11.2f} {result['median_s'] * 1000:11.3f}")
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump({'meta': meta, 'results': results}, file, indent=2)
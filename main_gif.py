@@ -1,6 +1,6 @@
-from src.plt_renderer import PyPlotRenderer
+from src.gif_renderer import GifRenderer
 from src.example_worlds import *
 
 if __name__=="__main__":
-    renderer = PyPlotRenderer(800, 600, world=world_3)
+    renderer = GifRenderer(800, 600, world=world_3)
     renderer.render_gif(200)
\ No newline at end of file
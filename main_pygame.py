@@ -2,5 +2,6 @@ from src.pygame_renderer import PyGameWindowRenderer
 from src.example_worlds import *
 
 if __name__=="__main__":
-    renderer = PyGameWindowRenderer(1000, 800, world=world_2)
+    #resolution drops when frames do not fit into 1/30 sec
+    renderer = PyGameWindowRenderer(1000, 800, world=world_2, frame_budget=1 / 30)
     renderer.mainloop()
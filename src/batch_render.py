@@ -0,0 +1,123 @@
+'''
+Headless rendering of animation frames to files.
+Frame i shows the world at time i / fps, so frames do not depend on speed of rendering and can be rendered
+in any order by parallel worker processes. Every frame is written to temporary file and renamed when it is complete,
+so interrupted job is resumed by rendering only frames which are not on disk.
+'''
+import argparse
+import multiprocessing
+import os
+import time
+import numba
+import numpy as np
+from src.camera import RayMarchCamera, backends
+from src.example_worlds import worlds
+from src.frame_encoder import frame_to_rows, frame_to_image
+
+output_formats = ('png', 'npy')
+
+#camera and world of the worker process, they are set by _init_worker
+_worker = {}
+
+def frame_path(output: str, frame: int, format: str) -> str:
+    return os.path.join(output, f"frame_{frame:05d}.{format}")
+
+def missing_frames(output: str, frames: range, format: str) -> list:
+    '''
+    Frames of range which are not on disk yet
+    '''
+    return [frame for frame in frames if not os.path.exists(frame_path(output, frame, format))]
+
+def write_frame(path: str, frame: np.ndarray, format: str) -> None:
+    '''
+    Writes frame [pixel_width, pixel_height, 3] as png image or npy array of its rows [pixel_height, pixel_width, 3]
+    '''
+    temporary = f"{path}.tmp"
+    with open(temporary, 'wb') as file:
+        if format == 'png':
+            frame_to_image(frame).save(file, format='png')
+        else:
+            np.save(file, frame_to_rows(frame))
+    os.replace(temporary, path)
+
+def _init_worker(world_name: str, pixel_width: int, pixel_height: int, backend: str, threads: int = None) -> None:
+    #cores are shared by worker processes, so numba threads of each one are limited
+    if threads is not None:
+        numba.set_num_threads(threads)
+    _worker['world'] = worlds[world_name]
+    _worker['camera'] = RayMarchCamera(pos=np.array([0, 0, 0], dtype=np.float64), target=np.array([10, 0, 0], dtype=np.float64),
+                                       screne_width=pixel_width, screne_height=pixel_height, backend=backend)
+    _worker['size'] = (pixel_width, pixel_height)
+
+def _render_frame(task: tuple) -> tuple:
+    '''
+    Renders frame at its time and writes it, returns the frame and time it took
+    '''
+    frame, fps, output, format = task
+    start = time.perf_counter()
+    world = _worker['world']
+    world.animate(frame / fps)
+    image = _worker['camera'].get_window_content(*_worker['size'], world.objects)
+    write_frame(frame_path(output, frame, format), image, format)
+    return frame, time.perf_counter() - start
+
+def render_frames(world_name: str, pixel_width: int, pixel_height: int, frames: range, fps: float, output: str,
+                  format: str = 'png', workers: int = 1, backend: str = None, log = print) -> list:
+    '''
+    Renders frames of the world which are not in output directory yet, returns list of rendered frames
+    workers > 1 renders frames in parallel processes, otherwise they are rendered by this process
+    '''
+    if world_name not in worlds:
+        raise ValueError(f"Unknown world {world_name}, expected one of {tuple(worlds)}")
+    if format not in output_formats:
+        raise ValueError(f"Unknown format {format}, expected one of {output_formats}")
+    if backend is not None and backend not in backends:
+        raise ValueError(f"Unknown backend {backend}, expected one of {backends}")
+    if fps <= 0:
+        raise ValueError(f"fps must be positive, got {fps}")
+    if workers < 1:
+        raise ValueError(f"workers must be positive, got {workers}")
+    os.makedirs(output, exist_ok=True)
+    todo = missing_frames(output, frames, format)
+    log(f"{len(frames) - len(todo)} of {len(frames)} frames are already rendered")
+    tasks = [(frame, fps, output, format) for frame in todo]
+    initargs = (world_name, pixel_width, pixel_height, backend)
+
+    rendered = []
+    pool = None
+    if workers > 1 and len(tasks) > 1:
+        #spawned workers start with fresh copies of the worlds
+        threads = max(1, multiprocessing.cpu_count() // workers)
+        pool = multiprocessing.get_context('spawn').Pool(workers, initializer=_init_worker, initargs=initargs + (threads,))
+        results = pool.imap_unordered(_render_frame, tasks)
+    else:
+        _init_worker(*initargs)
+        results = map(_render_frame, tasks)
+    try:
+        for frame, elapsed in results:
+            rendered.append(frame)
+            log(f"frame {frame} ({len(rendered)}/{len(tasks)}) {elapsed:.2f} sec")
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+    return rendered
+
+def main(argv: list = None) -> None:
+    parser = argparse.ArgumentParser(description="Renders frames of animated world to png or npy files, "
+                                                 "frames already in output directory are skipped, so interrupted job can be resumed")
+    parser.add_argument('world', choices=tuple(worlds))
+    parser.add_argument('--width', type=int, default=800)
+    parser.add_argument('--height', type=int, default=600)
+    parser.add_argument('--start', type=int, default=0, help="first frame")
+    parser.add_argument('--end', type=int, default=200, help="frame after the last one")
+    parser.add_argument('--fps', type=float, default=5, help="frame i shows the world at time i / fps")
+    parser.add_argument('--output', default='./frames')
+    parser.add_argument('--format', choices=output_formats, default='png')
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--backend', choices=backends, default=None)
+    args = parser.parse_args(argv)
+    start = time.time()
+    rendered = render_frames(args.world, args.width, args.height, range(args.start, args.end), args.fps, args.output,
+                             args.format, args.workers, args.backend)
+    print(f"Rendered {len(rendered)} frames in {time.time() - start:.2f} sec")
@@ -0,0 +1,82 @@
+'''
+Bounding volume hierarchy over the objects of the scene.
+Tree is built on host and flattened in depth-first order into float array with rows
+[min_x, min_y, min_z, max_x, max_y, max_z, first, count, skip]
+where leaf (count > 0) holds objects first..first + count of reordered object buffer
+and skip is index of the next node after the subtree, so kernel traverses tree without stack.
+'''
+import numpy as np
+from typing import List, Tuple
+from src.ray_marchobject import RayMarchObject, with_payloads, max_figure_params
+
+bvh_node_size = 9
+max_leaf_size = 4
+
+def empty_bvh(dtype = np.float64) -> np.ndarray:
+    '''
+    BVH without nodes, kernel evaluates all objects of object buffer then
+    '''
+    return np.zeros((0, bvh_node_size), dtype=dtype)
+
+def build_bvh(objects: List[RayMarchObject], dtype = np.float64) -> Tuple[np.ndarray, np.ndarray]:
+    '''
+    Builds BVH over objects
+    returns object buffer reordered so every leaf holds continuous range of objects and flattened BVH
+    unbounded objects (see RayMarchObject.get_bounds) are stored in the first leaf with infinite bounds
+    '''
+    bounded, unbounded = [], []
+    for obj in objects:
+        bounds = obj.get_bounds()
+        if bounds is None:
+            unbounded.append(obj)
+        else:
+            bounded.append((obj, bounds))
+
+    ordered = list(unbounded)
+    nodes = []
+    if unbounded:
+        nodes.append([-np.inf] * 3 + [np.inf] * 3 + [0, len(unbounded), 1])
+
+    if bounded:
+        mins = np.array([bounds[0] for _, bounds in bounded], dtype=np.float64).reshape(-1, 3)
+        maxs = np.array([bounds[1] for _, bounds in bounded], dtype=np.float64).reshape(-1, 3)
+        order = []
+        _build_node(np.arange(len(bounded)), mins, maxs, order, nodes, len(ordered))
+        ordered += [bounded[i][0] for i in order]
+
+    rows = np.array([obj.to_array() for obj in ordered], dtype=dtype).reshape(-1, 4 + max_figure_params)
+    object_buffer = with_payloads(ordered, rows)
+    bvh = np.array(nodes, dtype=dtype).reshape(-1, bvh_node_size)
+    if object_buffer is not rows:
+        #leaves hold ranges of rows, objects with payload take more of them
+        starts = np.cumsum([0] + [1 + (len(obj.to_payload()) if obj.has_payload else 0) for obj in ordered])
+        leaves = bvh[:, 7] > 0
+        first = bvh[leaves, 6].astype(np.int64)
+        last = first + bvh[leaves, 7].astype(np.int64)
+        bvh[leaves, 6] = starts[first]
+        bvh[leaves, 7] = starts[last] - starts[first]
+    return object_buffer, bvh
+
+def _build_node(indices: np.ndarray, mins: np.ndarray, maxs: np.ndarray, order: list, nodes: list, first: int) -> None:
+    '''
+    Appends node over objects with given indices and all its children, objects are split by median
+    of centers along the longest axis
+    '''
+    node_min = mins[indices].min(axis=0)
+    node_max = maxs[indices].max(axis=0)
+    node = list(node_min) + list(node_max) + [0, 0, 0]
+    nodes.append(node)
+
+    if len(indices) <= max_leaf_size:
+        node[6] = first + len(order)
+        node[7] = len(indices)
+        order.extend(indices)
+    else:
+        centers = (mins[indices] + maxs[indices]) / 2
+        axis = np.argmax(centers.max(axis=0) - centers.min(axis=0))
+        indices = indices[np.argsort(centers[:, axis], kind='stable')]
+        half = len(indices) // 2
+        _build_node(indices[:half], mins, maxs, order, nodes, first)
+        _build_node(indices[half:], mins, maxs, order, nodes, first)
+
+    node[8] = len(nodes)
@@ -1,82 +1,207 @@
+import collections
 import numpy as np
-from src.ray_march_cuda import ray_march_kernel
+from typing import Union
+from src.ray_march_cuda import ray_march_kernel, ray_march_frames_kernel, cone_march_kernel, progressive_kernel, reproject_kernel, dirty_tiles_kernel, normal_modes, stepping_modes, pack_march_params
+import src.ray_march_cuda as ray_march_cuda
+from src.ray_march_cpu import get_variant, ray_march_rows, ray_march_frames_rows, cone_march_rows, progressive_rows, reproject_rows, dirty_tiles_rows
+from src.bvh import build_bvh, empty_bvh
+from src.scene_kernels import group_by_type, scene_signature, get_specialised_kernel
+from src.reprojection import change_margin, changed_boxes
+from src.scene import Scene
+from src.static_field import StaticField
+from src.ray_marchobject import with_payloads, max_figure_params
+from src.profiling import no_profiler, profiled_frame
 from numba import cuda
 
-#Cuda kernel for get_all_rays
-@cuda.jit
-def get_all_rays_kernel(all_rays, pixel_width, pixel_height, projection_matrix, lookAtMatrix):
+backends = ('cuda', 'cpu')
+precisions = (np.dtype(np.float64), np.dtype(np.float32))
+#default limit of memory used by one batch of frames in get_frames_content
+max_batch_bytes = 256 * 2**20
+#grids of passes of get_window_content_progressive, every pass renders pixels of finer grid
+progressive_steps = (8, 4, 2, 1)
+#number of resolutions whose buffers are kept by camera, for example levels of dynamic resolution
+max_frame_contexts = 8
+
+class FrameContext:
     '''
-    Cuda kernel which calculates rays from camera to every pixel and saves them to all_rays
+    Buffers which are reused between frames of the same resolution.
+    On cuda output, objects and camera matrices stay in device memory, output is copied back to pinned host buffer
+    and objects are uploaded again only when the scene changed.
     '''
-    x, y = cuda.grid(2)
-    if x < all_rays.shape[0] and y < all_rays.shape[1]:
-        ndc_x = (2.0 * x) / pixel_width - 1.0
-        ndc_y = 1.0 - (2.0 * y) / pixel_height
-        ndc_z = 1
-
-        #I hate my life
-        #direction = projection_matrix.dot(direction)
-        dir_x = projection_matrix[0,0] * ndc_x + projection_matrix[0,1] * ndc_y + projection_matrix[0,2] * ndc_z + projection_matrix[0,3] * 1
-        dir_y = projection_matrix[1,0] * ndc_x + projection_matrix[1,1] * ndc_y + projection_matrix[1,2] * ndc_z + projection_matrix[1,3] * 1
-        dir_z = projection_matrix[2,0] * ndc_x + projection_matrix[2,1] * ndc_y + projection_matrix[2,2] * ndc_z + projection_matrix[2,3] * 1
-        dir_w = projection_matrix[3,0] * ndc_x + projection_matrix[3,1] * ndc_y + projection_matrix[3,2] * ndc_z + projection_matrix[3,3] * 1
-
-        dir_x = dir_x / dir_w
-        dir_y = dir_y / dir_w
-        dir_z = dir_z / dir_w
-        dir_w = dir_w / dir_w
-
-        dir_z = 1
-        dir_w = 0.0
-
-
-        #direction = lookAtMatrix.dot(direction)
-        w_x = lookAtMatrix[0,0] * dir_x + lookAtMatrix[0,1] * dir_y + lookAtMatrix[0,2] * dir_z + lookAtMatrix[0,3] * dir_w
-        w_y = lookAtMatrix[1,0] * dir_x + lookAtMatrix[1,1] * dir_y + lookAtMatrix[1,2] * dir_z + lookAtMatrix[1,3] * dir_w
-        w_z = lookAtMatrix[2,0] * dir_x + lookAtMatrix[2,1] * dir_y + lookAtMatrix[2,2] * dir_z + lookAtMatrix[2,3] * dir_w
-        w_w = lookAtMatrix[3,0] * dir_x + lookAtMatrix[3,1] * dir_y + lookAtMatrix[3,2] * dir_z + lookAtMatrix[3,3] * dir_w
-
-
-        cam_pos_x = lookAtMatrix[0,3]
-        cam_pos_y = lookAtMatrix[1,3]
-        cam_pos_z = lookAtMatrix[2,3]
-
-        dir_x = w_x - cam_pos_x
-        dir_y = w_y - cam_pos_y
-        dir_z = w_z - cam_pos_z
-
-        #np.linalg.norm(direction[:3])
-        dir_norm = 0.0
-        dir_norm += dir_x ** 2
-        dir_norm += dir_y ** 2
-        dir_norm += dir_z ** 2
-        dir_norm = dir_norm ** 0.5
-
-        #direction[:3] / dir_norm
-        if dir_norm == 0:
-            dir_norm = 1
-        dir_x = dir_x / dir_norm
-        dir_y = dir_y / dir_norm
-        dir_z = dir_z / dir_norm
-
-        all_rays[x, y, 0] = dir_x
-        all_rays[x, y, 1] = dir_y
-        all_rays[x, y, 2] = dir_z
+    def __init__(self, pixel_width: int, pixel_height: int, backend: str, dtype = np.float64):
+        self.pixel_width = pixel_width
+        self.pixel_height = pixel_height
+        self.backend = backend
+        self.dtype = np.dtype(dtype)
+        self.objects_buffer = None
+        self.objects_version = None
+        self.bvh = None
+        self.camera_matrices = None
+        self.march_params = None
+        #objects of previous frame in order of the world and their bounds for temporal reprojection and dirty tiles
+        self.previous_rows = None
+        self.previous_bounds = None
+        self.normal_mode = None
+        self.recorded_march_stats = False
+        #kernels skip recording of march stats and start all rays from camera when they get empty arrays
+        self.no_march_stats = np.zeros((0, 0, 2), dtype=np.int32)
+        self.no_start_depths = np.zeros((0, 0), dtype=self.dtype)
+        self.no_dirty_pixels = np.zeros((0, 0), dtype=np.uint8)
+        self.dirty_pixels = np.zeros((pixel_width, pixel_height), dtype=np.uint8)
+
+        if backend == 'cpu':
+            self.output = np.zeros((pixel_width, pixel_height, 3), dtype=self.dtype)
+            self.march_stats = np.zeros((pixel_width, pixel_height, 2), dtype=np.int32)
+            self.start_depths = np.zeros((pixel_width, pixel_height), dtype=self.dtype)
+            self.hit_depths = np.zeros((pixel_width, pixel_height), dtype=self.dtype)
+            return
+
+        self.threadsperblock = (16, 16)
+        blockspergrid_x = int(np.ceil(pixel_width / self.threadsperblock[0]))
+        blockspergrid_y = int(np.ceil(pixel_height / self.threadsperblock[1]))
+        self.blockspergrid = (blockspergrid_x, blockspergrid_y)
+        self.stream = cuda.stream()
+        self.output = cuda.pinned_array((pixel_width, pixel_height, 3), dtype=self.dtype)
+        self.d_output = cuda.device_array((pixel_width, pixel_height, 3), dtype=self.dtype, stream=self.stream)
+        self.d_objects_buffer = None
+        self.d_bvh = None
+        self.d_camera_matrices = cuda.device_array((2, 4, 4), dtype=self.dtype, stream=self.stream)
+        self.d_march_params = None
+        self.march_stats = cuda.pinned_array((pixel_width, pixel_height, 2), dtype=np.int32)
+        self.d_march_stats = cuda.device_array((pixel_width, pixel_height, 2), dtype=np.int32, stream=self.stream)
+        self.d_no_march_stats = cuda.to_device(self.no_march_stats, self.stream)
+        self.d_start_depths = cuda.device_array((pixel_width, pixel_height), dtype=self.dtype, stream=self.stream)
+        self.d_no_start_depths = cuda.to_device(self.no_start_depths, self.stream)
+        self.d_hit_depths = cuda.device_array((pixel_width, pixel_height), dtype=self.dtype, stream=self.stream)
+        self.d_dirty_pixels = cuda.device_array((pixel_width, pixel_height), dtype=np.uint8, stream=self.stream)
+        self.d_no_dirty_pixels = cuda.to_device(self.no_dirty_pixels, self.stream)
+
+    def upload(self, device_array, host_array: np.ndarray):
+        '''
+        Copies host_array to device, device_array is reused if it has the same shape
+        '''
+        if device_array is None or device_array.shape != host_array.shape:
+            return cuda.to_device(host_array, self.stream)
+        device_array.copy_to_device(host_array, stream=self.stream)
+        return device_array
+
+    def set_objects(self, objects_buffer: np.ndarray, bvh: np.ndarray, version = None) -> bool:
+        '''
+        Stores packed objects and their BVH, on cuda uploads them only if they differ from previous frame
+        objects which come with version (of Scene) are compared only by the version
+        returns True if objects were changed
+        '''
+        if version is not None:
+            if self.objects_buffer is not None and version == self.objects_version and np.array_equal(self.bvh, bvh):
+                return False
+        elif (self.objects_buffer is not None and self.objects_version is None and np.array_equal(self.objects_buffer, objects_buffer)
+                and np.array_equal(self.bvh, bvh)):
+            return False
+        self.objects_version = version
+
+        if self.backend == 'cuda':
+            self.d_objects_buffer = self.upload(self.d_objects_buffer, objects_buffer)
+            self.d_bvh = self.upload(self.d_bvh, bvh)
+        self.objects_buffer = objects_buffer
+        self.bvh = bvh
+        return True
+
+    def set_camera(self, camera_matrices: np.ndarray) -> bool:
+        '''
+        Stores inverted projection and lookAt matrices, on cuda uploads them only if camera moved
+        returns True if camera was changed
+        '''
+        if self.camera_matrices is not None and np.array_equal(self.camera_matrices, camera_matrices):
+            return False
+
+        if self.backend == 'cuda':
+            self.d_camera_matrices = self.upload(self.d_camera_matrices, camera_matrices)
+        self.camera_matrices = camera_matrices
+        return True
+
+    def set_march_params(self, march_params: np.ndarray) -> bool:
+        '''
+        Stores march parameters packed by pack_march_params, on cuda uploads them only if they changed
+        returns True if parameters were changed
+        '''
+        if self.march_params is not None and np.array_equal(self.march_params, march_params):
+            return False
+
+        if self.backend == 'cuda':
+            self.d_march_params = self.upload(self.d_march_params, march_params)
+        self.march_params = march_params
+        return True
 
 class RayMarchCamera:
-    def __init__(self, pos = np.array([0,0,0]), target = np.array([1,0,0]), fov = 90, screne_width = 1, screne_height = 1):
-        self.pos = pos
-        dir = target - pos
-        self.dir = dir
-        self.dir = self.dir / np.linalg.norm(self.dir)
+    def __init__(self, pos = np.array([0,0,0]), target = np.array([1,0,0]), fov = 90, screne_width = 1, screne_height = 1, backend = None, precision = np.float64, normal_mode = 'central', use_bvh = False, specialise = False, depth_prepass_tile = 0, temporal_reprojection = False, dirty_tile_size = 0, profiler = None, static_field: StaticField = None):
+        '''
+        backend is 'cuda' or 'cpu', if it is None cuda is used when it is available
+        precision is float type of the whole render pipeline, np.float64 or np.float32
+        normal_mode is one of normal_modes, it can be changed between frames
+        use_bvh enables bounding volume hierarchy over objects, it pays off for scenes with many objects
+        specialise compiles kernel for every new composition of the scene (see scene_kernels.py), it can not be used with BVH
+        depth_prepass_tile is size of tiles for which cone is marched before the frame to find safe start depth of their rays,
+        0 disables the prepass
+        temporal_reprojection starts rays where they stopped in previous frame unless they go through objects which changed,
+        it pays off for animated scenes with static camera (see reprojection.py)
+        dirty_tile_size is size of tiles which are rendered again only if objects in front of them changed since previous frame,
+        0 renders whole frame every time, self.dirty_tile_stats holds number of tiles and skipped tiles of the last frame
+        profiler (see profiling.py) records time of every stage of rendering, cuda stages are timed with cuda events
+        static_field (see static_field.py) bakes objects marked static into brick map, so they are not evaluated at every step,
+        it can not be used with BVH or specialised kernels
+        '''
+        if backend is None:
+            backend = 'cuda' if cuda.is_available() else 'cpu'
+        if backend not in backends:
+            raise ValueError(f"Unknown backend {backend}, expected one of {backends}")
+        if np.dtype(precision) not in precisions:
+            raise ValueError(f"Unsupported precision {precision}, expected one of {precisions}")
+        if normal_mode not in normal_modes:
+            raise ValueError(f"Unknown normal mode {normal_mode}, expected one of {normal_modes}")
+        if use_bvh and specialise:
+            raise ValueError("Specialised kernels can not be used with BVH")
+        if static_field is not None and (use_bvh or specialise):
+            raise ValueError("Static field can not be used with BVH or specialised kernels")
+        if depth_prepass_tile < 0:
+            raise ValueError(f"depth_prepass_tile must not be negative, got {depth_prepass_tile}")
+        if dirty_tile_size < 0:
+            raise ValueError(f"dirty_tile_size must not be negative, got {dirty_tile_size}")
+        self.profiler = profiler or no_profiler
+        self.backend = backend
+        self.dtype = np.dtype(precision)
+        self.normal_mode = normal_mode
+        self.use_bvh = use_bvh
+        self.specialise = specialise
+        self.depth_prepass_tile = depth_prepass_tile
+        self.temporal_reprojection = temporal_reprojection
+        self.dirty_tile_size = dirty_tile_size
+        self.dirty_tile_stats = None
+        self.static_field = static_field
         self.fov = fov
         self.aspect_ratio =  screne_height / screne_width
         self.near = 1.0
         self.far = 1000.0
 
         self.projection_matrix = self.get_projection()
-        self.count_axis_param()
-        self.lookAtMatrix = self.count_lookAtMatrix()
+        self.frame_context = None
+        self.frame_contexts = collections.OrderedDict()
+        self.march_stats = None
+        self.look_at(pos, target)
+
+    def look_at(self, pos: np.ndarray, target: np.ndarray):
+        '''
+        Moves camera to pos and turns it to target
+        it only recalculates matrices, rays are generated inside the render kernel
+        '''
+        with self.profiler.stage('look_at'):
+            self.pos = np.asarray(pos, dtype=np.float64)
+            dir = np.asarray(target, dtype=np.float64) - self.pos
+            self.dir = dir
+            self.dir = self.dir / np.linalg.norm(self.dir)
+
+            self.count_axis_param()
+            self.lookAtMatrix = self.count_lookAtMatrix()
+            self.camera_matrices = np.array([np.linalg.inv(self.projection_matrix), np.linalg.inv(self.lookAtMatrix)], dtype=self.dtype)
 
     def count_axis_param(self):
         self.right = np.cross(self.dir, np.array([0,1,0], dtype=np.float64))
@@ -114,47 +239,381 @@ class RayMarchCamera:
             [0, 0, b, 0]
         ], dtype=np.float64)
     
-    def get_window_content(self, pixel_width: int, pixel_height: int, world: list) -> np.array:
+    def get_pixel_footprint(self, pixel_width: int, pixel_height: int) -> float:
+        '''
+        Half of the size of the pixel at distance 1 from camera
+        '''
+        f = 1 / np.tan(np.radians(self.fov/2))
+        return max(1 / (pixel_width * f * self.aspect_ratio), 1 / (pixel_height * f))
+
+    def get_frame_context(self, pixel_width: int, pixel_height: int) -> FrameContext:
+        '''
+        Returns buffers for frames of given resolution, buffers of the last max_frame_contexts resolutions are kept,
+        so switching between them allocates nothing, every resolution keeps its own previous frame for reprojection
+        '''
+        key = (pixel_width, pixel_height)
+        context = self.frame_contexts.pop(key, None)
+        if context is None:
+            context = FrameContext(pixel_width, pixel_height, self.backend, self.dtype)
+            while len(self.frame_contexts) >= max_frame_contexts:
+                self.frame_contexts.popitem(last=False)
+        self.frame_contexts[key] = context
+        self.frame_context = context
+        return context
+
+    def get_kernel(self, objects_buffer: np.ndarray):
+        '''
+        Returns render kernel for current backend and precision
+        (or ray_march_rows for cpu), it is specialised to the scene if specialise is set
+        '''
+        if self.specialise:
+            return get_specialised_kernel(scene_signature(objects_buffer), self.backend, self.dtype)
+        if self.backend == 'cpu':
+            return get_variant(ray_march_rows, self.dtype)
+        return get_variant(ray_march_kernel, self.dtype)
+
+    @profiled_frame('get_window_content')
+    def get_window_content(self, pixel_width: int, pixel_height: int, world: Union[list, Scene], number_of_steps: int = ray_march_cuda.number_of_steps,
+                           min_hit_distance: float = ray_march_cuda.min_hit_distance, max_trace_distance: float = ray_march_cuda.max_trace_distance,
+                           background_color: np.ndarray = ray_march_cuda.background_color, record_march_stats: bool = False,
+                           stepping: str = 'sphere', relaxation: float = ray_march_cuda.over_relaxation, out: np.ndarray = None) -> np.array:
         '''
         Method which returns all pixel values
         use ray_march_kernel to calculate pixel values
         return matrix [pixel_width, pixel_height, 3]
+        world is list of objects or Scene, which keeps them packed between frames
+        march parameters are passed to the kernel, so changing them does not need recompilation
+        if record_march_stats is set, number of steps and termination reason of every pixel are stored in self.march_stats
+        stepping is one of stepping_modes, 'enhanced' uses over-relaxed steps (relaxation between 1 and 2)
+        and hit epsilon which grows with pixel footprint
+        if out is given (uint8 array [pixel_width, pixel_height, 3] with any strides) pixel values are written into it
+        instead of new array
         '''
-        output = np.zeros((pixel_width, pixel_height, 3), dtype=np.float64)
+        check_march_params(number_of_steps, stepping, relaxation)
+        context = self.get_frame_context(pixel_width, pixel_height)
+        profiler = self.profiler
+        #stages queued on cuda stream are timed with cuda events
+        stream = context.stream if self.backend == 'cuda' else None
+        rows, camera_changed, params_changed = self.upload_world(context, world, number_of_steps, min_hit_distance, max_trace_distance,
+                                                                 background_color, stepping, relaxation)
+        origin_x, origin_y, origin_z = self.pos.astype(self.dtype)
+        normal_mode = normal_modes.index(self.normal_mode)
+        with profiler.stage('get_kernel'):
+            kernel = self.get_kernel(context.objects_buffer)
 
-        #we can not pass list of objects to cuda kernel so we need to convert it to np.array
-        objects_buffer = np.array([obj.to_array() for obj in world], dtype=np.float64)
+        tile = self.depth_prepass_tile
+        dirty_tile = self.dirty_tile_size
+        boxes = None
+        if self.temporal_reprojection or dirty_tile:
+            with profiler.stage('changed_boxes'):
+                bounds = list(world.bounds) if isinstance(world, Scene) else [obj.get_bounds() for obj in world]
+                if not camera_changed and not params_changed and context.previous_rows is not None and context.normal_mode == normal_mode:
+                    boxes = changed_boxes(context.previous_rows, context.previous_bounds, rows, bounds, change_margin(context.march_params))
+                #rows of Scene are changed in place
+                context.previous_rows, context.previous_bounds = rows.copy(), bounds
+                context.normal_mode = normal_mode
+        #previous output (and march stats if they are recorded) is reused only where nothing changed
+        skip_tiles = dirty_tile and boxes is not None and (context.recorded_march_stats or not record_march_stats)
+        context.recorded_march_stats = record_march_stats
 
-        threadsperblock = (16, 16)
-        blockspergrid_x = int(np.ceil(pixel_width / threadsperblock[0]))
-        blockspergrid_y = int(np.ceil(pixel_height / threadsperblock[1]))
-        blockspergrid = (blockspergrid_x, blockspergrid_y)
-        stream = cuda.stream()
-        d_all_rays = cuda.to_device(self.all_rays, stream)
-        d_output = cuda.to_device(output, stream)
-        d_objects_buffer = cuda.to_device(objects_buffer, stream)
-        ray_march_kernel[blockspergrid, threadsperblock](d_output, 0, 0, 0, d_all_rays, d_objects_buffer)
-        output = d_output.copy_to_host(stream=stream)
-        return (output * 255).astype(np.uint8)
+        if self.backend == 'cpu':
+            march_stats = context.march_stats if record_march_stats else context.no_march_stats
+            start_depths = context.no_start_depths
+            hit_depths = context.hit_depths if self.temporal_reprojection else context.no_start_depths
+            if tile:
+                with profiler.stage('prepass'):
+                    get_variant(cone_march_rows, self.dtype)(context.start_depths, tile, origin_x, origin_y, origin_z, context.camera_matrices,
+                                                   context.objects_buffer, context.bvh, context.march_params)
+                start_depths = context.start_depths
+            if boxes is not None and self.temporal_reprojection:
+                with profiler.stage('reproject'):
+                    get_variant(reproject_rows, self.dtype)(context.start_depths, context.hit_depths, boxes, origin_x, origin_y, origin_z,
+                                                  context.camera_matrices, bool(tile))
+                start_depths = context.start_depths
+            dirty_pixels = context.no_dirty_pixels
+            if skip_tiles:
+                with profiler.stage('dirty_tiles'):
+                    get_variant(dirty_tiles_rows, self.dtype)(context.dirty_pixels, dirty_tile, boxes, origin_x, origin_y, origin_z, context.camera_matrices)
+                dirty_pixels = context.dirty_pixels
+            with profiler.stage('kernel'):
+                kernel(context.output, march_stats, start_depths, hit_depths, dirty_pixels, origin_x, origin_y, origin_z, context.camera_matrices,
+                       context.objects_buffer, context.bvh, normal_mode, context.march_params)
+            self.march_stats = context.march_stats.copy() if record_march_stats else None
+            self.update_dirty_tile_stats(context, skip_tiles)
+            with profiler.stage('to_uint8'):
+                return to_uint8(context.output, out)
+
+        d_march_stats = context.d_march_stats if record_march_stats else context.d_no_march_stats
+        d_start_depths = context.d_no_start_depths
+        d_hit_depths = context.d_hit_depths if self.temporal_reprojection else context.d_no_start_depths
+        if tile:
+            tiles_per_block = (8, 8)
+            blocks = (int(np.ceil(pixel_width / tile / tiles_per_block[0])), int(np.ceil(pixel_height / tile / tiles_per_block[1])))
+            with profiler.stage('prepass', stream):
+                get_variant(cone_march_kernel, self.dtype)[blocks, tiles_per_block, context.stream](context.d_start_depths, tile, origin_x, origin_y, origin_z, context.d_camera_matrices, context.d_objects_buffer, context.d_bvh, context.d_march_params)
+            d_start_depths = context.d_start_depths
+        if boxes is not None:
+            with profiler.stage('upload', stream):
+                d_boxes = cuda.to_device(boxes, context.stream)
+        if boxes is not None and self.temporal_reprojection:
+            with profiler.stage('reproject', stream):
+                get_variant(reproject_kernel, self.dtype)[context.blockspergrid, context.threadsperblock, context.stream](context.d_start_depths, context.d_hit_depths, d_boxes, origin_x, origin_y, origin_z, context.d_camera_matrices, bool(tile))
+            d_start_depths = context.d_start_depths
+        d_dirty_pixels = context.d_no_dirty_pixels
+        if skip_tiles:
+            tiles_per_block = (8, 8)
+            blocks = (int(np.ceil(pixel_width / dirty_tile / tiles_per_block[0])), int(np.ceil(pixel_height / dirty_tile / tiles_per_block[1])))
+            with profiler.stage('dirty_tiles', stream):
+                get_variant(dirty_tiles_kernel, self.dtype)[blocks, tiles_per_block, context.stream](context.d_dirty_pixels, dirty_tile, d_boxes, origin_x, origin_y, origin_z, context.d_camera_matrices)
+            d_dirty_pixels = context.d_dirty_pixels
+        with profiler.stage('kernel', stream):
+            kernel[context.blockspergrid, context.threadsperblock, context.stream](context.d_output, d_march_stats, d_start_depths, d_hit_depths, d_dirty_pixels, origin_x, origin_y, origin_z, context.d_camera_matrices, context.d_objects_buffer, context.d_bvh, normal_mode, context.d_march_params)
+        with profiler.stage('download', stream):
+            context.d_output.copy_to_host(context.output, stream=context.stream)
+            if record_march_stats:
+                context.d_march_stats.copy_to_host(context.march_stats, stream=context.stream)
+            if skip_tiles:
+                context.d_dirty_pixels.copy_to_host(context.dirty_pixels, stream=context.stream)
+        context.stream.synchronize()
+        self.march_stats = context.march_stats.copy() if record_march_stats else None
+        self.update_dirty_tile_stats(context, skip_tiles)
+        with profiler.stage('to_uint8'):
+            return to_uint8(context.output, out)
 
-    def set_all_rays(self, pixel_width: int, pixel_height: int):
+    def upload_world(self, context: FrameContext, world: Union[list, Scene], number_of_steps: int, min_hit_distance: float,
+                     max_trace_distance: float, background_color: np.ndarray, stepping: str, relaxation: float) -> tuple:
+        '''
+        Packs objects of world (with BVH or grouped by type if camera uses it) and march parameters into context,
+        on cuda they are uploaded only if they changed
+        returns rows of objects in order of the world and whether camera and march parameters changed since previous frame
+        '''
+        profiler = self.profiler
+        with profiler.stage('pack'):
+            #we can not pass list of objects to cuda kernel so we need to convert it to np.array
+            if isinstance(world, Scene):
+                rows = world.pack().astype(self.dtype, copy=False)
+                objects = world.objects
+                version = (id(world), world.version)
+            else:
+                rows = np.array([obj.to_array() for obj in world], dtype=self.dtype)
+                objects = world
+                version = None
+            if self.use_bvh:
+                objects_buffer, bvh = build_bvh(objects, self.dtype)
+            else:
+                objects_buffer = with_payloads(objects, rows)
+                bvh = empty_bvh(self.dtype)
+            if self.specialise:
+                if objects_buffer is not rows:
+                    raise ValueError("Specialised kernels can not be used with Instances")
+                objects_buffer = group_by_type(objects_buffer)
+            if stepping == 'enhanced':
+                pixel_footprint = ray_march_cuda.hit_pixel_fraction * self.get_pixel_footprint(context.pixel_width, context.pixel_height)
+                stepping_params = dict(relaxation=relaxation, pixel_footprint=pixel_footprint)
+            else:
+                stepping_params = {}
+            march_params = pack_march_params(number_of_steps, min_hit_distance, max_trace_distance, background_color,
+                                             dtype=self.dtype, **stepping_params)
+            check_instance_margins(objects_buffer, march_params)
+            if self.static_field is not None:
+                hit_distance = max_hit_distance(march_params)
+                static = [obj.static for obj in objects]
+                dynamic_rows = with_payloads([obj for obj in objects if not obj.static], rows[np.logical_not(static)])
+                static_rows = with_payloads([obj for obj in objects if obj.static], rows[np.array(static, dtype=bool)])
+                objects_buffer = self.static_field.attach(dynamic_rows, static_rows, hit_distance)
+                if objects_buffer is not dynamic_rows:
+                    #baked buffer is large, it is compared only by version
+                    version = (id(self.static_field), self.static_field.version)
+        with profiler.stage('upload', context.stream if self.backend == 'cuda' else None):
+            context.set_objects(objects_buffer, bvh, version if not self.use_bvh else None)
+            camera_changed = context.set_camera(self.camera_matrices)
+            params_changed = context.set_march_params(march_params)
+        return rows, camera_changed, params_changed
+
+    def get_window_content_progressive(self, pixel_width: int, pixel_height: int, world: Union[list, Scene], number_of_steps: int = ray_march_cuda.number_of_steps,
+                                       min_hit_distance: float = ray_march_cuda.min_hit_distance, max_trace_distance: float = ray_march_cuda.max_trace_distance,
+                                       background_color: np.ndarray = ray_march_cuda.background_color, stepping: str = 'sphere',
+                                       relaxation: float = ray_march_cuda.over_relaxation, steps: tuple = progressive_steps, out: np.ndarray = None):
+        '''
+        Generator of progressively refined frames, the first pass renders every steps[0]-th pixel and fills blocks around them,
+        next passes render only pixels on finer grid of the next steps and reuse pixels rendered before, the last step must be 1
+        yields (step, image) after every pass, image [pixel_width, pixel_height, 3] is written into out like in get_window_content,
+        value sent into generator is out of the next image, so passes can be written into different buffers
+        leaving the loop (or closing generator) stops refinement, for example when camera or scene changed
+        it uses the same parameters and BVH as get_window_content, but no prepass, reprojection or dirty tiles,
+        the next get_window_content renders whole frame
         '''
-        Calculates rays from camera to every pixel
-        you shoul call this method only one unless you change camera position
+        check_march_params(number_of_steps, stepping, relaxation)
+        if not steps or steps[-1] != 1 or any(step < 1 or previous % step != 0 or previous == step for previous, step in zip(steps, steps[1:])):
+            raise ValueError(f"steps must be decreasing, every step must divide the previous one and the last must be 1, got {steps}")
+        profiler = self.profiler
+        previous_step = 0
+        for step in steps:
+            #every pass is its own frame of profiler, so its stages are resolved and reported before it is yielded
+            with profiler.frame('get_window_content_progressive'):
+                if not previous_step:
+                    context = self.get_frame_context(pixel_width, pixel_height)
+                    self.upload_world(context, world, number_of_steps, min_hit_distance, max_trace_distance, background_color, stepping, relaxation)
+                    #output of previous frame is overwritten, so reprojection and dirty tiles of the next frame start again
+                    context.previous_rows = None
+                    self.march_stats = None
+                    origin_x, origin_y, origin_z = self.pos.astype(self.dtype)
+                    normal_mode = normal_modes.index(self.normal_mode)
+                if self.backend == 'cpu':
+                    with profiler.stage('progressive_pass'):
+                        get_variant(progressive_rows, self.dtype)(context.output, context.no_march_stats, context.no_start_depths, step, previous_step,
+                                                        origin_x, origin_y, origin_z, context.camera_matrices, context.objects_buffer, context.bvh,
+                                                        normal_mode, context.march_params)
+                else:
+                    blocks = (int(np.ceil(pixel_width / step / context.threadsperblock[0])), int(np.ceil(pixel_height / step / context.threadsperblock[1])))
+                    with profiler.stage('progressive_pass', context.stream):
+                        get_variant(progressive_kernel, self.dtype)[blocks, context.threadsperblock, context.stream](
+                            context.d_output, context.d_no_march_stats, context.d_no_start_depths, step, previous_step, origin_x, origin_y, origin_z,
+                            context.d_camera_matrices, context.d_objects_buffer, context.d_bvh, normal_mode, context.d_march_params)
+                    with profiler.stage('download', context.stream):
+                        context.d_output.copy_to_host(context.output, stream=context.stream)
+                    context.stream.synchronize()
+                with profiler.stage('to_uint8'):
+                    image = to_uint8(context.output, out)
+            out = yield step, image
+            previous_step = step
 
-        use get_all_rays_kernel to calculate rays
+    @profiled_frame('get_frames_content')
+    def get_frames_content(self, pixel_width: int, pixel_height: int, frame_buffers: np.ndarray, number_of_steps: int = ray_march_cuda.number_of_steps,
+                           min_hit_distance: float = ray_march_cuda.min_hit_distance, max_trace_distance: float = ray_march_cuda.max_trace_distance,
+                           background_color: np.ndarray = ray_march_cuda.background_color, batch_bytes: int = max_batch_bytes) -> np.ndarray:
         '''
-        threadsperblock = (16, 16)
-        blockspergrid_x = int(np.ceil(pixel_width / threadsperblock[0]))
-        blockspergrid_y = int(np.ceil(pixel_height / threadsperblock[1]))
-        blockspergrid = (blockspergrid_x, blockspergrid_y)
-        self.all_rays = np.zeros((pixel_width, pixel_height, 3), dtype=np.float64)
+        Renders many frames of the same camera at once
+        frame_buffers is array [frames, objects, params] with objects buffer of every frame (see stack_frames)
+        return matrix [frames, pixel_width, pixel_height, 3], same as get_window_content of every frame
+        frames are rendered in batches with one kernel launch each, batch with its output and objects fits into batch_bytes.
+        It uses plain sphere tracing without BVH, specialisation, static field, prepass or reprojection.
+        '''
+        if number_of_steps < 1:
+            raise ValueError(f"number_of_steps must be positive, got {number_of_steps}")
+        frame_buffers = np.asarray(frame_buffers, dtype=self.dtype)
+        if frame_buffers.ndim != 3:
+            raise ValueError(f"frame_buffers must have shape [frames, objects, params], got {frame_buffers.shape}")
+        frames = frame_buffers.shape[0]
+        frame_bytes = pixel_width * pixel_height * 3 + frame_buffers[0].nbytes if frames else 1
+        if batch_bytes < frame_bytes:
+            raise ValueError(f"batch_bytes {batch_bytes} is smaller than one frame ({frame_bytes} bytes)")
+        batch = max(1, min(frames, batch_bytes // frame_bytes))
+
+        camera_matrices = self.camera_matrices.astype(self.dtype)
+        march_params = pack_march_params(number_of_steps, min_hit_distance, max_trace_distance, background_color, dtype=self.dtype)
+        for frame_buffer in frame_buffers:
+            check_instance_margins(frame_buffer, march_params)
+        bvh = empty_bvh(self.dtype)
+        origin_x, origin_y, origin_z = self.pos.astype(self.dtype)
+        normal_mode = normal_modes.index(self.normal_mode)
+        output = np.zeros((frames, pixel_width, pixel_height, 3), dtype=np.uint8)
+
+        profiler = self.profiler
+
+        if self.backend == 'cpu':
+            kernel = get_variant(ray_march_frames_rows, self.dtype)
+            for first in range(0, frames, batch):
+                with profiler.stage('kernel'):
+                    kernel(output[first:first + batch], origin_x, origin_y, origin_z, camera_matrices, frame_buffers[first:first + batch],
+                           bvh, normal_mode, march_params)
+            return output
+
+        kernel = get_variant(ray_march_frames_kernel, self.dtype)
         stream = cuda.stream()
-        d_all_rays = cuda.to_device(self.all_rays, stream)
-        d_projetion_matrix = cuda.to_device(np.linalg.inv(self.projection_matrix), stream)
-        d_lookAtMatrix = cuda.to_device(np.linalg.inv(self.lookAtMatrix), stream)
-        get_all_rays_kernel[blockspergrid, threadsperblock](d_all_rays,
-                                                             pixel_width, pixel_height,
-                                                             d_projetion_matrix, d_lookAtMatrix)
-        self.all_rays = d_all_rays.copy_to_host(stream=stream)
+        threadsperblock = (16, 16, 1)
+        with profiler.stage('upload', stream):
+            d_camera_matrices = cuda.to_device(camera_matrices, stream)
+            d_march_params = cuda.to_device(march_params, stream)
+            d_bvh = cuda.to_device(bvh, stream)
+        #device buffers of the first batch are reused by the next ones
+        d_output = cuda.device_array((batch, pixel_width, pixel_height, 3), dtype=np.uint8, stream=stream)
+        d_frame_buffers = cuda.device_array((batch,) + frame_buffers.shape[1:], dtype=self.dtype, stream=stream)
+        for first in range(0, frames, batch):
+            count = min(batch, frames - first)
+            with profiler.stage('upload', stream):
+                d_frame_buffers[:count].copy_to_device(frame_buffers[first:first + count], stream=stream)
+            blockspergrid = (int(np.ceil(pixel_width / threadsperblock[0])), int(np.ceil(pixel_height / threadsperblock[1])), count)
+            with profiler.stage('kernel', stream):
+                kernel[blockspergrid, threadsperblock, stream](d_output[:count], origin_x, origin_y, origin_z, d_camera_matrices, d_frame_buffers[:count],
+                                                             d_bvh, normal_mode, d_march_params)
+            with profiler.stage('download', stream):
+                d_output[:count].copy_to_host(output[first:first + count], stream=stream)
+        stream.synchronize()
+        return output
+
+    def update_dirty_tile_stats(self, context: FrameContext, skip_tiles: bool):
+        '''
+        Counts tiles of the last frame and tiles which were reused from previous frame
+        '''
+        if not self.dirty_tile_size:
+            return
+        tiles = context.dirty_pixels[::self.dirty_tile_size, ::self.dirty_tile_size]
+        skipped = int(np.sum(tiles == 0)) if skip_tiles else 0
+        self.dirty_tile_stats = {'tiles': tiles.size, 'skipped': skipped}
 
+def check_march_params(number_of_steps: int, stepping: str, relaxation: float) -> None:
+    if number_of_steps < 1:
+        raise ValueError(f"number_of_steps must be positive, got {number_of_steps}")
+    if stepping not in stepping_modes:
+        raise ValueError(f"Unknown stepping mode {stepping}, expected one of {stepping_modes}")
+    if not 1 <= relaxation < 2:
+        raise ValueError(f"relaxation must be in [1, 2), got {relaxation}")
+
+def max_hit_distance(march_params: np.ndarray) -> float:
+    '''
+    The largest hit epsilon of the march, hit epsilon of enhanced stepping grows up to the end of the ray
+    '''
+    return float(max(march_params[1], march_params[7] * march_params[2]))
+
+def check_instance_margins(objects_buffer: np.ndarray, march_params: np.ndarray) -> None:
+    '''
+    Raises ValueError if margin of some Instances in objects_buffer is not larger than the largest hit epsilon of the march,
+    otherwise ray could stop at lower bound of instances which are not evaluated (see merge_instances) instead of at surface
+    '''
+    if not np.any(objects_buffer[:, 0] == ray_march_cuda.instances_id):
+        return
+    hit_distance = max_hit_distance(march_params)
+    i, end = 0, len(objects_buffer)
+    while i < end:
+        row = objects_buffer[i]
+        if row[0] == ray_march_cuda.static_field_id:
+            #header of static field is followed by static rows and baked data
+            i, end = i + 1, i + 1 + int(row[13])
+        elif row[0] == ray_march_cuda.instances_id:
+            if row[11] <= hit_distance:
+                raise ValueError(f"margin of Instances ({row[11]:g}) must be larger than hit epsilon of the march ({hit_distance:g}), "
+                                 "use larger margin or smaller min_hit_distance")
+            i += 1 + int(row[13])
+        else:
+            i += 1
+
+def to_uint8(image: np.ndarray, out: np.ndarray = None) -> np.ndarray:
+    '''
+    Converts colors in [0, 1] to uint8, they are written into out if it is given
+    '''
+    if out is None:
+        return (image * 255).astype(np.uint8)
+    np.multiply(image, 255, out=out, casting='unsafe')
+    return out
+
+def stack_frames(world, frames: int, fps: float = 5, first_frame: int = 0) -> np.ndarray:
+    '''
+    Animates the world to times of frames first_frame.. first_frame + frames at given fps and returns objects buffer
+    of every frame [frames, objects, params] for get_frames_content, world.objects are animated in place like in renderers
+    '''
+    buffers = []
+    for frame in range(first_frame, first_frame + frames):
+        world.animate(frame / fps)
+        buffers.append(with_payloads(world.objects, np.array([obj.to_array() for obj in world.objects], dtype=np.float64)))
+    return np.array(buffers, dtype=np.float64).reshape(frames, -1, 4 + max_figure_params)
+
+def step_heatmap(march_stats: np.ndarray, number_of_steps: int = ray_march_cuda.number_of_steps) -> np.ndarray:
+    '''
+    Image [pixel_width, pixel_height, 3] of march stats, brightness is number of steps relative to number_of_steps,
+    hits are white, escaped rays blue and rays which ran out of steps red
+    '''
+    heat = np.clip(march_stats[..., 0] / number_of_steps, 0, 1)
+    colors = np.array([[1, 1, 1], [0.2, 0.4, 1], [1, 0.1, 0.1]])
+    image = heat[..., None] * colors[march_stats[..., 1]]
+    return (image * 255).astype(np.uint8)
@@ -1,13 +1,55 @@
+import functools
+import inspect
 from src.ray_marchobject import *
-import time 
+
+#time between calls of old animations animation(objects), renderers called them once per frame at 5 fps
+legacy_frame_time = 1 / 5
+
+def takes_time(animation) -> bool:
+    '''
+    True if animation is called as animation(objects, t), False for old animations called as animation(objects)
+    '''
+    parameters = inspect.signature(animation).parameters.values()
+    positional = [parameter for parameter in parameters if parameter.kind in (parameter.POSITIONAL_ONLY, parameter.POSITIONAL_OR_KEYWORD)]
+    return len(positional) > 1 or any(parameter.kind == parameter.VAR_POSITIONAL for parameter in parameters)
+
+def legacy_callable(animation):
+    '''
+    Decorator of animation(objects, t) which keeps the old call form animation(objects) working,
+    every call without t advances the time by legacy_frame_time since the previous call
+    '''
+    last_t = 0.0
+    @functools.wraps(animation)
+    def wrapper(objects, t: float = None):
+        nonlocal last_t
+        if t is None:
+            t = last_t + legacy_frame_time
+        last_t = t
+        return animation(objects, t)
+    return wrapper
+
 class World:
     '''
     Class to store world object and animation
+    animation(objects, t) sets objects to their state at time t in seconds and returns them,
+    state depends only on t, so frames can be rendered in any order
+    old animations animation(objects), which advance objects by one step per call, are still accepted,
+    their state depends on number of calls and t is ignored
     '''
     def __init__(self, objects: RayMarchObject, animation):
         self.objects = objects
         self.animation = animation
 
+    def animate(self, t: float):
+        '''
+        Moves objects to their state at time t
+        '''
+        if takes_time(self.animation):
+            self.objects = self.animation(self.objects, t)
+        else:
+            self.objects = self.animation(self.objects)
+        return self.objects
+
 #Example 1
 object_list_1 = [Sphere(center = np.array([3, 0, 0]),
                         radius =  0.5,
@@ -18,11 +60,10 @@ object_list_1 = [Sphere(center = np.array([3, 0, 0]),
                         rotation_dir = np.array([0, 1, 0]),
                         rotation_angle = 45), 
                 ]
-def animation_1(objects):
-    objects[0].center = np.array([3, 0 + 1.5*np.sin(time.time()), 0], dtype=np.float64)
-    objects[1].rotation_angle += 1
-    if objects[1].rotation_angle >= 360:
-        objects[1].rotation_angle = 0
+@legacy_callable
+def animation_1(objects, t):
+    objects[0].center = np.array([3, 0 + 1.5*np.sin(t), 0], dtype=np.float64)
+    objects[1].rotation_angle = (45 + 5*t) % 360
     return objects
 
 world_1 = World(object_list_1, animation_1)
@@ -45,10 +86,11 @@ object_list_2 = [PlaneY(y = 1.5,
                         rotation_angle = 45),
                  ]
 
-def animation_2(objects):
-    objects[1].center = np.array([3, 0 + 3*np.sin(time.time()), 1*np.sin(time.time())], dtype=np.float64)
-    objects[1].scaler = 10 + 5.0*np.cos(time.time())
-    objects[1].color = np.array([1, 0, 0]) + np.array([0, 0, 1])*np.sin(time.time())
+@legacy_callable
+def animation_2(objects, t):
+    objects[1].center = np.array([3, 0 + 3*np.sin(t), 1*np.sin(t)], dtype=np.float64)
+    objects[1].scaler = 10 + 5.0*np.cos(t)
+    objects[1].color = np.array([1, 0, 0]) + np.array([0, 0, 1])*np.sin(t)
     return objects
 
 world_2 = World(object_list_2, animation_2)
@@ -69,14 +111,13 @@ object_list_3 = [Cylinder(center = np.array([3, 3, 0]),
                         ),
                 ]
 
-def animation_3(objects):
-    objects[0].rotation_angle += 1
-    if objects[0].rotation_angle >= 360:
-        objects[0].rotation_angle = 0
+@legacy_callable
+def animation_3(objects, t):
+    objects[0].rotation_angle = (5*t) % 360
 
-    objects[1].center = np.array([3, 0 + 5*np.sin(time.time()/ 10), 0], dtype=np.float64)
-    objects[1].scaler = 10 + 5.0*np.cos(time.time()/ 8)
-    objects[1].color = np.array([1, 0, 0]) + np.array([0, 0, 1])*np.sin(time.time() / 15) + np.array([0, 1, 0])*np.cos(time.time()/ 15)
+    objects[1].center = np.array([3, 0 + 5*np.sin(t/ 10), 0], dtype=np.float64)
+    objects[1].scaler = 10 + 5.0*np.cos(t/ 8)
+    objects[1].color = np.array([1, 0, 0]) + np.array([0, 0, 1])*np.sin(t / 15) + np.array([0, 1, 0])*np.cos(t/ 15)
     return objects
 
 world_3 = World(object_list_3, animation_3)
@@ -90,10 +131,11 @@ object_list_4 = [Cone(center=np.array([3, 1, 0]),
                         rotation_angle = 0,
                         color = np.array([1, 0, 0]),),]
 
-def animation_4(objects):
-    objects[0].rotation_angle += 1
-    if objects[0].rotation_angle >= 360:
-        objects[0].rotation_angle = 0
+@legacy_callable
+def animation_4(objects, t):
+    objects[0].rotation_angle = (5*t) % 360
     return objects
 
 world_4 = World(object_list_4, animation_4)
+
+worlds = {'world_1': world_1, 'world_2': world_2, 'world_3': world_3, 'world_4': world_4}
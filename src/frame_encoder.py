@@ -0,0 +1,193 @@
+'''
+Export of rendered frames to files without matplotlib or ImageMagick.
+Frames are passed to encoder thread through bounded queue, so rendering of the next frames overlaps
+with encoding of the previous ones and memory does not grow with number of frames.
+GIF is written frame by frame, every frame has its own palette: frame is saved by Pillow as single image GIF
+and its image block is appended to the stream with the palette as local color table.
+'''
+import io
+import os
+import queue
+import struct
+import threading
+import numpy as np
+from PIL import Image
+from src.camera import RayMarchCamera, stack_frames
+from src.profiling import Profiler, no_profiler
+
+encoder_formats = ('gif', 'png', 'raw')
+
+def frame_to_rows(frame: np.ndarray) -> np.ndarray:
+    '''
+    Converts frame [pixel_width, pixel_height, 3] returned by camera to rows of image [pixel_height, pixel_width, 3]
+    oriented like gifs made by matplotlib renderer
+    '''
+    return np.ascontiguousarray(frame.transpose(1, 0, 2)[:, ::-1])
+
+def frame_to_image(frame: np.ndarray) -> Image.Image:
+    return Image.fromarray(frame_to_rows(frame))
+
+def skip_sub_blocks(data: bytes, position: int) -> int:
+    '''
+    Returns position after GIF data sub-blocks starting at position, they end with empty block
+    '''
+    while data[position]:
+        position += data[position] + 1
+    return position + 1
+
+def gif_image_block(image: Image.Image) -> bytes:
+    '''
+    Image descriptor with local color table and LZW data of image in palette mode,
+    it can be appended to any GIF stream after graphic control extension
+    image is encoded by Image.save as single image GIF, whose global color table becomes the local one
+    '''
+    buffer = io.BytesIO()
+    image.save(buffer, format='GIF')
+    data = buffer.getvalue()
+    flags = data[10]
+    position = 13
+    color_table = b""
+    if flags & 0x80:
+        color_table = data[position:position + (3 << ((flags & 7) + 1))]
+        position += len(color_table)
+    #extensions of single image (comment, transparency) are not copied
+    while data[position] == 0x21:
+        position = skip_sub_blocks(data, position + 2)
+    if data[position] != 0x2C:
+        raise ValueError(f"Unexpected block {data[position]:#x} in GIF written by Pillow")
+    descriptor = bytearray(data[position:position + 10])
+    position += 10
+    if descriptor[9] & 0x80:
+        color_table = data[position:position + (3 << ((descriptor[9] & 7) + 1))]
+        position += len(color_table)
+    elif color_table:
+        #keeps interlace flag, sort flag is dropped
+        descriptor[9] = 0x80 | (descriptor[9] & 0x40) | (flags & 7)
+    else:
+        raise ValueError("GIF written by Pillow has no color table")
+    #LZW minimum code size precedes data sub-blocks
+    end = skip_sub_blocks(data, position + 1)
+    return bytes(descriptor) + color_table + data[position:end]
+
+class FrameEncoder:
+    '''
+    Writes frames to path on background thread
+    format is one of encoder_formats ('gif' by default or by extension of path),
+    'png' writes sequence of images frame_00000.png, ... into directory path
+    and 'raw' appends rgb bytes of every frame [pixel_height, pixel_width, 3] to single file
+    write blocks when max_queued frames wait for encoding, errors of encoder are raised by write or close
+    profiler records time of encoding of every frame as stage 'encode' of encoder thread
+    '''
+    def __init__(self, path: str, format: str = None, fps: float = 5, max_queued: int = 8, loop: int = 0, profiler: Profiler = None):
+        if format is None:
+            extension = os.path.splitext(path)[1][1:].lower()
+            format = extension if extension in encoder_formats else 'gif'
+        if format not in encoder_formats:
+            raise ValueError(f"Unknown format {format}, expected one of {encoder_formats}")
+        if fps <= 0:
+            raise ValueError(f"fps must be positive, got {fps}")
+        if max_queued < 1:
+            raise ValueError(f"max_queued must be positive, got {max_queued}")
+        self.path = path
+        self.format = format
+        self.duration = int(round(1000 / fps))
+        self.loop = loop
+        self.profiler = profiler or no_profiler
+        self.frames_written = 0
+        self.error = None
+        self.file = None
+        self.closed = False
+        self.queue = queue.Queue(maxsize=max_queued)
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def write(self, frame: np.ndarray) -> None:
+        '''
+        Queues frame [pixel_width, pixel_height, 3] of uint8, frame must not be changed after it is queued
+        '''
+        if self.closed:
+            raise ValueError("Encoder is closed")
+        self.raise_error()
+        self.queue.put(frame)
+
+    def close(self) -> None:
+        '''
+        Waits until all queued frames are written and closes the file
+        '''
+        if not self.closed:
+            self.closed = True
+            self.queue.put(None)
+            self.thread.join()
+        self.raise_error()
+
+    def raise_error(self) -> None:
+        if self.error is not None:
+            raise RuntimeError(f"Encoding of {self.path} failed") from self.error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def run(self) -> None:
+        try:
+            while True:
+                frame = self.queue.get()
+                if frame is None:
+                    break
+                with self.profiler.stage('encode'):
+                    self.encode(frame)
+                self.frames_written += 1
+            if self.format == 'gif' and self.file is not None:
+                self.file.write(b";")
+        except Exception as error:
+            self.error = error
+            #unblock producer waiting on full queue, frames after error are dropped
+            while self.queue.get() is not None:
+                pass
+        finally:
+            if self.file is not None:
+                self.file.close()
+
+    def encode(self, frame: np.ndarray) -> None:
+        if self.format == 'png':
+            os.makedirs(self.path, exist_ok=True)
+            frame_to_image(frame).save(os.path.join(self.path, f"frame_{self.frames_written:05d}.png"))
+            return
+        if self.format == 'raw':
+            if self.file is None:
+                self.file = open(self.path, 'wb')
+            self.file.write(frame_to_rows(frame).tobytes())
+            return
+
+        image = frame_to_image(frame).quantize(256, method=Image.Quantize.FASTOCTREE)
+        if self.file is None:
+            self.file = open(self.path, 'wb')
+            #logical screen without global color table, every frame has its own
+            self.file.write(b"GIF89a" + struct.pack('<HHBBB', image.width, image.height, 0, 0, 0))
+            #application extension with number of loops
+            self.file.write(b"!\xff\x0bNETSCAPE2.0\x03\x01" + struct.pack('<H', self.loop) + b"\x00")
+        #graphic control extension with delay in hundredths of second
+        self.file.write(b"!\xf9\x04\x00" + struct.pack('<H', int(round(self.duration / 10))) + b"\x00\x00")
+        self.file.write(gif_image_block(image))
+
+def export_animation(camera: RayMarchCamera, pixel_width: int, pixel_height: int, world, frames: int, path: str,
+                     batch_frames: int = 16, fps: float = 5, **encoder_params) -> int:
+    '''
+    Renders frames of world animation with get_frames_content in batches of batch_frames
+    and streams them into FrameEncoder, returns number of written frames
+    frame i shows the world at time i / fps, so animation plays at real speed
+    every batch is frame 'export_batch' of camera.profiler, time spent waiting for encoder is its stage 'encode_wait'
+    '''
+    profiler = camera.profiler
+    with FrameEncoder(path, fps=fps, profiler=profiler, **encoder_params) as encoder:
+        for first in range(0, frames, batch_frames):
+            with profiler.frame('export_batch'):
+                with profiler.stage('stack_frames'):
+                    frame_buffers = stack_frames(world, min(batch_frames, frames - first), fps, first)
+                batch = camera.get_frames_content(pixel_width, pixel_height, frame_buffers)
+                with profiler.stage('encode_wait'):
+                    for frame in batch:
+                        encoder.write(frame)
+    return encoder.frames_written
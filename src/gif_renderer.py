@@ -0,0 +1,28 @@
+import numpy as np
+from src.camera import RayMarchCamera
+from src.frame_encoder import export_animation
+from src.profiling import Profiler, format_summary
+from src.ray_marchobject import *
+import time
+from src.example_worlds import *
+
+class GifRenderer:
+    '''
+    class to generate gif (or sequence of png images) from animation of the world
+    frames are rendered in batches by get_frames_content, so camera uses plain sphere tracing without reprojection or dirty tiles
+    profiler records stages of rendering (frames 'export_batch') and encoding
+    '''
+    def __init__(self, width: int, height: int, world: World, profiler: Profiler = None):
+        self.screen_width = width
+        self.screen_height = height
+        self.world = world
+
+        self.camera = RayMarchCamera(pos = np.array([0,0,0], dtype=np.float64), target=np.array([10,0,0], dtype=np.float64), screne_width=width, screne_height=height, profiler=profiler)
+
+    def render_gif(self, seconds: int, gif_path: str = './animation.gif', fps: float = 5, format: str = None):
+        #frames are rendered in batches and streamed to encoder thread, so memory does not grow with number of frames
+        start = time.time()
+        frames = export_animation(self.camera, self.screen_width, self.screen_height, self.world, seconds, gif_path, fps=fps, format=format)
+        print(f"Time to render and encode {frames} frames: {time.time() - start:.2f} sec")
+        if isinstance(self.camera.profiler, Profiler):
+            print(format_summary(self.camera.profiler.summary()))
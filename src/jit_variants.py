@@ -0,0 +1,57 @@
+'''
+Recompilation of cuda device functions with other jit decorator or other globals.
+It lets SDFs and marching code be written only once and then be compiled
+for CPU (with njit) or with other float precision (with real = float32).
+'''
+import types
+from numba.core.registry import CPUDispatcher
+
+def is_cuda_function(value) -> bool:
+    '''
+    Checks if value is function compiled by cuda.jit (or by the cuda simulator)
+    '''
+    return (hasattr(value, 'py_func')
+            and not isinstance(value, CPUDispatcher)
+            and type(value).__module__.startswith('numba.cuda'))
+
+class JitVariant:
+    '''
+    Set of functions recompiled with jit decorator and globals replaced by overrides.
+    Functions called by recompiled function are recompiled too, compilation itself is lazy.
+    '''
+    def __init__(self, jit, **overrides):
+        self.jit = jit
+        self.overrides = overrides
+        self.namespaces = {}
+        self.functions = {}
+
+    def namespace(self, module_globals: dict) -> dict:
+        '''
+        Returns copy of module globals with overrides where every cuda function is replaced by its variant,
+        overrides can be cuda functions too, then they are compiled as part of this variant
+        '''
+        key = id(module_globals)
+        if key not in self.namespaces:
+            namespace = dict(module_globals)
+            namespace.update(self.overrides)
+            self.namespaces[key] = namespace
+            for name, value in list(namespace.items()):
+                if is_cuda_function(value):
+                    namespace[name] = self.compile(value)
+        return self.namespaces[key]
+
+    def compile(self, func, jit = None):
+        '''
+        Returns variant of func, it can be cuda function or plain python function
+        jit overrides decorator of this function only (for example for kernels or parallel loops),
+        variants are cached by jit object so it should be created once and reused
+        '''
+        py_func = getattr(func, 'py_func', func)
+        jit = jit or self.jit
+        key = (id(py_func), id(jit))
+        if key not in self.functions:
+            namespace = self.namespace(py_func.__globals__)
+            if key not in self.functions:
+                variant = types.FunctionType(py_func.__code__, namespace, py_func.__name__, py_func.__defaults__, py_func.__closure__)
+                self.functions[key] = jit(variant)
+        return self.functions[key]
@@ -0,0 +1,215 @@
+'''
+Per-stage timing of rendering.
+Stages run on host are timed with perf_counter_ns, stages queued on cuda stream are timed with cuda events
+which are read when the frame ends (after the stream was synchronized), so timing does not stall the stream.
+Durations of the last window samples of every stage are kept for percentiles, callbacks get durations of stages
+of every finished frame (for export to metrics) and whole session can be written as Chrome trace
+(open it in chrome://tracing or https://ui.perfetto.dev).
+'''
+import collections
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+import numba
+import numpy as np
+from numba import cuda
+
+class StageStats:
+    '''
+    Rolling window of the last durations (in ns) of every stage
+    '''
+    def __init__(self, window: int = 240):
+        if window < 1:
+            raise ValueError(f"window must be positive, got {window}")
+        self.window = window
+        self.samples = {}
+        #number of all samples of stage, also those which already left the window
+        self.counts = {}
+
+    def add(self, stage: str, duration_ns: int) -> None:
+        if stage not in self.samples:
+            self.samples[stage] = collections.deque(maxlen=self.window)
+            self.counts[stage] = 0
+        self.samples[stage].append(duration_ns)
+        self.counts[stage] += 1
+
+    def percentile(self, stage: str, q: float) -> float:
+        '''
+        q-th percentile of durations of stage in ms
+        '''
+        return float(np.percentile(self.samples[stage], q)) / 1e6
+
+    def summary(self, percentiles: tuple = (50, 90, 99)) -> dict:
+        '''
+        Returns {stage: {'count': ..., 'mean_ms': ..., 'max_ms': ..., 'p50_ms': ..., ...}} of durations in the window
+        '''
+        result = {}
+        for stage, samples in self.samples.items():
+            durations = np.array(samples) / 1e6
+            stats = {'count': self.counts[stage], 'mean_ms': float(durations.mean()), 'max_ms': float(durations.max())}
+            for q in percentiles:
+                stats[f"p{q}_ms"] = float(np.percentile(durations, q))
+            result[stage] = stats
+        return result
+
+class Profiler:
+    '''
+    Records durations of stages into self.stats (StageStats over the last window samples)
+    stages are grouped into frames, when the outermost frame of a thread ends every callback is called
+    with name of the frame and {stage: ms} of stages finished during it (stage repeated in frame is summed)
+    if trace is set every stage is also kept as event of Chrome trace, see dump_trace
+    profiler can be shared by threads, every thread has its own frames
+    '''
+    def __init__(self, window: int = 240, trace: bool = False, callbacks: list = ()):
+        self.stats = StageStats(window)
+        self.callbacks = list(callbacks)
+        self.trace = trace
+        self.events = []
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.threads = set()
+        self.origin_ns = time.perf_counter_ns()
+
+    def add_callback(self, callback) -> None:
+        '''
+        callback(frame_name, {stage: ms}) is called on the thread which finished the frame
+        '''
+        self.callbacks.append(callback)
+
+    def record(self, stage: str, start_ns: int, duration_ns: int, category: str = 'host') -> None:
+        with self.lock:
+            self.stats.add(stage, duration_ns)
+            if self.trace:
+                thread = threading.get_ident()
+                if thread not in self.threads:
+                    self.threads.add(thread)
+                    self.events.append({'name': 'thread_name', 'ph': 'M', 'pid': os.getpid(), 'tid': thread,
+                                        'args': {'name': threading.current_thread().name}})
+                self.events.append({'name': stage, 'cat': category, 'ph': 'X', 'pid': os.getpid(), 'tid': thread,
+                                    'ts': (start_ns - self.origin_ns) / 1000, 'dur': duration_ns / 1000})
+        frame = getattr(self.local, 'frame', None)
+        if frame is not None:
+            frame[stage] = frame.get(stage, 0.0) + duration_ns / 1e6
+
+    def stage(self, name: str, stream = None):
+        '''
+        Context manager which times its block as stage name
+        if cuda stream is given, work queued on it by the block is timed with cuda events instead of host time,
+        the duration is recorded when the frame ends (on cuda simulator kernels run on host, so host time is used)
+        '''
+        if stream is not None and not numba.config.ENABLE_CUDASIM:
+            return self.cuda_stage(name, stream)
+        return self.host_stage(name)
+
+    @contextmanager
+    def host_stage(self, name: str):
+        start = time.perf_counter_ns()
+        yield
+        self.record(name, start, time.perf_counter_ns() - start)
+
+    @contextmanager
+    def cuda_stage(self, name: str, stream):
+        start_ns = time.perf_counter_ns()
+        start, end = cuda.event(), cuda.event()
+        start.record(stream)
+        yield
+        end.record(stream)
+        self.pending_events().append((name, start_ns, start, end))
+
+    def pending_events(self) -> list:
+        if not hasattr(self.local, 'pending'):
+            self.local.pending = []
+        return self.local.pending
+
+    def resolve(self) -> None:
+        '''
+        Waits for pending cuda events of this thread and records their stages
+        '''
+        pending = self.pending_events()
+        for name, start_ns, start, end in pending:
+            end.synchronize()
+            #trace shows cuda stage from the time it was queued
+            self.record(name, start_ns, int(start.elapsed_time(end) * 1e6), 'cuda')
+        pending.clear()
+
+    @contextmanager
+    def frame(self, name: str = 'frame'):
+        '''
+        Context manager which times its block as stage name and groups stages inside it into frame,
+        frames can be nested, callbacks are called only when the outermost one ends
+        '''
+        outer = getattr(self.local, 'frame', None) is None
+        if outer:
+            self.local.frame = {}
+        try:
+            with self.host_stage(name):
+                yield
+            if not outer:
+                return
+            self.resolve()
+            stages = self.local.frame
+        finally:
+            if outer:
+                self.local.frame = None
+        for callback in self.callbacks:
+            callback(name, stages)
+
+    def summary(self, percentiles: tuple = (50, 90, 99)) -> dict:
+        '''
+        Statistics of every stage, see StageStats.summary
+        '''
+        self.resolve()
+        with self.lock:
+            return self.stats.summary(percentiles)
+
+    def dump_trace(self, path: str) -> None:
+        '''
+        Writes stages recorded so far as Chrome trace JSON, profiler must be created with trace=True
+        '''
+        if not self.trace:
+            raise ValueError("Profiler does not record trace, create it with trace=True")
+        self.resolve()
+        with self.lock:
+            events = list(self.events)
+        with open(path, 'w') as file:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, file)
+
+def profiled_frame(name: str):
+    '''
+    Decorator of methods which times every call as frame name of self.profiler
+    '''
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            with self.profiler.frame(name):
+                return method(self, *args, **kwargs)
+        return wrapper
+    return decorator
+
+def format_summary(summary: dict) -> str:
+    '''
+    Table of statistics returned by Profiler.summary
+    '''
+    columns = [column for column in next(iter(summary.values()), {}) if column != 'count']
+    lines = [f"{'stage':<20} {'count':>7} " + " ".join(f"{column:>9}" for column in columns)]
+    for stage, stats in summary.items():
+        lines.append(f"{stage:<20} {stats['count']:7d} " + " ".join(f"{stats[column]:9.3f}" for column in columns))
+    return "\n".join(lines)
+
+class NullProfiler:
+    '''
+    Profiler which records nothing, it is used when profiling is off
+    '''
+    context = nullcontext()
+
+    def stage(self, name: str, stream = None):
+        return self.context
+
+    def frame(self, name: str = 'frame'):
+        return self.context
+
+#shared instance for cameras and renderers without profiler
+no_profiler = NullProfiler()
@@ -1,40 +1,223 @@
 import pygame
 import numpy as np
 from src.camera import RayMarchCamera
+from src.render_worker import RenderWorker
+from src.resolution_scaler import ResolutionScaler, default_scales
+from src.scene import Scene
+from src.profiling import Profiler, no_profiler, format_summary
 from src.ray_marchobject import *
 import time
 from src.example_worlds import *
 
 class PyGameWindowRenderer:
-    def __init__(self, width: int, height: int, world: World) -> None:
+    '''
+    class to show world in pygame window
+    camera can be moved with WASD (Space and LShift for up and down) and turned with arrow keys
+    frames are rendered on background thread, window shows the newest finished frame
+    profiler records stages of rendering (frames 'render_frame' or 'render_pass' of the worker) and of presentation (frames 'present' of main loop)
+    if frame_budget (seconds) is given, frames are rendered at one of scales of window size chosen to fit into the budget
+    (see ResolutionScaler) and upscaled to the window
+    if progressive is set, frames after camera moved are rendered in passes from coarse to full resolution
+    (see get_window_content_progressive), window shows the finest finished pass and moving camera again interrupts refinement
+    '''
+    move_speed = 2.0
+    turn_speed = 60.0
+
+    def __init__(self, width: int, height: int, world: World, target_fps: int = 60, profiler: Profiler = None,
+                 frame_budget: float = None, scales: tuple = default_scales, progressive: bool = False) -> None:
+        if progressive and frame_budget is not None:
+            raise ValueError("Progressive rendering can not be used with frame budget")
         self.screen_width = width
         self.screen_height = height
         self.screen = pygame.display.set_mode((width, height))
         
         #initial set of objects
         self.world = world
+        #animations assign attributes of objects, so scene repacks only objects which changed
+        self.scene = Scene(world.objects)
+
+        self.target_fps = target_fps
+        self.progressive = progressive
+        self.profiler = profiler or no_profiler
+        #animation time is measured from creation of the window
+        self.start_time = time.time()
 
-        self.camera = RayMarchCamera(pos = np.array([0,0,0], dtype=np.float64), target=np.array([10,0,0], dtype=np.float64), screne_width=width, screne_height=height)
+        #camera is used only by render worker, main loop moves view and passes its pose to the worker
+        self.camera = RayMarchCamera(pos = np.array([0,0,0], dtype=np.float64), target=np.array([10,0,0], dtype=np.float64), screne_width=width, screne_height=height, temporal_reprojection=True, dirty_tile_size=16, profiler=profiler)
+        self.view = RayMarchCamera(pos = self.camera.pos, target=self.camera.pos + self.camera.dir, screne_width=width, screne_height=height, backend='cpu')
         
+        #frames are written straight into rows of pixels of 24 bit surfaces which share memory with the buffers,
+        #so finished frame is presented without copying it and nothing is allocated per frame
+        pixel_rows = [np.zeros((height, width, 3), dtype=np.uint8) for _ in range(3)]
+        self.buffers = [rows.transpose(1, 0, 2) for rows in pixel_rows]
+        self.buffer_surfaces = [pygame.image.frombuffer(rows, (width, height), 'RGB') for rows in pixel_rows]
+        self.overlay_text = None
+
+        #frames of lower levels are written into corner of the buffers, camera keeps render buffers of every level,
+        #corner of the buffer is upscaled into surface of window size
+        self.scaler = ResolutionScaler(width, height, frame_budget, scales) if frame_budget is not None else None
+        self.resolutions = self.scaler.resolutions if self.scaler is not None else [(width, height)]
+        self.level_surfaces = [[surface.subsurface((0, 0, *resolution)) for resolution in self.resolutions] for surface in self.buffer_surfaces]
+        self.scaled_surface = pygame.Surface((width, height), 0, self.buffer_surfaces[0])
+
         #calculate time for inital rendering
         start = time.time()
-        self.camera.set_all_rays(self.screen_width, self.screen_height)
-        self.window_content = self.camera.get_window_content(self.screen_width, self.screen_height, self.world.objects)
+        self.window_content = self.camera.get_window_content(self.screen_width, self.screen_height, self.scene, out=self.buffers[0])
         print(f"Time to render {width}x{height}: {time.time() - start:.2f} sec")
+        #surface shown in the window
+        self.surface = self.buffer_surfaces[0]
+
+    def move_camera(self, dt: float) -> bool:
+        '''
+        Moves camera according to pressed keys
+        returns True if camera was moved
+        '''
+        keys = pygame.key.get_pressed()
+        forward = keys[pygame.K_w] - keys[pygame.K_s]
+        side = keys[pygame.K_d] - keys[pygame.K_a]
+        vertical = keys[pygame.K_SPACE] - keys[pygame.K_LSHIFT]
+        yaw = keys[pygame.K_RIGHT] - keys[pygame.K_LEFT]
+        pitch = keys[pygame.K_UP] - keys[pygame.K_DOWN]
+        if not (forward or side or vertical or yaw or pitch):
+            return False
+
+        camera = self.view
+        pos = camera.pos + (forward * camera.dir + side * camera.right + vertical * camera.up) * self.move_speed * dt
+
+        #yaw rotates direction around world y axis, pitch tilts it along camera up
+        angle = np.radians(yaw * self.turn_speed * dt)
+        c, s = np.cos(angle), np.sin(angle)
+        dir = np.array([c * camera.dir[0] - s * camera.dir[2], camera.dir[1], s * camera.dir[0] + c * camera.dir[2]])
+        dir = dir + camera.up * np.radians(pitch * self.turn_speed * dt)
+        #do not let camera look straight up or down, it breaks its axis
+        if abs(dir[1]) / np.linalg.norm(dir) > 0.99:
+            dir = camera.dir
+
+        camera.look_at(pos, pos + dir)
+        return True
+
+    def render_request(self, request: tuple, out: np.ndarray):
+        '''
+        Renders request (pose, level, progressive) of main loop into out, it runs on render worker
+        '''
+        pose, level, progressive = request
+        if progressive:
+            return self.render_passes(pose, out)
+        return self.render_frame(pose, level, out)
+
+    def render_passes(self, pose: tuple, out: np.ndarray):
+        '''
+        Generator which renders frame of animated world from camera pose (pos, target) in passes,
+        every pass is written into out sent by render worker, yields level and render time of every pass
+        '''
+        start = time.perf_counter()
+        #generator does nothing until the first pass is requested
+        passes = self.camera.get_window_content_progressive(self.screen_width, self.screen_height, self.scene, out=out)
+        try:
+            #every pass is frame 'render_pass', the first one also animates the world
+            with self.profiler.frame('render_pass'):
+                self.camera.look_at(*pose)
+                with self.profiler.stage('animate'):
+                    self.world.animate(time.time() - self.start_time)
+                next(passes)
+            while True:
+                out = yield 0, time.perf_counter() - start
+                start = time.perf_counter()
+                with self.profiler.frame('render_pass'):
+                    passes.send(out)
+        except StopIteration:
+            return
+        finally:
+            passes.close()
+
+    def render_frame(self, pose: tuple, level: int, out: np.ndarray) -> tuple:
+        '''
+        Renders frame of animated world from camera pose (pos, target) at resolution level into out
+        returns level and render time of the frame
+        '''
+        pixel_width, pixel_height = self.resolutions[level]
+        start = time.perf_counter()
+        with self.profiler.frame('render_frame'):
+            self.camera.look_at(*pose)
+            with self.profiler.stage('animate'):
+                self.world.animate(time.time() - self.start_time)
+            self.camera.get_window_content(pixel_width, pixel_height, self.scene, out=out[:pixel_width, :pixel_height])
+        return level, time.perf_counter() - start
+
+    def present(self, frame: np.ndarray, level: int) -> None:
+        '''
+        Shows frame rendered at level (one of self.buffers) in the window, its own surface is shown without copying,
+        frames of lower levels are upscaled
+        '''
+        index = next(i for i, buffer in enumerate(self.buffers) if buffer is frame)
+        if level == 0:
+            self.surface = self.buffer_surfaces[index]
+            return
+        with self.profiler.stage('upscale'):
+            pygame.transform.smoothscale(self.level_surfaces[index][level], (self.screen_width, self.screen_height), self.scaled_surface)
+        self.surface = self.scaled_surface
+
+    def draw_overlay(self, clock: pygame.time.Clock, worker: RenderWorker) -> None:
+        '''
+        Draws display fps and time of the last rendered frame
+        '''
+        frame_time = worker.frame_time
+        text = f"{clock.get_fps():.0f} fps"
+        if frame_time is not None:
+            text += f" | render {frame_time * 1000:.0f} ms ({1 / frame_time:.1f} fps)"
+        if self.scaler is not None:
+            text += " | {}x{}".format(*self.scaler.resolution)
+        #text is rendered again only when it changes
+        if text != self.overlay_text:
+            self.overlay_text = text
+            self.overlay = self.font.render(text, True, (255, 255, 255), (0, 0, 0))
+        self.screen.blit(self.overlay, (4, 4))
 
     def mainloop(self) -> None:
+        pygame.font.init()
+        self.font = pygame.font.SysFont(None, 20)
+        clock = pygame.time.Clock()
+        #the first frame is shown from the first buffer
+        worker = RenderWorker(self.render_request, self.buffers, front=0)
+        level = 0
         running = True
-        num_frames = 0
-        while running:
-            if num_frames % 60 == 0:
-                self.screen.fill((255, 255, 255))
-                self.world.objects = self.world.animation(self.world.objects)
-                self.window_content = self.camera.get_window_content(self.screen_width, self.screen_height, self.world.objects)
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT:
-                    print("Exiting")
-                    running = False
-
-            num_frames += 1
-            self.screen.blit(pygame.surfarray.make_surface(self.window_content), (0, 0))
-            pygame.display.flip()
+        last_time = time.time()
+        profiler = self.profiler
+        try:
+            while running:
+                with profiler.frame('present'):
+                    with profiler.stage('input'):
+                        for event in pygame.event.get():
+                            if event.type == pygame.QUIT:
+                                print("Exiting")
+                                running = False
+
+                        now = time.time()
+                        moved = self.move_camera(now - last_time)
+                        last_time = now
+                        pose = (self.view.pos.copy(), self.view.pos + self.view.dir)
+                        #worker renders only the newest pose, poses posted during a render are dropped
+                        if not self.progressive:
+                            worker.request((pose, level, False))
+                        elif moved or not worker.busy:
+                            #refinement runs until camera moves again, camera which stands still renders whole frames
+                            #which reuse tiles of previous frame
+                            worker.request((pose, level, moved))
+
+                    frame = worker.acquire()
+                    if frame is not None:
+                        frame_level, frame_time = worker.front_result
+                        self.window_content = frame
+                        self.present(frame, frame_level)
+                        if self.scaler is not None:
+                            level = self.scaler.update(frame_level, frame_time)
+                    with profiler.stage('blit'):
+                        self.screen.blit(self.surface, (0, 0))
+                        self.draw_overlay(clock, worker)
+                    with profiler.stage('flip'):
+                        pygame.display.flip()
+                clock.tick(self.target_fps)
+        finally:
+            worker.stop()
+            if isinstance(self.profiler, Profiler):
+                print(format_summary(self.profiler.summary()))
@@ -0,0 +1,112 @@
+'''
+CPU backend for the renderer.
+All device functions from ray_march_cuda.py and distances.py are recompiled with njit,
+so the SDFs and marching code are written only once and shared by both backends.
+Kernels of both backends in every float precision are returned by get_variant.
+'''
+import numpy as np
+from numba import cuda, njit, prange, float32, float64
+from src.jit_variants import JitVariant, is_cuda_function
+from src.ray_march_cuda import cuda_variants, render_pixel, render_frame_pixel, cone_march_tile, reproject_pixel, mark_dirty_tile, refine_block
+
+def ray_march_rows(result: np.ndarray, march_stats: np.ndarray, start_depths: np.ndarray, hit_depths: np.ndarray, dirty_pixels: np.ndarray,
+                   origin_x: float, origin_y: float, origin_z: float, camera_matrices: np.ndarray, object_buffer: np.ndarray, bvh: np.ndarray,
+                   normal_mode: int, march_params: np.ndarray) -> None:
+    '''
+    CPU version of ray_march_kernel, rows of pixels are processed in parallel
+    '''
+    for x in prange(result.shape[0]):
+        for y in range(result.shape[1]):
+            if dirty_pixels.shape[0] > 0 and not dirty_pixels[x, y]:
+                continue
+            render_pixel(result, march_stats, start_depths, hit_depths, x, y, origin_x, origin_y, origin_z, camera_matrices, object_buffer, bvh,
+                         normal_mode, march_params)
+
+def cone_march_rows(start_depths: np.ndarray, tile_size: int, origin_x: float, origin_y: float, origin_z: float, camera_matrices: np.ndarray,
+                    object_buffer: np.ndarray, bvh: np.ndarray, march_params: np.ndarray) -> None:
+    '''
+    CPU version of cone_march_kernel, rows of tiles are processed in parallel
+    '''
+    tiles_x = (start_depths.shape[0] + tile_size - 1) // tile_size
+    tiles_y = (start_depths.shape[1] + tile_size - 1) // tile_size
+    for tile_x in prange(tiles_x):
+        for tile_y in range(tiles_y):
+            cone_march_tile(start_depths, tile_x, tile_y, tile_size, origin_x, origin_y, origin_z, camera_matrices, object_buffer, bvh, march_params)
+
+def reproject_rows(start_depths: np.ndarray, hit_depths: np.ndarray, changed_boxes: np.ndarray, origin_x: float, origin_y: float, origin_z: float,
+                   camera_matrices: np.ndarray, keep_start: bool) -> None:
+    '''
+    CPU version of reproject_kernel, rows of pixels are processed in parallel
+    '''
+    for x in prange(start_depths.shape[0]):
+        for y in range(start_depths.shape[1]):
+            reproject_pixel(start_depths, hit_depths, x, y, changed_boxes, origin_x, origin_y, origin_z, camera_matrices, keep_start)
+
+def dirty_tiles_rows(dirty_pixels: np.ndarray, tile_size: int, changed_boxes: np.ndarray, origin_x: float, origin_y: float, origin_z: float,
+                     camera_matrices: np.ndarray) -> None:
+    '''
+    CPU version of dirty_tiles_kernel, rows of tiles are processed in parallel
+    '''
+    tiles_x = (dirty_pixels.shape[0] + tile_size - 1) // tile_size
+    tiles_y = (dirty_pixels.shape[1] + tile_size - 1) // tile_size
+    for tile_x in prange(tiles_x):
+        for tile_y in range(tiles_y):
+            mark_dirty_tile(dirty_pixels, tile_x, tile_y, tile_size, changed_boxes, origin_x, origin_y, origin_z, camera_matrices)
+
+def ray_march_frames_rows(results: np.ndarray, origin_x: float, origin_y: float, origin_z: float, camera_matrices: np.ndarray,
+                          frame_buffers: np.ndarray, bvh: np.ndarray, normal_mode: int, march_params: np.ndarray) -> None:
+    '''
+    CPU version of ray_march_frames_kernel, rows of all frames are processed in parallel
+    '''
+    pixel_width = results.shape[1]
+    for row in prange(results.shape[0] * pixel_width):
+        frame = row // pixel_width
+        x = row % pixel_width
+        for y in range(results.shape[2]):
+            render_frame_pixel(results, frame, x, y, origin_x, origin_y, origin_z, camera_matrices, frame_buffers, bvh, normal_mode, march_params)
+
+def ray_march_tile(result: np.ndarray, march_stats: np.ndarray, start_depths: np.ndarray, first_x: int, first_y: int, last_x: int, last_y: int,
+                   origin_x: float, origin_y: float, origin_z: float, camera_matrices: np.ndarray, object_buffer: np.ndarray, bvh: np.ndarray,
+                   normal_mode: int, march_params: np.ndarray) -> None:
+    '''
+    Renders pixels first_x..last_x, first_y..last_y of result, it is used by worker processes of tile scheduler
+    march_stats and start_depths are optional like in ray_march_rows
+    '''
+    for x in prange(first_x, last_x):
+        for y in range(first_y, last_y):
+            render_pixel(result, march_stats, start_depths, start_depths[:0], x, y, origin_x, origin_y, origin_z, camera_matrices, object_buffer, bvh,
+                         normal_mode, march_params)
+
+def progressive_rows(result: np.ndarray, march_stats: np.ndarray, start_depths: np.ndarray, step: int, previous_step: int,
+                     origin_x: float, origin_y: float, origin_z: float, camera_matrices: np.ndarray, object_buffer: np.ndarray, bvh: np.ndarray,
+                     normal_mode: int, march_params: np.ndarray) -> None:
+    '''
+    CPU version of progressive_kernel, rows of blocks are processed in parallel
+    '''
+    blocks_x = (result.shape[0] + step - 1) // step
+    blocks_y = (result.shape[1] + step - 1) // step
+    for block_x in prange(blocks_x):
+        for block_y in range(blocks_y):
+            refine_block(result, march_stats, start_depths, block_x, block_y, step, previous_step, origin_x, origin_y, origin_z, camera_matrices,
+                         object_buffer, bvh, normal_mode, march_params)
+
+#nogil lets frames render on background thread while main thread handles window events
+parallel_jit = njit(parallel=True, nogil=True)
+
+cpu_variants = {
+    np.dtype(np.float64): JitVariant(njit, real=float64),
+    np.dtype(np.float32): JitVariant(njit, real=float32),
+}
+
+def get_variant(kernel, dtype = np.float64):
+    '''
+    Returns kernel compiled with given float precision, cuda kernels (like ray_march_kernel) are compiled for cuda
+    and plain python functions of this module (like ray_march_rows) for CPU with parallel loops,
+    variants are compiled once and cached by JitVariant
+    '''
+    dtype = np.dtype(dtype)
+    if not is_cuda_function(kernel):
+        return cpu_variants[dtype].compile(kernel, parallel_jit)
+    if dtype == np.float64:
+        return kernel
+    return cuda_variants[dtype].compile(kernel, cuda.jit)
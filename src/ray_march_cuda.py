@@ -1,15 +1,46 @@
 import numpy as np
-from numba import cuda
+from numba import cuda, float32, uint8
 import math
 from typing import List, Tuple
 from src.distances import *
+from src.jit_variants import JitVariant
+from src.ray_marchobject import max_figure_params, instance_params
 
+#ways to calculate normals, index of mode is passed to the kernel
+normal_modes = ('central', 'tetrahedron', 'analytic')
+
+#objects closer than blend_distance to each other are smoothly blended
+blend_distance = 0.1
+
+#default march parameters, they are passed to the kernel packed by pack_march_params
 number_of_steps = 64
 min_hit_distance = 0.01
 max_trace_distance = 100
-background_color = np.array([0, 0, 0])
+background_color = np.array([0.0, 0.0, 0.0])
 
-@cuda.jit
+#ways to step along the ray: plain sphere tracing or over-relaxed one with hit epsilon growing with pixel footprint
+stepping_modes = ('sphere', 'enhanced')
+over_relaxation = 1.2
+#hit epsilon of enhanced stepping is this fraction of pixel size at the distance traveled, whole pixel blurs shading too much
+hit_pixel_fraction = 0.25
+
+#why the ray stopped, stored per pixel together with number of steps when march stats are recorded
+termination_reasons = ('hit', 'escaped', 'out_of_steps')
+march_hit = 0
+march_escaped = 1
+march_out_of_steps = 2
+
+def pack_march_params(number_of_steps: int = number_of_steps, min_hit_distance: float = min_hit_distance,
+                      max_trace_distance: float = max_trace_distance, background_color: np.ndarray = background_color,
+                      relaxation: float = 1.0, pixel_footprint: float = 0.0, dtype = np.float64) -> np.ndarray:
+    '''
+    Packs march parameters into array
+    [number_of_steps, min_hit_distance, max_trace_distance, r, g, b, relaxation, pixel_footprint] for the kernel
+    relaxation 1 and pixel_footprint 0 give plain sphere tracing
+    '''
+    return np.array([number_of_steps, min_hit_distance, max_trace_distance, *background_color, relaxation, pixel_footprint], dtype=dtype)
+
+@cuda.jit(device=True)
 def clamp(n: float, min: float, max: float) -> float:
     if n < min:
         return min
@@ -18,82 +49,410 @@ def clamp(n: float, min: float, max: float) -> float:
     else:
         return n
 
-@cuda.jit
+@cuda.jit(device=True)
 def mix(a: float, b: float, k: float) -> float:
-    return a * (1.0 - k) + b * k
+    return a * (real(1.0) - k) + b * k
 
-@cuda.jit
+@cuda.jit(device=True)
 def smin(a: float, b: float, k: float) -> float:
-    k *= 1.0 / (1.0 - math.sqrt(0.5))
-    h = max(k - abs(a - b), 0.0) / k
-    return min(a, b) - k * 0.5 * (1.0 + h - math.sqrt(1.0 - h * (h - 2.0)))
+    k *= real(1.0) / (real(1.0) - math.sqrt(real(0.5)))
+    h = max(k - abs(a - b), real(0.0)) / k
+    return min(a, b) - k * real(0.5) * (real(1.0) + h - math.sqrt(real(1.0) - h * (h - real(2.0))))
 
-@cuda.jit
+#Distances to objects encoded in rows of object buffer (see RayMarchObject.to_array)
+
+@cuda.jit(device=True)
+def distance_from_sphere_obj(pos_x: float, pos_y: float, pos_z: float, obj: List[float]) -> float:
+    return distance_from_sphere(pos_x, pos_y, pos_z, obj[4], obj[5], obj[6], obj[7], obj[8] * obj[9])
+
+@cuda.jit(device=True)
+def distance_from_fuzzy_sphere_obj(pos_x: float, pos_y: float, pos_z: float, obj: List[float]) -> float:
+    return distance_from_fuzzy_sphere(pos_x, pos_y, pos_z, obj[4], obj[5], obj[6], obj[7], obj[8], obj[9] * obj[12], obj[10]* obj[12], obj[11]* obj[12])
+
+@cuda.jit(device=True)
+def distance_from_box_obj(pos_x: float, pos_y: float, pos_z: float, obj: List[float]) -> float:
+    return distance_from_box(pos_x - obj[7], pos_y - obj[8], pos_z - obj[9], obj[4], obj[5], obj[6], obj[10], obj[11], obj[12], obj[13])
+
+@cuda.jit(device=True)
+def distance_from_round_box_obj(pos_x: float, pos_y: float, pos_z: float, obj: List[float]) -> float:
+    return distance_from_round_box(pos_x - obj[8], pos_y - obj[9], pos_z - obj[10], obj[5], obj[6], obj[7], obj[4])
+
+@cuda.jit(device=True)
+def distance_from_frame_box_obj(pos_x: float, pos_y: float, pos_z: float, obj: List[float]) -> float:
+    return distance_from_frame_box(pos_x - obj[8], pos_y - obj[9], pos_z - obj[10], obj[5], obj[6], obj[7], obj[4], obj[11], obj[12], obj[13], obj[14])
+
+@cuda.jit(device=True)
+def distance_from_torus_obj(pos_x: float, pos_y: float, pos_z: float, obj: List[float]) -> float:
+    return distance_from_torus(pos_x - obj[6], pos_y - obj[7], pos_z - obj[8], obj[4], obj[5])
+
+@cuda.jit(device=True)
+def distance_from_cylinder_obj(pos_x: float, pos_y: float, pos_z: float, obj: List[float]) -> float:
+    return distance_from_cylinder(pos_x - obj[6], pos_y - obj[7], pos_z - obj[8], obj[4], obj[5], obj[9], obj[10], obj[11], obj[12])
+
+@cuda.jit(device=True)
+def distance_from_cone_obj(pos_x: float, pos_y: float, pos_z: float, obj: List[float]) -> float:
+    return distance_from_cone(pos_x - obj[7], pos_y - obj[8], pos_z - obj[9], obj[5], obj[6], obj[4], obj[10], obj[11], obj[12], obj[13])
+
+@cuda.jit(device=True)
+def distance_from_planey_obj(pos_x: float, pos_y: float, pos_z: float, obj: List[float]) -> float:
+    return distance_from_planey(pos_x, pos_y, pos_z, obj[4])
+
+#names of functions above by object id, used to generate kernels specialised to the scene
+object_distances = {
+    0: 'distance_from_sphere_obj',
+    1: 'distance_from_fuzzy_sphere_obj',
+    2: 'distance_from_box_obj',
+    3: 'distance_from_round_box_obj',
+    4: 'distance_from_frame_box_obj',
+    5: 'distance_from_torus_obj',
+    6: 'distance_from_cylinder_obj',
+    7: 'distance_from_cone_obj',
+    8: 'distance_from_planey_obj',
+}
+
+#id of header row of static objects baked into brick map (see static_field.py),
+#it is the last object of the buffer, rows after it are the static objects and baked distances
+static_field_id = 9
+#id of group of instances of one prototype (see Instances), rows after it hold the prototype and the instances
+instances_id = 10
+#length of rows of object buffer, constant divisor lets flat reads compile to multiplication
+object_row_size = 4 + max_figure_params
+#half of the diagonal of unit cube, trilinear interpolation of distances is off by at most this part of the cell size
+half_diagonal = 0.8660254037844386
+
+@cuda.jit(device=True)
+def distance_from_object(pos_x: float, pos_y: float, pos_z: float, obj: List[float]) -> float:
+    """
+    Distance from the point pos_x, pos_y, pos_z to the object encoded in obj (see RayMarchObject.to_array)
+    """
+    if obj[0] == 0:
+        return distance_from_sphere_obj(pos_x, pos_y, pos_z, obj)
+    elif obj[0] == 1:
+        return distance_from_fuzzy_sphere_obj(pos_x, pos_y, pos_z, obj)
+    elif obj[0] == 8:
+        return distance_from_planey_obj(pos_x, pos_y, pos_z, obj)
+    elif obj[0] == 2:
+        return distance_from_box_obj(pos_x, pos_y, pos_z, obj)
+    elif obj[0] == 3:
+        return distance_from_round_box_obj(pos_x, pos_y, pos_z, obj)
+    elif obj[0] == 4:
+        return distance_from_frame_box_obj(pos_x, pos_y, pos_z, obj)
+    elif obj[0] == 5:
+        return distance_from_torus_obj(pos_x, pos_y, pos_z, obj)
+    elif obj[0] == 6:
+        return distance_from_cylinder_obj(pos_x, pos_y, pos_z, obj)
+    elif obj[0] == 7:
+        return distance_from_cone_obj(pos_x, pos_y, pos_z, obj)
+    return real(np.inf)
+
+@cuda.jit(device=True)
+def merge_closest_color(
+    closest_dist: float, r: float, g: float, b: float, closest_index: int, dist: float, obj_r: float, obj_g: float, obj_b: float, i: int
+) -> Tuple[float, float, float, float, int]:
+    """
+    Merges object i with distance dist and color obj_r, obj_g, obj_b into the closest object found so far.
+    Objects closer than blend_distance to the closest one are smoothly blended with it.
+    """
+    if abs(dist - closest_dist) < blend_distance:
+        closest_dist = smin(closest_dist, dist, real(0.01))
+        r = r #smin(r, obj_r, 0.1)
+        g = g #smin(g, obj_g, 0.1)
+        b = b #smin(b, obj_b, 0.1)
+    elif dist < closest_dist:
+        closest_dist = dist
+        r, g, b = obj_r, obj_g, obj_b
+        closest_index = i
+    return closest_dist, r, g, b, closest_index
+
+@cuda.jit(device=True)
+def merge_closest(
+    closest_dist: float, r: float, g: float, b: float, closest_index: int, dist: float, obj: List[float], i: int
+) -> Tuple[float, float, float, float, int]:
+    """
+    Merges object i encoded in obj with distance dist into the closest object found so far.
+    """
+    return merge_closest_color(closest_dist, r, g, b, closest_index, dist, obj[1], obj[2], obj[3], i)
+
+@cuda.jit(device=True)
+def merge_bound(
+    closest_dist: float, r: float, g: float, b: float, closest_index: int, bound: float, obj: List[float], i: int
+) -> Tuple[float, float, float, float, int]:
+    """
+    Merges lower bound of distance to object i encoded in obj into the closest object found so far without blending.
+    """
+    if bound < closest_dist:
+        return bound, obj[1], obj[2], obj[3], i
+    return closest_dist, r, g, b, closest_index
+
+@cuda.jit(device=True)
+def buffer_value(object_buffer: List[List[float]], index: int) -> float:
+    """
+    Value at index of object_buffer read as flat array
+    """
+    return object_buffer[index // object_row_size, index % object_row_size]
+
+@cuda.jit(device=True)
+def trilinear(
+    object_buffer: List[List[float]], offset: int, size_y: int, size_z: int, x: int, y: int, z: int, t_x: float, t_y: float, t_z: float
+) -> float:
+    """
+    Trilinear interpolation in cell x, y, z of grid of values stored in object_buffer from flat index offset,
+    grid has size_y * size_z values in every x slice, t_x, t_y, t_z is position inside the cell
+    """
+    corner = offset + (x * size_y + y) * size_z + z
+    c_00 = mix(buffer_value(object_buffer, corner), buffer_value(object_buffer, corner + 1), t_z)
+    c_01 = mix(buffer_value(object_buffer, corner + size_z), buffer_value(object_buffer, corner + size_z + 1), t_z)
+    corner += size_y * size_z
+    c_10 = mix(buffer_value(object_buffer, corner), buffer_value(object_buffer, corner + 1), t_z)
+    c_11 = mix(buffer_value(object_buffer, corner + size_z), buffer_value(object_buffer, corner + size_z + 1), t_z)
+    return mix(mix(c_00, c_01, t_y), mix(c_10, c_11, t_y), t_x)
+
+@cuda.jit(device=True)
+def static_field_distance(pos_x: float, pos_y: float, pos_z: float, object_buffer: List[List[float]], header_index: int) -> float:
+    """
+    Lower bound of distance to static objects baked into brick map with header in row header_index (see static_field.py).
+    Distance is interpolated in brick of fine cells if the coarse cell has one, otherwise in coarse grid,
+    and lowered by half of the diagonal of the cell, so it never overestimates. It is 0 outside of the baked region.
+    """
+    header = object_buffer[header_index]
+    cell_size = header[7]
+    x = (pos_x - header[4]) / cell_size
+    y = (pos_y - header[5]) / cell_size
+    z = (pos_z - header[6]) / cell_size
+    cells_x, cells_y, cells_z = int(header[8]), int(header[9]), int(header[10])
+    if x < 0 or y < 0 or z < 0 or x >= cells_x or y >= cells_y or z >= cells_z:
+        return real(0.0)
+    cell_x, cell_y, cell_z = int(x), int(y), int(z)
+    base = header_index * object_row_size
+    brick = int(buffer_value(object_buffer, base + int(header[15]) + (cell_x * cells_y + cell_y) * cells_z + cell_z))
+    if brick < 0:
+        return (trilinear(object_buffer, base + int(header[14]), cells_y + 1, cells_z + 1, cell_x, cell_y, cell_z, x - cell_x, y - cell_y, z - cell_z)
+                - cell_size * real(half_diagonal))
+
+    brick_cells = int(header[11])
+    size = brick_cells + 1
+    x = (x - cell_x) * brick_cells
+    y = (y - cell_y) * brick_cells
+    z = (z - cell_z) * brick_cells
+    voxel_x, voxel_y, voxel_z = min(int(x), brick_cells - 1), min(int(y), brick_cells - 1), min(int(z), brick_cells - 1)
+    return (trilinear(object_buffer, base + int(header[16]) + brick * size * size * size, size, size, voxel_x, voxel_y, voxel_z,
+                      x - voxel_x, y - voxel_y, z - voxel_z)
+            - cell_size / brick_cells * real(half_diagonal))
+
+@cuda.jit(device=True)
+def merge_static_field(
+    pos_x: float, pos_y: float, pos_z: float, object_buffer: List[List[float]], header_index: int,
+    closest_dist: float, r: float, g: float, b: float, closest_index: int
+) -> Tuple[float, float, float, float, int]:
+    """
+    Merges static objects baked into brick map with header in row header_index into the closest object found so far.
+    Far from static objects the baked distance is merged as one object, closer than exact distance of the header
+    (or outside of the baked region) static objects stored after the header are evaluated exactly,
+    so hits, colors and normals are the same as without the brick map.
+    """
+    header = object_buffer[header_index]
+    dist = static_field_distance(pos_x, pos_y, pos_z, object_buffer, header_index)
+    if dist >= header[12]:
+        return merge_closest(closest_dist, r, g, b, closest_index, dist, header, header_index)
+    i = header_index + 1
+    while i < header_index + 1 + int(header[13]):
+        closest_dist, r, g, b, closest_index, i = merge_object(pos_x, pos_y, pos_z, object_buffer, i, closest_dist, r, g, b, closest_index)
+    return closest_dist, r, g, b, closest_index
+
+@cuda.jit(device=True)
+def merge_instances(
+    pos_x: float, pos_y: float, pos_z: float, object_buffer: List[List[float]], header_index: int,
+    closest_dist: float, r: float, g: float, b: float, closest_index: int
+) -> Tuple[float, float, float, float, int]:
+    """
+    Merges instances of prototype with header in row header_index (see Instances) into the closest object found so far.
+    Only instances listed in the grid cell of the point are evaluated, the others are farther than margin plus distance
+    to the border of the cell (or to the grid outside of it), this bound is merged as the group itself.
+    Bound is not a surface, so it is never blended with objects and margin must be larger than hit epsilon (see check_instance_margins).
+    """
+    header = object_buffer[header_index]
+    prototype = object_buffer[header_index + 1]
+    cell_size = header[7]
+    margin = header[11]
+    x = (pos_x - header[4]) / cell_size
+    y = (pos_y - header[5]) / cell_size
+    z = (pos_z - header[6]) / cell_size
+    cells_x, cells_y, cells_z = int(header[8]), int(header[9]), int(header[10])
+    if x < 0 or y < 0 or z < 0 or x >= cells_x or y >= cells_y or z >= cells_z:
+        d_x = max(-x, x - cells_x, real(0))
+        d_y = max(-y, y - cells_y, real(0))
+        d_z = max(-z, z - cells_z, real(0))
+        bound = math.sqrt(d_x ** 2 + d_y ** 2 + d_z ** 2) * cell_size + margin
+        return merge_bound(closest_dist, r, g, b, closest_index, bound, header, header_index)
+
+    cell_x, cell_y, cell_z = int(x), int(y), int(z)
+    bound = min(x - cell_x, cell_x + 1 - x, y - cell_y, cell_y + 1 - y, z - cell_z, cell_z + 1 - z) * cell_size + margin
+    base = header_index * object_row_size
+    cell = base + int(header[14]) + (cell_x * cells_y + cell_y) * cells_z + cell_z
+    for k in range(int(buffer_value(object_buffer, cell)), int(buffer_value(object_buffer, cell + 1))):
+        instance = base + int(header[16]) + int(buffer_value(object_buffer, base + int(header[15]) + k)) * instance_params
+        scale = buffer_value(object_buffer, instance + 3)
+        dist = scale * distance_from_object((pos_x - buffer_value(object_buffer, instance)) / scale,
+                                            (pos_y - buffer_value(object_buffer, instance + 1)) / scale,
+                                            (pos_z - buffer_value(object_buffer, instance + 2)) / scale, prototype)
+        closest_dist, r, g, b, closest_index = merge_closest_color(closest_dist, r, g, b, closest_index, dist, buffer_value(object_buffer, instance + 4),
+                                                                   buffer_value(object_buffer, instance + 5), buffer_value(object_buffer, instance + 6),
+                                                                   header_index)
+    return merge_bound(closest_dist, r, g, b, closest_index, bound, header, header_index)
+
+@cuda.jit(device=True)
+def merge_object(
+    pos_x: float, pos_y: float, pos_z: float, object_buffer: List[List[float]], i: int,
+    closest_dist: float, r: float, g: float, b: float, closest_index: int
+) -> Tuple[float, float, float, float, int, int]:
+    """
+    Merges object in row i into the closest object found so far, returns also index of the row of the next object,
+    rows of data which follow group of instances are skipped
+    """
+    obj = object_buffer[i]
+    if obj[0] == instances_id:
+        closest_dist, r, g, b, closest_index = merge_instances(pos_x, pos_y, pos_z, object_buffer, i, closest_dist, r, g, b, closest_index)
+        return closest_dist, r, g, b, closest_index, i + 1 + int(obj[13])
+    dist = distance_from_object(pos_x, pos_y, pos_z, obj)
+    closest_dist, r, g, b, closest_index = merge_closest(closest_dist, r, g, b, closest_index, dist, obj, i)
+    return closest_dist, r, g, b, closest_index, i + 1
+
+@cuda.jit(device=True)
+def closest_in_range(
+    pos_x: float, pos_y: float, pos_z: float, object_buffer: List[List[float]], first: int, last: int,
+    closest_dist: float, r: float, g: float, b: float, closest_index: int
+) -> Tuple[float, float, float, float, int]:
+    """
+    Merges objects first..last of object_buffer into the closest object found so far.
+    Header of static field ends the objects, rows after it are read only by merge_static_field.
+    """
+    i = first
+    while i < last:
+        if object_buffer[i, 0] == static_field_id:
+            return merge_static_field(pos_x, pos_y, pos_z, object_buffer, i, closest_dist, r, g, b, closest_index)
+        closest_dist, r, g, b, closest_index, i = merge_object(pos_x, pos_y, pos_z, object_buffer, i, closest_dist, r, g, b, closest_index)
+
+    return closest_dist, r, g, b, closest_index
+
+@cuda.jit(device=True)
+def distance_to_bounds(pos_x: float, pos_y: float, pos_z: float, node: List[float]) -> float:
+    """
+    Distance from the point to axis aligned box of BVH node, it is 0 inside the box
+    """
+    d_x = max(node[0] - pos_x, pos_x - node[3], real(0))
+    d_y = max(node[1] - pos_y, pos_y - node[4], real(0))
+    d_z = max(node[2] - pos_z, pos_z - node[5], real(0))
+    return math.sqrt(d_x ** 2 + d_y ** 2 + d_z ** 2)
+
+@cuda.jit(device=True)
 def find_closest_obj(
-    pos_x: float, pos_y: float, pos_z: float, object_buffer: List[List[float]]
-) -> Tuple[float, float, float, float]:
+    pos_x: float, pos_y: float, pos_z: float, object_buffer: List[List[float]], bvh: List[List[float]]
+) -> Tuple[float, float, float, float, int]:
     """
     Function which iterates over all objects in object_buffer and finds the closest object to the point pos_x, pos_y, pos_z.
-    Returns distance to this object and its color.
+    If bvh is not empty (see bvh.py) only objects whose bounds are closer than the closest object are evaluated.
+    Returns distance to this object, its color and its index in object_buffer.
     """
-    closest_dist = np.inf
-    r, g, b = 0.0, 0.0, 0.0
+    closest_dist = real(np.inf)
+    r, g, b = real(0.0), real(0.0), real(0.0)
+    closest_index = -1
 
-    for obj in object_buffer:
-        if obj[0] == 0:
-            dist = distance_from_sphere(pos_x, pos_y, pos_z, obj[4], obj[5], obj[6], obj[7], obj[8] * obj[9])
-        elif obj[0] == 1:
-            dist = distance_from_fuzzy_sphere(pos_x, pos_y, pos_z, obj[4], obj[5], obj[6], obj[7], obj[8], obj[9] * obj[12], obj[10]* obj[12], obj[11]* obj[12])
-        elif obj[0] == 8:
-            dist = distance_from_planey(pos_x, pos_y, pos_z, obj[4])
-        elif obj[0] == 2:
-            dist = distance_from_box(pos_x - obj[7], pos_y - obj[8], pos_z - obj[9], obj[4], obj[5], obj[6], obj[10], obj[11], obj[12], obj[13])
-        elif obj[0] == 3:
-            dist = distance_from_round_box(pos_x - obj[8], pos_y - obj[9], pos_z - obj[10], obj[5], obj[6], obj[7], obj[4])
-        elif obj[0] == 4:
-            dist = distance_from_frame_box(pos_x - obj[8], pos_y - obj[9], pos_z - obj[10], obj[5], obj[6], obj[7], obj[4], obj[11], obj[12], obj[13], obj[14])
-        elif obj[0] == 5:
-            dist = distance_from_torus(pos_x - obj[6], pos_y - obj[7], pos_z - obj[8], obj[4], obj[5])
-        elif obj[0] == 6:
-            dist = distance_from_cylinder(pos_x - obj[6], pos_y - obj[7], pos_z - obj[8], obj[4], obj[5], obj[9], obj[10], obj[11], obj[12])
-        elif obj[0] == 7:
-            dist = distance_from_cone(pos_x - obj[7], pos_y - obj[8], pos_z - obj[9], obj[5], obj[6], obj[4], obj[10], obj[11], obj[12], obj[13])
-
-        if abs(dist - closest_dist) < 0.1:
-            closest_dist = smin(closest_dist, dist, 0.01)
-            r = r #smin(r, obj[1], 0.1)
-            g = g #smin(g, obj[2], 0.1)
-            b = b #smin(b, obj[3], 0.1)
-        elif dist < closest_dist:
-            closest_dist = dist
-            r, g, b = obj[1], obj[2], obj[3]
-
-    return closest_dist, r, g, b
+    if bvh.shape[0] == 0:
+        return closest_in_range(pos_x, pos_y, pos_z, object_buffer, 0, object_buffer.shape[0], closest_dist, r, g, b, closest_index)
 
-@cuda.jit
-def calculate_normal(
-    pos_x: float, pos_y: float, pos_z: float, object_buffer: List[List[float]]
+    node_index = 0
+    while node_index < bvh.shape[0]:
+        node = bvh[node_index]
+        if distance_to_bounds(pos_x, pos_y, pos_z, node) > closest_dist + real(blend_distance):
+            node_index = int(node[8])
+        elif node[7] > 0:
+            first = int(node[6])
+            closest_dist, r, g, b, closest_index = closest_in_range(pos_x, pos_y, pos_z, object_buffer, first, first + int(node[7]),
+                                                                   closest_dist, r, g, b, closest_index)
+            node_index = int(node[8])
+        else:
+            node_index += 1
+
+    return closest_dist, r, g, b, closest_index
+
+@cuda.jit(device=True)
+def central_normal(
+    pos_x: float, pos_y: float, pos_z: float, object_buffer: List[List[float]], bvh: List[List[float]]
 ) -> Tuple[float, float, float]:
     """
-    Function which calculates the normal to the object at the point pos_x, pos_y, pos_z.
+    Not normalized gradient of the scene distance from central differences, it takes 6 scene evaluations.
     """
-    eps = 0.01
+    eps = real(0.01)
     normal_x = (
-        find_closest_obj(pos_x + eps, pos_y, pos_z, object_buffer)[0]
-        - find_closest_obj(pos_x - eps, pos_y, pos_z, object_buffer)[0]
+        find_closest_obj(pos_x + eps, pos_y, pos_z, object_buffer, bvh)[0]
+        - find_closest_obj(pos_x - eps, pos_y, pos_z, object_buffer, bvh)[0]
     )
     normal_y = (
-        find_closest_obj(pos_x, pos_y + eps, pos_z, object_buffer)[0]
-        - find_closest_obj(pos_x, pos_y - eps, pos_z, object_buffer)[0]
+        find_closest_obj(pos_x, pos_y + eps, pos_z, object_buffer, bvh)[0]
+        - find_closest_obj(pos_x, pos_y - eps, pos_z, object_buffer, bvh)[0]
     )
     normal_z = (
-        find_closest_obj(pos_x, pos_y, pos_z + eps, object_buffer)[0]
-        - find_closest_obj(pos_x, pos_y, pos_z - eps, object_buffer)[0]
+        find_closest_obj(pos_x, pos_y, pos_z + eps, object_buffer, bvh)[0]
+        - find_closest_obj(pos_x, pos_y, pos_z - eps, object_buffer, bvh)[0]
     )
+    return normal_x, normal_y, normal_z
+
+@cuda.jit(device=True)
+def tetrahedron_normal(
+    pos_x: float, pos_y: float, pos_z: float, object_buffer: List[List[float]], bvh: List[List[float]]
+) -> Tuple[float, float, float]:
+    """
+    Not normalized gradient of the scene distance sampled in 4 vertices of tetrahedron
+    (https://iquilezles.org/articles/normalsSDF/), it takes 4 scene evaluations.
+    """
+    eps = real(0.01)
+    d_0 = find_closest_obj(pos_x + eps, pos_y - eps, pos_z - eps, object_buffer, bvh)[0]
+    d_1 = find_closest_obj(pos_x - eps, pos_y - eps, pos_z + eps, object_buffer, bvh)[0]
+    d_2 = find_closest_obj(pos_x - eps, pos_y + eps, pos_z - eps, object_buffer, bvh)[0]
+    d_3 = find_closest_obj(pos_x + eps, pos_y + eps, pos_z + eps, object_buffer, bvh)[0]
+    normal_x = d_0 - d_1 - d_2 + d_3
+    normal_y = -d_0 - d_1 + d_2 + d_3
+    normal_z = -d_0 + d_1 - d_2 + d_3
+    return normal_x, normal_y, normal_z
+
+@cuda.jit(device=True)
+def analytic_normal(
+    pos_x: float, pos_y: float, pos_z: float, object_buffer: List[List[float]], bvh: List[List[float]], hit_index: int
+) -> Tuple[float, float, float]:
+    """
+    Not normalized gradient of the hit object only, it is closed-form for sphere, plane, box and torus,
+    other objects fall back to tetrahedron_normal.
+    """
+    if hit_index >= 0:
+        obj = object_buffer[hit_index]
+        if obj[0] == 0:
+            return gradient_of_sphere(pos_x, pos_y, pos_z, obj[5], obj[6], obj[7], obj[8] * obj[9])
+        elif obj[0] == 8:
+            return gradient_of_planey(pos_x, pos_y, pos_z, obj[4])
+        elif obj[0] == 2:
+            return gradient_of_box(pos_x - obj[7], pos_y - obj[8], pos_z - obj[9], obj[4], obj[5], obj[6], obj[10], obj[11], obj[12], obj[13])
+        elif obj[0] == 5:
+            return gradient_of_torus(pos_x - obj[6], pos_y - obj[7], pos_z - obj[8], obj[4])
+    return tetrahedron_normal(pos_x, pos_y, pos_z, object_buffer, bvh)
+
+@cuda.jit(device=True)
+def calculate_normal(
+    pos_x: float, pos_y: float, pos_z: float, object_buffer: List[List[float]], bvh: List[List[float]], normal_mode: int, hit_index: int
+) -> Tuple[float, float, float]:
+    """
+    Function which calculates the normal to the object at the point pos_x, pos_y, pos_z.
+    normal_mode is index in normal_modes: central differences, tetrahedron or analytic gradient of the hit object.
+    """
+    if normal_mode == 1:
+        normal_x, normal_y, normal_z = tetrahedron_normal(pos_x, pos_y, pos_z, object_buffer, bvh)
+    elif normal_mode == 2:
+        normal_x, normal_y, normal_z = analytic_normal(pos_x, pos_y, pos_z, object_buffer, bvh, hit_index)
+    else:
+        normal_x, normal_y, normal_z = central_normal(pos_x, pos_y, pos_z, object_buffer, bvh)
 
     normal_norm = math.sqrt(normal_x ** 2 + normal_y ** 2 + normal_z ** 2)
     if normal_norm == 0:
-        normal_norm = 1
+        normal_norm = real(1)
 
     normal_x /= normal_norm
     normal_y /= normal_norm
@@ -101,56 +460,407 @@ def calculate_normal(
 
     return normal_x, normal_y, normal_z
 
-@cuda.jit
+@cuda.jit(device=True)
 def calculate_lighting(
-    pos_x: float, pos_y: float, pos_z: float, object_buffer: List[List[float]], light_pos_x: float, light_pos_y: float, light_pos_z: float
+    pos_x: float, pos_y: float, pos_z: float, object_buffer: List[List[float]], bvh: List[List[float]],
+    light_pos_x: float, light_pos_y: float, light_pos_z: float, normal_mode: int, hit_index: int
 ) -> float:
     """
     Calculate the lighting level at the point pos_x, pos_y, pos_z.
     """
-    normal_x, normal_y, normal_z = calculate_normal(pos_x, pos_y, pos_z, object_buffer)
+    normal_x, normal_y, normal_z = calculate_normal(pos_x, pos_y, pos_z, object_buffer, bvh, normal_mode, hit_index)
     light_dir_x = light_pos_x - pos_x
     light_dir_y = light_pos_y - pos_y
     light_dir_z = light_pos_z - pos_z
 
     light_dir_norm = math.sqrt(light_dir_x ** 2 + light_dir_y ** 2 + light_dir_z ** 2)
     if light_dir_norm == 0:
-        light_dir_norm = 1
+        light_dir_norm = real(1)
 
     light_dir_x /= light_dir_norm
     light_dir_y /= light_dir_norm
     light_dir_z /= light_dir_norm
 
-    return max(0.0, normal_x * light_dir_x + normal_y * light_dir_y + normal_z * light_dir_z)
+    return max(real(0.0), normal_x * light_dir_x + normal_y * light_dir_y + normal_z * light_dir_z)
+
+@cuda.jit(device=True)
+def get_ray_direction(x: int, y: int, pixel_width: int, pixel_height: int, projection_matrix: np.ndarray, lookAtMatrix: np.ndarray) -> Tuple[float, float, float]:
+    """
+    Calculates normalized direction of the ray from camera to the pixel x, y.
+    projection_matrix and lookAtMatrix are expected to be already inverted.
+    """
+    ndc_x = (real(2.0) * real(x)) / real(pixel_width) - real(1.0)
+    ndc_y = real(1.0) - (real(2.0) * real(y)) / real(pixel_height)
+    ndc_z = real(1)
+
+    #I hate my life
+    #direction = projection_matrix.dot(direction)
+    dir_x = projection_matrix[0,0] * ndc_x + projection_matrix[0,1] * ndc_y + projection_matrix[0,2] * ndc_z + projection_matrix[0,3]
+    dir_y = projection_matrix[1,0] * ndc_x + projection_matrix[1,1] * ndc_y + projection_matrix[1,2] * ndc_z + projection_matrix[1,3]
+    dir_z = projection_matrix[2,0] * ndc_x + projection_matrix[2,1] * ndc_y + projection_matrix[2,2] * ndc_z + projection_matrix[2,3]
+    dir_w = projection_matrix[3,0] * ndc_x + projection_matrix[3,1] * ndc_y + projection_matrix[3,2] * ndc_z + projection_matrix[3,3]
+
+    dir_x = dir_x / dir_w
+    dir_y = dir_y / dir_w
+    dir_z = dir_z / dir_w
+    dir_w = dir_w / dir_w
+
+    dir_z = real(1)
+    dir_w = real(0.0)
+
+
+    #direction = lookAtMatrix.dot(direction)
+    w_x = lookAtMatrix[0,0] * dir_x + lookAtMatrix[0,1] * dir_y + lookAtMatrix[0,2] * dir_z + lookAtMatrix[0,3] * dir_w
+    w_y = lookAtMatrix[1,0] * dir_x + lookAtMatrix[1,1] * dir_y + lookAtMatrix[1,2] * dir_z + lookAtMatrix[1,3] * dir_w
+    w_z = lookAtMatrix[2,0] * dir_x + lookAtMatrix[2,1] * dir_y + lookAtMatrix[2,2] * dir_z + lookAtMatrix[2,3] * dir_w
+    w_w = lookAtMatrix[3,0] * dir_x + lookAtMatrix[3,1] * dir_y + lookAtMatrix[3,2] * dir_z + lookAtMatrix[3,3] * dir_w
+
+
+    #direction has w = 0, so position of camera in the last column does not move it
+    dir_x = w_x
+    dir_y = w_y
+    dir_z = w_z
+
+    #np.linalg.norm(direction[:3])
+    dir_norm = real(0.0)
+    dir_norm += dir_x ** 2
+    dir_norm += dir_y ** 2
+    dir_norm += dir_z ** 2
+    dir_norm = math.sqrt(dir_norm)
+
+    #direction[:3] / dir_norm
+    if dir_norm == 0:
+        dir_norm = real(1)
+    dir_x = dir_x / dir_norm
+    dir_y = dir_y / dir_norm
+    dir_z = dir_z / dir_norm
+
+    return dir_x, dir_y, dir_z
+
+@cuda.jit(device=True)
+def march_ray(
+    origin_x: float, origin_y: float, origin_z: float, dir_x: float, dir_y: float, dir_z: float, object_buffer: List[List[float]],
+    bvh: List[List[float]], normal_mode: int, march_params: np.ndarray, start_distance: float
+) -> Tuple[float, float, float, int, int, float]:
+    """
+    Marches a single ray from origin + start_distance * dir in direction dir.
+    Returns color of the pixel, number of steps taken, termination reason (march_hit, march_escaped or march_out_of_steps)
+    and distance traveled.
+    Steps are distance to the closest object multiplied by relaxation, if the step overshoots
+    (spheres of unbounding distance around the last two positions do not overlap) ray goes back and continues without relaxation.
+    Hit epsilon is at least min_hit_distance and grows with distance traveled times pixel_footprint.
+    """
+    steps = int(march_params[0])
+    min_hit_distance = march_params[1]
+    max_trace_distance = march_params[2]
+    relaxation = march_params[6]
+    pixel_footprint = march_params[7]
+    total_distance_traveled = start_distance
+    step_length = real(0.0)
+    previous_dist = real(0.0)
+    for step in range(steps):
+        current_position_x = origin_x + total_distance_traveled * dir_x
+        current_position_y = origin_y + total_distance_traveled * dir_y
+        current_position_z = origin_z + total_distance_traveled * dir_z
+
+        cdist, color_r, color_g, color_b, hit_index = find_closest_obj(current_position_x, current_position_y, current_position_z, object_buffer, bvh)
+        overshoot = relaxation > real(1.0) and abs(cdist) + previous_dist < step_length
+        if overshoot:
+            #back to the last safe position, it is previous_dist from the previous one
+            step_length = previous_dist - step_length
+            relaxation = real(1.0)
+        else:
+            hit_distance = max(min_hit_distance, pixel_footprint * total_distance_traveled)
+            if cdist < hit_distance:
+                l = calculate_lighting(current_position_x, current_position_y, current_position_z, object_buffer, bvh, real(0), real(-5), real(0),
+                                       normal_mode, hit_index)
+                return color_r * l, color_g * l, color_b * l, step + 1, march_hit, total_distance_traveled
+            step_length = cdist * relaxation
+            previous_dist = abs(cdist)
+
+        if total_distance_traveled > max_trace_distance:
+            return march_params[3], march_params[4], march_params[5], step + 1, march_escaped, total_distance_traveled
+
+        total_distance_traveled += step_length
+
+    return march_params[3], march_params[4], march_params[5], steps, march_out_of_steps, total_distance_traveled
+
+@cuda.jit(device=True)
+def render_pixel(
+    result: np.ndarray, march_stats: np.ndarray, start_depths: np.ndarray, hit_depths: np.ndarray, x: int, y: int,
+    origin_x: float, origin_y: float, origin_z: float, camera_matrices: np.ndarray, object_buffer: List[List[float]], bvh: np.ndarray,
+    normal_mode: int, march_params: np.ndarray
+) -> None:
+    """
+    Marches ray of pixel x, y and stores its color, optional outputs are skipped when their arrays are empty
+    """
+    dir_x, dir_y, dir_z = get_ray_direction(x, y, result.shape[0], result.shape[1], camera_matrices[0], camera_matrices[1])
+    start_distance = real(0.0)
+    if start_depths.shape[0] > 0:
+        start_distance = start_depths[x, y]
+    color_r, color_g, color_b, steps, reason, distance = march_ray(origin_x, origin_y, origin_z, dir_x, dir_y, dir_z, object_buffer, bvh,
+                                                                   normal_mode, march_params, start_distance)
+    result[x, y, 0] = color_r
+    result[x, y, 1] = color_g
+    result[x, y, 2] = color_b
+    if march_stats.shape[0] > 0:
+        march_stats[x, y, 0] = steps
+        march_stats[x, y, 1] = reason
+    if hit_depths.shape[0] > 0:
+        #ray which ran out of steps would get new budget if it started where it stopped
+        if reason == march_out_of_steps:
+            distance = real(0.0)
+        hit_depths[x, y] = distance
 
 @cuda.jit
 def ray_march_kernel(
-    result: np.ndarray, origin_x: float, origin_y: float, origin_z: float, directions: np.ndarray, object_buffer: List[List[float]]
+    result: np.ndarray, march_stats: np.ndarray, start_depths: np.ndarray, hit_depths: np.ndarray, dirty_pixels: np.ndarray,
+    origin_x: float, origin_y: float, origin_z: float, camera_matrices: np.ndarray, object_buffer: List[List[float]], bvh: np.ndarray,
+    normal_mode: int, march_params: np.ndarray
 ) -> None:
+    """
+    Renders every pixel of result, rays are generated from camera_matrices
+    which holds inverted projection and lookAt matrices
+    if march_stats is not empty number of steps and termination reason of every pixel are stored in it
+    if start_depths is not empty rays start at given distance from camera (see cone_march_kernel and reproject_kernel)
+    if hit_depths is not empty distance where every ray stopped is stored in it
+    if dirty_pixels is not empty only pixels marked in it are rendered (see dirty_tiles_kernel)
+    """
     x, y = cuda.grid(2)
-    total_distance_traveled = 0.0
-    bump_obj = 0
-    if x < result.shape[0] and y < result.shape[1]:
-        for _ in range(number_of_steps):
-            current_position_x = origin_x + total_distance_traveled * directions[x, y, 0]
-            current_position_y = origin_y + total_distance_traveled * directions[x, y, 1]
-            current_position_z = origin_z + total_distance_traveled * directions[x, y, 2]
-
-            cdist, color_r, color_g, color_b = find_closest_obj(current_position_x, current_position_y, current_position_z, object_buffer)
-            if cdist < min_hit_distance:
-                l = calculate_lighting(current_position_x, current_position_y, current_position_z, object_buffer, 0, -5, 0)
-                result[x, y, 0] = color_r * l
-                result[x, y, 1] = color_g * l
-                result[x, y, 2] = color_b * l
-                bump_obj = 1
-                break
-
-            if total_distance_traveled > max_trace_distance:
-                break
-
-            total_distance_traveled += cdist
-
-        if bump_obj == 0:
-            result[x, y, 0] = background_color[0]
-            result[x, y, 1] = background_color[1]
-            result[x, y, 2] = background_color[2]
+    if x < result.shape[0] and y < result.shape[1] and (dirty_pixels.shape[0] == 0 or dirty_pixels[x, y]):
+        render_pixel(result, march_stats, start_depths, hit_depths, x, y, origin_x, origin_y, origin_z, camera_matrices, object_buffer, bvh,
+                     normal_mode, march_params)
+
+@cuda.jit(device=True)
+def cone_march(
+    origin_x: float, origin_y: float, origin_z: float, axis_x: float, axis_y: float, axis_z: float, tan_angle: float,
+    object_buffer: List[List[float]], bvh: np.ndarray, march_params: np.ndarray
+) -> float:
+    """
+    Marches cone with apex in origin and returns distance to which all rays inside the cone can skip.
+    Ball of radius d - hit epsilon around the point at distance t on the axis holds no point closer than hit epsilon to objects
+    and it covers the whole cone between t and (t + d - hit epsilon) / (1 + tan_angle), so the cone is empty up to returned distance.
+    """
+    steps = int(march_params[0])
+    min_hit_distance = march_params[1]
+    max_trace_distance = march_params[2]
+    pixel_footprint = march_params[7]
+    t = real(0.0)
+    for _ in range(steps):
+        dist, _r, _g, _b, _index = find_closest_obj(origin_x + t * axis_x, origin_y + t * axis_y, origin_z + t * axis_z, object_buffer, bvh)
+        #hit epsilon of the rays grows with distance, so it is taken at the farthest point the ball can reach
+        safe_dist = dist - max(min_hit_distance, pixel_footprint * (t + dist))
+        next_t = (t + safe_dist) / (real(1.0) + tan_angle)
+        if next_t <= t:
+            break
+        t = next_t
+        if t > max_trace_distance:
+            break
+    return t
+
+@cuda.jit(device=True)
+def cone_march_tile(
+    start_depths: np.ndarray, tile_x: int, tile_y: int, tile_size: int, origin_x: float, origin_y: float, origin_z: float,
+    camera_matrices: np.ndarray, object_buffer: List[List[float]], bvh: np.ndarray, march_params: np.ndarray
+) -> None:
+    """
+    Stores safe start depth for all pixels of the tile, the cone contains rays of the corner pixels and so rays of all its pixels
+    """
+    pixel_width = start_depths.shape[0]
+    pixel_height = start_depths.shape[1]
+    first_x = tile_x * tile_size
+    first_y = tile_y * tile_size
+    last_x = min(first_x + tile_size, pixel_width) - 1
+    last_y = min(first_y + tile_size, pixel_height) - 1
+
+    a_x, a_y, a_z = get_ray_direction(first_x, first_y, pixel_width, pixel_height, camera_matrices[0], camera_matrices[1])
+    b_x, b_y, b_z = get_ray_direction(last_x, first_y, pixel_width, pixel_height, camera_matrices[0], camera_matrices[1])
+    c_x, c_y, c_z = get_ray_direction(first_x, last_y, pixel_width, pixel_height, camera_matrices[0], camera_matrices[1])
+    d_x, d_y, d_z = get_ray_direction(last_x, last_y, pixel_width, pixel_height, camera_matrices[0], camera_matrices[1])
+    axis_x = a_x + b_x + c_x + d_x
+    axis_y = a_y + b_y + c_y + d_y
+    axis_z = a_z + b_z + c_z + d_z
+    length = math.sqrt(axis_x * axis_x + axis_y * axis_y + axis_z * axis_z)
+    axis_x, axis_y, axis_z = axis_x / length, axis_y / length, axis_z / length
+
+    #smallest cosine between the axis and corner rays, a bit wider cone covers rounding errors
+    cos_angle = min(min(a_x * axis_x + a_y * axis_y + a_z * axis_z, b_x * axis_x + b_y * axis_y + b_z * axis_z),
+                    min(c_x * axis_x + c_y * axis_y + c_z * axis_z, d_x * axis_x + d_y * axis_y + d_z * axis_z))
+    cos_angle = clamp(cos_angle, real(1e-3), real(1.0))
+    tan_angle = math.sqrt(real(1.0) - cos_angle * cos_angle) / cos_angle + real(1e-4)
+
+    depth = cone_march(origin_x, origin_y, origin_z, axis_x, axis_y, axis_z, tan_angle, object_buffer, bvh, march_params)
+    for x in range(first_x, last_x + 1):
+        for y in range(first_y, last_y + 1):
+            start_depths[x, y] = depth
+
+@cuda.jit
+def cone_march_kernel(
+    start_depths: np.ndarray, tile_size: int, origin_x: float, origin_y: float, origin_z: float, camera_matrices: np.ndarray,
+    object_buffer: List[List[float]], bvh: np.ndarray, march_params: np.ndarray
+) -> None:
+    """
+    Depth prepass, one cone is marched for every tile_size x tile_size tile of pixels
+    """
+    tile_x, tile_y = cuda.grid(2)
+    if tile_x * tile_size < start_depths.shape[0] and tile_y * tile_size < start_depths.shape[1]:
+        cone_march_tile(start_depths, tile_x, tile_y, tile_size, origin_x, origin_y, origin_z, camera_matrices, object_buffer, bvh, march_params)
+
+@cuda.jit(device=True)
+def distance_to_box(origin_x: float, origin_y: float, origin_z: float, dir_x: float, dir_y: float, dir_z: float, box: np.ndarray) -> float:
+    """
+    Distance along the ray to the first point inside box [min_x, min_y, min_z, max_x, max_y, max_z], inf if ray misses it
+    """
+    near = real(0.0)
+    far = real(np.inf)
+    for axis in range(3):
+        origin = origin_x if axis == 0 else (origin_y if axis == 1 else origin_z)
+        direction = dir_x if axis == 0 else (dir_y if axis == 1 else dir_z)
+        low = box[axis]
+        high = box[axis + 3]
+        if direction == 0:
+            if origin < low or origin > high:
+                return real(np.inf)
+        else:
+            t_low = (low - origin) / direction
+            t_high = (high - origin) / direction
+            near = max(near, min(t_low, t_high))
+            far = min(far, max(t_low, t_high))
+    if near > far:
+        return real(np.inf)
+    return near
+
+@cuda.jit(device=True)
+def reproject_pixel(
+    start_depths: np.ndarray, hit_depths: np.ndarray, x: int, y: int, changed_boxes: np.ndarray,
+    origin_x: float, origin_y: float, origin_z: float, camera_matrices: np.ndarray, keep_start: bool
+) -> None:
+    """
+    Start depth of the pixel is the depth where its ray stopped in previous frame
+    or the distance to the first box where objects changed if the ray goes through it earlier.
+    With keep_start start depth is maximum with the depth already stored (from depth prepass), both are safe.
+    """
+    dir_x, dir_y, dir_z = get_ray_direction(x, y, start_depths.shape[0], start_depths.shape[1], camera_matrices[0], camera_matrices[1])
+    depth = hit_depths[x, y]
+    for i in range(changed_boxes.shape[0]):
+        depth = min(depth, distance_to_box(origin_x, origin_y, origin_z, dir_x, dir_y, dir_z, changed_boxes[i]))
+    if keep_start:
+        depth = max(depth, start_depths[x, y])
+    start_depths[x, y] = depth
+
+@cuda.jit
+def reproject_kernel(
+    start_depths: np.ndarray, hit_depths: np.ndarray, changed_boxes: np.ndarray, origin_x: float, origin_y: float, origin_z: float,
+    camera_matrices: np.ndarray, keep_start: bool
+) -> None:
+    """
+    Temporal reprojection for static camera, start depths of the next frame are derived from hit depths of the previous one
+    """
+    x, y = cuda.grid(2)
+    if x < start_depths.shape[0] and y < start_depths.shape[1]:
+        reproject_pixel(start_depths, hit_depths, x, y, changed_boxes, origin_x, origin_y, origin_z, camera_matrices, keep_start)
+
+@cuda.jit(device=True)
+def mark_dirty_tile(
+    dirty_pixels: np.ndarray, tile_x: int, tile_y: int, tile_size: int, changed_boxes: np.ndarray,
+    origin_x: float, origin_y: float, origin_z: float, camera_matrices: np.ndarray
+) -> None:
+    """
+    Marks all pixels of the tile as dirty if ray of any of its pixels goes through any of changed boxes
+    """
+    pixel_width = dirty_pixels.shape[0]
+    pixel_height = dirty_pixels.shape[1]
+    first_x = tile_x * tile_size
+    first_y = tile_y * tile_size
+    last_x = min(first_x + tile_size, pixel_width)
+    last_y = min(first_y + tile_size, pixel_height)
+    dirty = False
+    for x in range(first_x, last_x):
+        for y in range(first_y, last_y):
+            if not dirty:
+                dir_x, dir_y, dir_z = get_ray_direction(x, y, pixel_width, pixel_height, camera_matrices[0], camera_matrices[1])
+                for i in range(changed_boxes.shape[0]):
+                    if distance_to_box(origin_x, origin_y, origin_z, dir_x, dir_y, dir_z, changed_boxes[i]) < real(np.inf):
+                        dirty = True
+    for x in range(first_x, last_x):
+        for y in range(first_y, last_y):
+            dirty_pixels[x, y] = dirty
+
+@cuda.jit
+def dirty_tiles_kernel(
+    dirty_pixels: np.ndarray, tile_size: int, changed_boxes: np.ndarray, origin_x: float, origin_y: float, origin_z: float,
+    camera_matrices: np.ndarray
+) -> None:
+    """
+    Finds tiles of tile_size x tile_size pixels which have to be rendered again because objects in front of them changed
+    """
+    tile_x, tile_y = cuda.grid(2)
+    if tile_x * tile_size < dirty_pixels.shape[0] and tile_y * tile_size < dirty_pixels.shape[1]:
+        mark_dirty_tile(dirty_pixels, tile_x, tile_y, tile_size, changed_boxes, origin_x, origin_y, origin_z, camera_matrices)
+
+@cuda.jit(device=True)
+def refine_block(
+    result: np.ndarray, march_stats: np.ndarray, start_depths: np.ndarray, block_x: int, block_y: int, step: int, previous_step: int,
+    origin_x: float, origin_y: float, origin_z: float, camera_matrices: np.ndarray, object_buffer: List[List[float]], bvh: np.ndarray,
+    normal_mode: int, march_params: np.ndarray
+) -> None:
+    """
+    Renders corner pixel of block of step x step pixels and fills the whole block with its color
+    corner which was already rendered by previous pass with previous_step (0 for the first pass) is only reused
+    """
+    x = block_x * step
+    y = block_y * step
+    if previous_step == 0 or x % previous_step != 0 or y % previous_step != 0:
+        render_pixel(result, march_stats, start_depths, start_depths, x, y, origin_x, origin_y, origin_z, camera_matrices, object_buffer, bvh,
+                     normal_mode, march_params)
+    for i in range(x, min(x + step, result.shape[0])):
+        for j in range(y, min(y + step, result.shape[1])):
+            result[i, j, 0] = result[x, y, 0]
+            result[i, j, 1] = result[x, y, 1]
+            result[i, j, 2] = result[x, y, 2]
+
+@cuda.jit
+def progressive_kernel(
+    result: np.ndarray, march_stats: np.ndarray, start_depths: np.ndarray, step: int, previous_step: int,
+    origin_x: float, origin_y: float, origin_z: float, camera_matrices: np.ndarray, object_buffer: List[List[float]], bvh: np.ndarray,
+    normal_mode: int, march_params: np.ndarray
+) -> None:
+    """
+    One pass of progressive rendering, every pixel of result gets color of the nearest rendered pixel on grid of step
+    pixels on grid of previous_step are kept from previous pass, march_stats and start_depths must be empty
+    """
+    block_x, block_y = cuda.grid(2)
+    if block_x * step < result.shape[0] and block_y * step < result.shape[1]:
+        refine_block(result, march_stats, start_depths, block_x, block_y, step, previous_step, origin_x, origin_y, origin_z, camera_matrices,
+                     object_buffer, bvh, normal_mode, march_params)
+
+@cuda.jit(device=True)
+def render_frame_pixel(
+    results: np.ndarray, frame: int, x: int, y: int, origin_x: float, origin_y: float, origin_z: float, camera_matrices: np.ndarray,
+    frame_buffers: np.ndarray, bvh: np.ndarray, normal_mode: int, march_params: np.ndarray
+) -> None:
+    """
+    Renders pixel x, y of frame with its own object buffer, color is stored as uint8 like in get_window_content
+    """
+    dir_x, dir_y, dir_z = get_ray_direction(x, y, results.shape[1], results.shape[2], camera_matrices[0], camera_matrices[1])
+    color_r, color_g, color_b, _steps, _reason, _distance = march_ray(origin_x, origin_y, origin_z, dir_x, dir_y, dir_z, frame_buffers[frame],
+                                                                      bvh, normal_mode, march_params, real(0.0))
+    results[frame, x, y, 0] = uint8(clamp(color_r * real(255), real(0), real(255)))
+    results[frame, x, y, 1] = uint8(clamp(color_g * real(255), real(0), real(255)))
+    results[frame, x, y, 2] = uint8(clamp(color_b * real(255), real(0), real(255)))
+
+@cuda.jit
+def ray_march_frames_kernel(
+    results: np.ndarray, origin_x: float, origin_y: float, origin_z: float, camera_matrices: np.ndarray, frame_buffers: np.ndarray,
+    bvh: np.ndarray, normal_mode: int, march_params: np.ndarray
+) -> None:
+    """
+    Renders frames [frames, pixel_width, pixel_height, 3] in one launch, frame_buffers holds object buffer of every frame
+    """
+    x, y, frame = cuda.grid(3)
+    if x < results.shape[1] and y < results.shape[2] and frame < results.shape[0]:
+        render_frame_pixel(results, frame, x, y, origin_x, origin_y, origin_z, camera_matrices, frame_buffers, bvh, normal_mode, march_params)
+
+cuda_variants = {
+    np.dtype(np.float32): JitVariant(cuda.jit(device=True), real=float32),
+}
@@ -1,9 +1,17 @@
 from abc import ABC, abstractmethod
 import numpy as np
 import src.distances as distances
-from typing import Union
+import zlib
+from typing import List, Union, Optional, Tuple
+
+Bounds = Tuple[np.ndarray, np.ndarray]
 
 class RayMarchObject(ABC):
+    #objects marked static are baked into brick map when camera has static field (see static_field.py)
+    static = False
+    #objects with payload have rows of data right after their row in object buffer (see to_payload)
+    has_payload = False
+
     @abstractmethod
     def get_color(self) -> np.ndarray:
         pass
@@ -12,7 +20,57 @@ class RayMarchObject(ABC):
     def to_array(self) -> np.ndarray:
         pass
 
+    def get_bounds(self) -> Optional[Bounds]:
+        '''
+        Conservative axis aligned bounding box (min corner, max corner) of the object
+        None means that object is unbounded and must be always evaluated
+        '''
+        return None
+
+    def to_payload(self) -> np.ndarray:
+        '''
+        Rows [n, 4 + max_figure_params] which follow the row of the object in object buffer, kernel skips them
+        when it goes over objects, so only the object itself reads them
+        '''
+        return np.zeros((0, 4 + max_figure_params))
+
+    def __setattr__(self, name: str, value) -> None:
+        '''
+        Objects added to Scene tell it when they change, so it repacks only their rows (see scene.py)
+        '''
+        super().__setattr__(name, value)
+        scene = self.__dict__.get('_scene')
+        if scene is not None and not name.startswith('_'):
+            scene.mark_changed(self)
+
 max_figure_params = 14
+#every instance of Instances is stored as [x, y, z, scale, r, g, b]
+instance_params = 7
+#limit of number of grid cells of Instances, larger grids get larger cells
+max_instance_cells = 2**20
+
+def ball_bounds(center: np.ndarray, radius: float) -> Bounds:
+    center = np.asarray(center, dtype=np.float64)
+    return center - radius, center + radius
+
+def rotated_bounds(center: np.ndarray, half_sides: np.ndarray, rotation_dir: np.ndarray, rotation_angle: float) -> Optional[Bounds]:
+    '''
+    Bounds of object which fits in box with half_sides before rotation.
+    Rotated box is bounded by extents of its rotated axes (for rotation by angle and by -angle, so the direction of rotation does not matter),
+    rotation with not unit axis is not rigid so such objects are unbounded
+    '''
+    half_sides = np.abs(np.asarray(half_sides, dtype=np.float64))
+    center = np.asarray(center, dtype=np.float64)
+    if rotation_angle == 0:
+        return center - half_sides, center + half_sides
+    if not np.isclose(np.linalg.norm(rotation_dir), 1):
+        return None
+    k = np.asarray(rotation_dir, dtype=np.float64)
+    angle = np.radians(rotation_angle)
+    cross = np.array([[0, -k[2], k[1]], [k[2], 0, -k[0]], [-k[1], k[0], 0]])
+    rotation = np.cos(angle) * np.eye(3) + (1 - np.cos(angle)) * np.outer(k, k) + np.sin(angle) * cross
+    extents = np.maximum(np.abs(rotation) @ half_sides, np.abs(rotation.T) @ half_sides)
+    return center - extents, center + extents
 
 class Sphere(RayMarchObject):
     def __init__(self, center: np.ndarray, radius: float, color: np.ndarray = np.array([1,0,0]), multipy: int = 0, multipy_dist: int = 5):
@@ -37,7 +95,11 @@ class Sphere(RayMarchObject):
         res[8] = self.multipy
         res[9] = self.multipy_dist
         return res
-    
+
+    def get_bounds(self) -> Optional[Bounds]:
+        if self.multipy != 0:
+            return None
+        return ball_bounds(self.center, self.radius)
 
 class FuzzySphere(RayMarchObject):
     def __init__(self, center: np.ndarray, radius: float, color: np.ndarray = np.array([1,0,0]), multipy_x: int = 0, multipy_y: int = 0, multipy_z: int = 0, multipy_dist: int = 5):
@@ -67,12 +129,22 @@ class FuzzySphere(RayMarchObject):
         res[11] = self.multipy_z
         res[12] = self.multipy_dist
         return res
-    
-class PlaneY:
+
+    def get_bounds(self) -> Optional[Bounds]:
+        if self.multipy_x != 0 or self.multipy_y != 0 or self.multipy_z != 0:
+            return None
+        #displacement changes radius by at most 0.25 * radius
+        return ball_bounds(self.center, 1.25 * self.radius)
+
+class PlaneY(RayMarchObject):
     def __init__(self, y: float, color: np.ndarray = np.array([0,1,0])):
         self.id = 8
         self.y = y
         self.color = color
+
+    @property
+    def get_color(self) -> np.ndarray:
+        return self.color
     
     def to_array(self) -> np.ndarray:
         # every sphere encoded with [id, color_r, color_g, color_b, y]
@@ -82,6 +154,9 @@ class PlaneY:
         res[4] = self.y
         return res
 
+    def get_bounds(self) -> Optional[Bounds]:
+        return None
+
 class Box(RayMarchObject):
     def __init__(self, center: np.ndarray, half_sides: np.ndarray, rotation_dir: np.ndarray = np.array([0,0,0]), rotation_angle: float = 0, color: np.ndarray = np.array([1,0,0])):
         self.id = 2
@@ -105,6 +180,9 @@ class Box(RayMarchObject):
         res[13] = self.rotation_angle
         return res
 
+    def get_bounds(self) -> Optional[Bounds]:
+        return rotated_bounds(self.center, self.half_sides, self.rotation_dir, self.rotation_angle)
+
 class RoundBox(RayMarchObject):
     def __init__(self, center: np.ndarray, half_sides: np.ndarray, rounding: float, color: np.ndarray = np.array([1,0,0]), rotation_dir: np.ndarray = np.array([0,0,0]), rotation_angle: float = 0):
         self.id = 3
@@ -130,6 +208,10 @@ class RoundBox(RayMarchObject):
         res[14] = self.rotation_angle
         return res
 
+    def get_bounds(self) -> Optional[Bounds]:
+        #round box is rendered without rotation
+        return rotated_bounds(self.center, self.half_sides, self.rotation_dir, 0)
+
 class FrameBox(RayMarchObject):
     def __init__(self, center: np.ndarray, half_sides: np.ndarray, thickness: float, color: np.ndarray = np.array([1,0,0]), rotation_dir: np.ndarray = np.array([0,0,0]), rotation_angle: float = 0):
         self.id = 4
@@ -154,6 +236,9 @@ class FrameBox(RayMarchObject):
         res[14] = self.rotation_angle
         return res
 
+    def get_bounds(self) -> Optional[Bounds]:
+        return rotated_bounds(self.center, self.half_sides, self.rotation_dir, self.rotation_angle)
+
 class Torus(RayMarchObject):
     def __init__(self, center: np.ndarray, radi: np.ndarray = np.array([1,1]), color: np.ndarray = np.array([1,0,0])):
         self.id = 5
@@ -172,6 +257,10 @@ class Torus(RayMarchObject):
         res[6:9] = self.center
         return res
 
+    def get_bounds(self) -> Optional[Bounds]:
+        big_radius, small_radius = np.abs(self.radi[0]), np.abs(self.radi[1])
+        return rotated_bounds(self.center, np.array([big_radius + small_radius, small_radius, big_radius + small_radius]), np.zeros(3), 0)
+
 class Cylinder(RayMarchObject):
     def __init__(self, center: np.ndarray, radius: float, height: float, color: np.ndarray = np.array([1,0,0]), rotation_dir: np.ndarray = np.array([0,0,0]), rotation_angle: float = 0):
         self.id = 6
@@ -196,6 +285,11 @@ class Cylinder(RayMarchObject):
         res[12] = self.rotation_angle
         return res
 
+    def get_bounds(self) -> Optional[Bounds]:
+        #ball around both radius and height, so it does not depend on the order they are passed to distance_from_cylinder
+        size = np.hypot(self.radius, self.height)
+        return rotated_bounds(self.center, np.array([size, size, size]), self.rotation_dir, self.rotation_angle)
+
 class Cone(RayMarchObject):
     def __init__(self, center: np.ndarray, c: np.ndarray, height: float, color: np.ndarray = np.array([1,0,0]), rotation_dir: np.ndarray = np.array([0,0,0]), rotation_angle: float = 0):
         self.id = 7
@@ -219,3 +313,158 @@ class Cone(RayMarchObject):
         res[10:13] = self.rotation_dir
         res[13] = self.rotation_angle
         return res
+
+    def get_bounds(self) -> Optional[Bounds]:
+        #apex is in the center, base is at height below it
+        base_radius = abs(self.height * self.c[0] / self.c[1])
+        size = np.hypot(self.height, base_radius)
+        return rotated_bounds(self.center, np.array([size, size, size]), self.rotation_dir, self.rotation_angle)
+
+class Instances(RayMarchObject):
+    '''
+    Many copies of one prototype object: instance i is prototype scaled by scales[i] and moved by offsets[i]
+    (so prototype is usually placed at origin) with colors[i] or color of prototype if colors are None.
+    Instances are put into uniform grid of cells of cell_size (by default size of the largest instance),
+    kernel evaluates only instances whose bounds grown by margin overlap the cell of the point,
+    the others are farther than margin plus distance to the border of the cell.
+    Whole group takes one row in object buffer followed by payload with prototype, grid and instances.
+    '''
+    has_payload = True
+
+    def __init__(self, prototype: RayMarchObject, offsets: np.ndarray, scales: np.ndarray = None, colors: np.ndarray = None,
+                 cell_size: float = None, margin: float = 0.25):
+        if isinstance(prototype, Instances):
+            raise ValueError("Prototype of instances can not be Instances")
+        if prototype.get_bounds() is None:
+            raise ValueError("Prototype of instances must be bounded (see RayMarchObject.get_bounds)")
+        offsets = np.asarray(offsets, dtype=np.float64).reshape(-1, 3)
+        if len(offsets) == 0:
+            raise ValueError("Instances need at least one offset")
+        if scales is not None and (np.shape(scales) != (len(offsets),) or np.any(np.asarray(scales) <= 0)):
+            raise ValueError(f"scales must be {len(offsets)} positive numbers")
+        if colors is not None and np.shape(colors) != (len(offsets), 3):
+            raise ValueError(f"colors must have shape ({len(offsets)}, 3), got {np.shape(colors)}")
+        if cell_size is not None and cell_size <= 0:
+            raise ValueError(f"cell_size must be positive, got {cell_size}")
+        #bound of not evaluated instances must be larger than hit epsilon, it is checked against march parameters when rendering
+        if margin <= 0:
+            raise ValueError(f"margin must be positive, got {margin}")
+        self.id = 10
+        self.prototype = prototype
+        self.offsets = offsets
+        self.scales = scales
+        self.colors = colors
+        self.cell_size = cell_size
+        self.margin = margin
+        #packed rows are built again only when some input changed
+        self._packed_inputs = None
+        self._packed = None
+
+    @classmethod
+    def grid(cls, prototype: RayMarchObject, counts: tuple, spacing: np.ndarray, origin: np.ndarray = np.zeros(3), **params) -> 'Instances':
+        '''
+        Finite repetition of prototype on grid of counts[0] x counts[1] x counts[2] points spacing apart from origin
+        '''
+        points = np.stack(np.meshgrid(*[np.arange(count) for count in counts], indexing='ij'), axis=-1).reshape(-1, 3)
+        return cls(prototype, np.asarray(origin, dtype=np.float64) + points * np.asarray(spacing, dtype=np.float64), **params)
+
+    def get_color(self) -> np.ndarray:
+        return self.prototype.color
+
+    def instance_bounds(self) -> Bounds:
+        '''
+        Bounds of every instance, arrays [instances, 3] of min and max corners
+        '''
+        low, high = self.prototype.get_bounds()
+        scales = np.ones(len(self.offsets)) if self.scales is None else np.asarray(self.scales, dtype=np.float64)
+        return self.offsets + np.outer(scales, low), self.offsets + np.outer(scales, high)
+
+    def get_bounds(self) -> Optional[Bounds]:
+        low, high = self.instance_bounds()
+        return low.min(axis=0), high.max(axis=0)
+
+    def pack(self) -> Tuple[np.ndarray, np.ndarray]:
+        '''
+        Returns row of the group and its payload:
+        row is [id, r, g, b, min_x, min_y, min_z, cell_size, cells_x, cells_y, cells_z, margin, instances, payload rows,
+        cells offset, list offset, instances offset, checksum of inputs] with flat offsets relative to the row,
+        payload is row of prototype followed by flat data: start of list of every cell (and end of the last one),
+        lists of instances of cells and instances [x, y, z, scale, r, g, b]
+        '''
+        scales = np.ones(len(self.offsets)) if self.scales is None else np.asarray(self.scales, dtype=np.float64)
+        colors = np.tile(self.prototype.color, (len(self.offsets), 1)) if self.colors is None else self.colors
+        instances = np.column_stack([self.offsets, scales, colors]).astype(np.float64)
+        prototype = self.prototype.to_array()
+        inputs = np.concatenate([prototype, instances.ravel(), [self.cell_size or 0, self.margin]]).tobytes()
+        if inputs == self._packed_inputs:
+            return self._packed
+
+        low, high = self.instance_bounds()
+        low, high = low - self.margin, high + self.margin
+        grid_min = low.min(axis=0)
+        grid_size = high.max(axis=0) - grid_min
+        cell_size = self.cell_size or float(np.max(high - low))
+        cells = np.maximum(1, np.ceil(grid_size / cell_size)).astype(np.int64)
+        if np.prod(cells) > max_instance_cells:
+            cell_size *= (np.prod(cells) / max_instance_cells) ** (1 / 3)
+            cells = np.maximum(1, np.ceil(grid_size / cell_size)).astype(np.int64)
+        first = np.clip(np.floor((low - grid_min) / cell_size).astype(np.int64), 0, cells - 1)
+        sizes = np.clip(np.floor((high - grid_min) / cell_size).astype(np.int64), 0, cells - 1) - first + 1
+
+        #every instance is listed in every cell its grown bounds overlap
+        counts = np.prod(sizes, axis=1)
+        instance = np.repeat(np.arange(len(instances)), counts)
+        local = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        size_y, size_z = sizes[instance, 1], sizes[instance, 2]
+        cell_x = first[instance, 0] + local // (size_y * size_z)
+        cell_y = first[instance, 1] + local // size_z % size_y
+        cell_z = first[instance, 2] + local % size_z
+        cell = (cell_x * cells[1] + cell_y) * cells[2] + cell_z
+        order = np.argsort(cell, kind='stable')
+        starts = np.concatenate([[0], np.cumsum(np.bincount(cell, minlength=np.prod(cells)))])
+
+        row_size = len(prototype)
+        data = np.concatenate([starts, instance[order], instances.ravel()])
+        data = np.concatenate([data, np.zeros(-len(data) % row_size)])
+        payload = np.concatenate([prototype[None, :], data.reshape(-1, row_size)])
+        #flat offsets are stored as floats, also in single precision
+        if payload.size >= 2**np.finfo(np.float32).nmant:
+            raise ValueError(f"Instances take {payload.size} values, use larger cell_size or split them into more groups")
+        data_offset = 2 * row_size
+        row = np.zeros(row_size)
+        row[0] = self.id
+        row[1:4] = self.prototype.color
+        row[4:7] = grid_min
+        row[7] = cell_size
+        row[8:11] = cells
+        row[11] = self.margin
+        row[12] = len(instances)
+        row[13] = len(payload)
+        row[14] = data_offset
+        row[15] = data_offset + len(starts)
+        row[16] = data_offset + len(starts) + len(order)
+        #row changes whenever payload changes, so changed instances are noticed by comparing rows (see reprojection.py)
+        row[17] = zlib.crc32(inputs)
+        self._packed_inputs = inputs
+        self._packed = (row, payload)
+        return self._packed
+
+    def to_array(self) -> np.ndarray:
+        return self.pack()[0]
+
+    def to_payload(self) -> np.ndarray:
+        return self.pack()[1]
+
+def with_payloads(objects: List[RayMarchObject], rows: np.ndarray) -> np.ndarray:
+    '''
+    Object buffer with rows of objects (in the same order) each followed by its payload (see RayMarchObject.to_payload),
+    rows are returned as they are if no object has payload
+    '''
+    if not any(obj.has_payload for obj in objects):
+        return rows
+    blocks = []
+    for obj, row in zip(objects, rows):
+        blocks.append(row[None, :])
+        if obj.has_payload:
+            blocks.append(obj.to_payload().astype(rows.dtype))
+    return np.concatenate(blocks)
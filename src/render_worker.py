@@ -0,0 +1,129 @@
+'''
+Rendering on background thread for interactive windows.
+Main loop posts requests (for example camera pose) and presents the newest finished frame,
+worker renders only the latest request, so slow frames never stall handling of input.
+Frames are rendered into one of preallocated buffers (at least three): one is presented, one holds the newest finished frame
+and worker writes into another, so presented frame is never overwritten and no memory is allocated per frame.
+Progressive rendering publishes every pass as frame and it is interrupted by newer request.
+'''
+import threading
+import time
+import types
+
+class RenderWorker:
+    '''
+    Calls render(request, out) on background thread for the latest request posted by request(),
+    render writes frame into out which is one of buffers, value returned by render is kept with the frame
+    and it is in self.front_result after the frame is acquired
+    render can also be generator which renders frame in passes, it yields result of every pass written into out
+    and gets out of the next pass from yield, it is closed when newer request is posted
+    front is index of buffer which is presented before the first frame, worker does not write into it until newer frame is acquired
+    '''
+    def __init__(self, render, buffers: list, front: int = None):
+        if len(buffers) < 3:
+            raise ValueError(f"At least 3 buffers are needed, got {len(buffers)}")
+        self.render = render
+        self.buffers = buffers
+        #index of presented buffer and of the newest finished frame which was not taken yet
+        self.front = front
+        self.ready = None
+        self.results = [None] * len(buffers)
+        self.front_result = None
+        self.pending = None
+        self.frame_time = None
+        self.frames_rendered = 0
+        #set from taking request until its last frame is finished
+        self.busy = False
+        self.error = None
+        self.running = True
+        self.condition = threading.Condition()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def request(self, request) -> None:
+        '''
+        Posts request for the next frame, it replaces earlier request which was not rendered yet
+        '''
+        self.raise_error()
+        with self.condition:
+            self.pending = (request,)
+            self.condition.notify()
+
+    def acquire(self):
+        '''
+        Returns newest finished frame or None if no frame was finished since last call,
+        returned frame stays valid until the next call which returns new frame
+        '''
+        self.raise_error()
+        with self.condition:
+            if self.ready is None:
+                return None
+            self.front, self.ready = self.ready, None
+            self.front_result = self.results[self.front]
+            return self.buffers[self.front]
+
+    def stop(self) -> None:
+        '''
+        Waits until current frame is finished and stops the worker
+        '''
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+        self.thread.join()
+        self.raise_error()
+
+    def raise_error(self) -> None:
+        if self.error is not None:
+            raise RuntimeError("Rendering failed") from self.error
+
+    def run(self) -> None:
+        try:
+            while True:
+                with self.condition:
+                    while self.running and self.pending is None:
+                        self.condition.wait()
+                    if not self.running:
+                        return
+                    (request,), self.pending = self.pending, None
+                    self.busy = True
+                    back = self.back_buffer()
+
+                start = time.perf_counter()
+                result = self.render(request, self.buffers[back])
+                if isinstance(result, types.GeneratorType):
+                    self.run_passes(result, back, start)
+                else:
+                    self.publish(back, result, start)
+                with self.condition:
+                    self.busy = False
+        except Exception as error:
+            self.error = error
+
+    def back_buffer(self) -> int:
+        return next(i for i in range(len(self.buffers)) if i != self.front and i != self.ready)
+
+    def publish(self, back: int, result, start: float) -> None:
+        with self.condition:
+            self.results[back] = result
+            self.ready = back
+            self.frame_time = time.perf_counter() - start
+            self.frames_rendered += 1
+
+    def run_passes(self, passes, back: int, start: float) -> None:
+        '''
+        Publishes every pass of progressive render, stops when newer request is posted
+        '''
+        try:
+            result = next(passes)
+            while True:
+                self.publish(back, result, start)
+                start = time.perf_counter()
+                with self.condition:
+                    if self.pending is not None or not self.running:
+                        return
+                    back = self.back_buffer()
+                result = passes.send(self.buffers[back])
+        except StopIteration:
+            pass
+        finally:
+            passes.close()
@@ -0,0 +1,37 @@
+'''
+Temporal reprojection of depth for animated scenes watched by static camera.
+Ray which stopped at depth d in previous frame can start at d in the next one if nothing changed in front of it,
+so rays only start earlier where they go through boxes around objects which changed since previous frame.
+'''
+import numpy as np
+from typing import List, Optional
+from src.ray_marchobject import Bounds
+from src.ray_march_cuda import blend_distance
+
+#normals are sampled up to this distance from the hit point
+normal_offset = 0.02
+
+def change_margin(march_params: np.ndarray) -> float:
+    '''
+    Distance from changed object at which it can not change color of any hit point:
+    hit points are closer than hit epsilon to their object and objects farther than blend_distance are not blended
+    '''
+    hit_distance = max(march_params[1], march_params[7] * march_params[2])
+    return blend_distance + 2 * (hit_distance + normal_offset)
+
+def changed_boxes(previous_rows: np.ndarray, previous_bounds: List[Optional[Bounds]], rows: np.ndarray, bounds: List[Optional[Bounds]],
+                  margin: float) -> Optional[np.ndarray]:
+    '''
+    Boxes [min_x, min_y, min_z, max_x, max_y, max_z] around old and new bounds of objects whose rows changed, grown by margin
+    returns None if depth can not be reprojected because number of objects changed or changed object is unbounded
+    '''
+    if previous_rows.shape != rows.shape:
+        return None
+    boxes = []
+    for i in np.flatnonzero(np.any(previous_rows != rows, axis=1)):
+        if previous_bounds[i] is None or bounds[i] is None:
+            return None
+        low = np.minimum(previous_bounds[i][0], bounds[i][0]) - margin
+        high = np.maximum(previous_bounds[i][1], bounds[i][1]) + margin
+        boxes.append(np.concatenate([low, high]))
+    return np.array(boxes, dtype=rows.dtype).reshape(-1, 6)
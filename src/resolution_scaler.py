@@ -0,0 +1,61 @@
+'''
+Dynamic resolution for interactive rendering.
+Frames are rendered at one of fixed levels of scaled window size and upscaled to the window.
+Level of the next frame is chosen from render time of the last frame, which is assumed to grow with number of pixels:
+level goes down as soon as frame does not fit into the budget and goes up only after several frames predict
+that the higher level fits with a margin (hysteresis), so resolution does not oscillate between two levels.
+'''
+
+#scales of window size, from full resolution down
+default_scales = (1.0, 0.75, 0.5, 0.375, 0.25)
+
+class ResolutionScaler:
+    '''
+    Chooses resolution level of frames of window width x height to render them in budget seconds
+    level 0 is the largest scale, self.resolutions holds (pixel_width, pixel_height) of every level
+    frame which is slower than budget * (1 + hysteresis) lowers the level, higher level is taken
+    when patience frames in a row predict that it renders in budget * (1 - hysteresis)
+    '''
+    def __init__(self, width: int, height: int, budget: float, scales: tuple = default_scales, hysteresis: float = 0.2, patience: int = 5):
+        if budget <= 0:
+            raise ValueError(f"budget must be positive, got {budget}")
+        if not scales or any(not 0 < scale <= 1 for scale in scales) or list(scales) != sorted(scales, reverse=True):
+            raise ValueError(f"scales must be decreasing and in (0, 1], got {scales}")
+        if not 0 <= hysteresis < 1:
+            raise ValueError(f"hysteresis must be in [0, 1), got {hysteresis}")
+        if patience < 1:
+            raise ValueError(f"patience must be positive, got {patience}")
+        self.budget = budget
+        self.hysteresis = hysteresis
+        self.patience = patience
+        self.resolutions = [(max(1, round(width * scale)), max(1, round(height * scale))) for scale in scales]
+        self.level = 0
+        self.fast_frames = 0
+
+    @property
+    def resolution(self) -> tuple:
+        return self.resolutions[self.level]
+
+    def pixels(self, level: int) -> int:
+        pixel_width, pixel_height = self.resolutions[level]
+        return pixel_width * pixel_height
+
+    def update(self, level: int, frame_time: float) -> int:
+        '''
+        Takes render time (in seconds) of frame rendered at level and returns level of the next frames
+        level of the measured frame can differ from the current one, frames in flight were requested earlier
+        '''
+        time_per_pixel = frame_time / self.pixels(level)
+        if time_per_pixel * self.pixels(self.level) > self.budget * (1 + self.hysteresis):
+            #the largest level which fits into budget, or the smallest one
+            self.level = next((lower for lower in range(self.level, len(self.resolutions))
+                               if time_per_pixel * self.pixels(lower) <= self.budget), len(self.resolutions) - 1)
+            self.fast_frames = 0
+        elif self.level > 0 and time_per_pixel * self.pixels(self.level - 1) < self.budget * (1 - self.hysteresis):
+            self.fast_frames += 1
+            if self.fast_frames >= self.patience:
+                self.level -= 1
+                self.fast_frames = 0
+        else:
+            self.fast_frames = 0
+        return self.level
@@ -0,0 +1,54 @@
+'''
+Scene which owns packed object buffer, so it does not have to be rebuilt from objects every frame.
+Rows stay in order of the objects, so near objects are blended in the same order as when the list is rendered,
+and when attribute of an object is assigned only its row and bounds are packed again before the next frame.
+Arrays changed in place (obj.center[0] = 1) are not noticed, attributes have to be assigned (obj.center = ...).
+Buffer keeps rows of the kernel layout (one row per object, see RayMarchObject.to_array), which BVH, static field,
+instances and reprojection read too, so it is not split into arrays of every type.
+'''
+import numpy as np
+from typing import List, Optional
+from src.ray_marchobject import RayMarchObject, Bounds
+
+class Scene:
+    def __init__(self, objects: List[RayMarchObject], dtype = np.float64):
+        '''
+        Every object can be part of only one scene at a time
+        '''
+        self.dtype = np.dtype(dtype)
+        self.objects = list(objects)
+        self.buffer = np.array([obj.to_array() for obj in self.objects], dtype=self.dtype)
+        self.bounds: List[Optional[Bounds]] = [obj.get_bounds() for obj in self.objects]
+        for row, obj in enumerate(self.objects):
+            obj._scene = self
+            obj._row = row
+        #version changes whenever buffer changes, so consumers can skip comparing it
+        self.version = 0
+        self.changed = set()
+
+    def __len__(self) -> int:
+        return len(self.objects)
+
+    def mark_changed(self, obj: RayMarchObject) -> None:
+        self.changed.add(obj._row)
+
+    def pack(self) -> np.ndarray:
+        '''
+        Packs rows of changed objects and returns buffer
+        '''
+        if self.changed:
+            for row in self.changed:
+                obj = self.objects[row]
+                self.buffer[row] = obj.to_array()
+                self.bounds[row] = obj.get_bounds()
+            self.changed.clear()
+            self.version += 1
+        return self.buffer
+
+    def detach(self) -> None:
+        '''
+        Releases objects, so they can be added to other scene
+        '''
+        for obj in self.objects:
+            del obj._scene
+            del obj._row
@@ -0,0 +1,78 @@
+'''
+Kernels specialised to the composition of the scene.
+closest_in_range is generated with one loop per run of objects of the same type
+with known bounds, so there is no dispatch on object id in the inner loop.
+Kernels are cached by scene signature, so animated scenes whose structure does not change compile only once.
+'''
+import numpy as np
+from numba import cuda, njit, float32, float64
+import src.ray_march_cuda as ray_march_cuda
+from src.ray_march_cuda import object_distances, ray_march_kernel
+from src.ray_march_cpu import ray_march_rows, parallel_jit
+from src.jit_variants import JitVariant
+
+numba_floats = {np.dtype(np.float32): float32, np.dtype(np.float64): float64}
+
+#compiled kernels by (signature, backend, dtype), numba compiles them on the first call
+specialised_kernels = {}
+
+#scenes with more runs of objects of the same type are sorted by type to keep generated code short
+max_runs = 16
+
+def scene_signature(objects_buffer: np.ndarray) -> tuple:
+    '''
+    Pairs (object id, count) for every run of consecutive objects of the same type
+    '''
+    ids = objects_buffer[:, 0].astype(np.int64)
+    starts = np.flatnonzero(np.diff(ids, prepend=-1))
+    counts = np.diff(starts, append=len(ids))
+    return tuple(zip(ids[starts].tolist(), counts.tolist()))
+
+def group_by_type(objects_buffer: np.ndarray) -> np.ndarray:
+    '''
+    Keeps order of objects if they form at most max_runs runs of the same type, otherwise sorts them by type.
+    Sorting changes which objects are blended first, so colors on the seams of blended objects can change.
+    '''
+    if len(scene_signature(objects_buffer)) <= max_runs:
+        return objects_buffer
+    return objects_buffer[np.argsort(objects_buffer[:, 0], kind='stable')]
+
+def generate_closest_in_range(signature: tuple):
+    '''
+    Generates closest_in_range which evaluates objects of the scene with given signature.
+    It ignores first and last and always goes over the whole buffer, so it can not be used with BVH.
+    '''
+    lines = [
+        "@cuda.jit(device=True)",
+        "def closest_in_range(pos_x, pos_y, pos_z, object_buffer, first, last, closest_dist, r, g, b, closest_index):",
+    ]
+    start = 0
+    for object_id, count in signature:
+        lines += [
+            f"    for i in range({start}, {start + count}):",
+            f"        obj = object_buffer[i]",
+            f"        dist = {object_distances[object_id]}(pos_x, pos_y, pos_z, obj)",
+            f"        closest_dist, r, g, b, closest_index = merge_closest(closest_dist, r, g, b, closest_index, dist, obj, i)",
+        ]
+        start += count
+    lines.append("    return closest_dist, r, g, b, closest_index")
+
+    namespace = dict(vars(ray_march_cuda))
+    exec(compile("\n".join(lines), f"<closest_in_range {signature}>", "exec"), namespace)
+    return namespace['closest_in_range']
+
+def get_specialised_kernel(signature: tuple, backend: str, dtype = np.float64):
+    '''
+    Returns ray_march_kernel (or ray_march_rows for cpu) specialised to the scene signature
+    '''
+    dtype = np.dtype(dtype)
+    key = (signature, backend, dtype)
+    if key not in specialised_kernels:
+        closest_in_range = generate_closest_in_range(signature)
+        if backend == 'cpu':
+            variant = JitVariant(njit, real=numba_floats[dtype], closest_in_range=closest_in_range)
+            specialised_kernels[key] = variant.compile(ray_march_rows, parallel_jit)
+        else:
+            variant = JitVariant(cuda.jit(device=True), real=numba_floats[dtype], closest_in_range=closest_in_range)
+            specialised_kernels[key] = variant.compile(ray_march_kernel, cuda.jit)
+    return specialised_kernels[key]
@@ -0,0 +1,179 @@
+'''
+Brick map of static objects.
+Distance to objects marked static (obj.static = True) is baked once into sparse grid over given region:
+coarse grid of distances with cells of cell_size and bricks of brick_cells^3 fine cells in coarse cells near surfaces.
+Kernel samples it with trilinear interpolation instead of evaluating every static object at every step
+and evaluates static objects exactly only close to their surfaces (see merge_static_field in ray_march_cuda.py),
+dynamic objects are evaluated as before and merged with it.
+Baked field is appended to the object buffer after dynamic objects as rows of floats:
+header row, rows of static objects and flat data (coarse grid, brick index of every coarse cell or -1, bricks)
+header is [static_field_id, r, g, b, min_x, min_y, min_z, cell_size, cells_x, cells_y, cells_z, brick_cells,
+exact_distance, static rows, coarse offset, index offset, bricks offset, 0] with offsets relative to the header.
+Bakes are cached on disk by hash of static objects and grid parameters, so the same scene is baked only once.
+'''
+import hashlib
+import os
+import numpy as np
+from numba import prange
+from src.ray_march_cuda import find_closest_obj, static_field_id, half_diagonal
+from src.ray_march_cpu import cpu_variants, parallel_jit
+from src.bvh import empty_bvh
+
+#coarse cells whose center is closer to surface than brick_band diagonals of the cell get brick
+brick_band = 2.0
+#format of baked buffer, bakes of other format in cache are ignored
+layout_version = 1
+default_cache_dir = os.path.join(os.path.expanduser('~'), '.cache', 'ray_march', 'static_fields')
+
+def distance_rows(points: np.ndarray, object_buffer: np.ndarray, bvh: np.ndarray, out: np.ndarray) -> None:
+    '''
+    Distance of the scene at every point, points are processed in parallel
+    '''
+    for i in prange(points.shape[0]):
+        out[i] = find_closest_obj(points[i, 0], points[i, 1], points[i, 2], object_buffer, bvh)[0]
+
+def scene_distances(points: np.ndarray, rows: np.ndarray) -> np.ndarray:
+    '''
+    Distance of objects rows at points [n, 3], it is evaluated by the same code as in kernels in float64
+    '''
+    out = np.empty(len(points), dtype=np.float64)
+    cpu_variants[np.dtype(np.float64)].compile(distance_rows, parallel_jit)(points, rows, empty_bvh(np.float64), out)
+    return out
+
+def grid_points(shape: tuple) -> np.ndarray:
+    '''
+    Integer coordinates [n, 3] of points of grid of shape in C order
+    '''
+    return np.stack(np.meshgrid(*[np.arange(size) for size in shape], indexing='ij'), axis=-1).reshape(-1, 3)
+
+class StaticField:
+    '''
+    Brick map of static objects over box bounds_min..bounds_max, outside of it static objects are evaluated exactly
+    cell_size is size of coarse cells, cells near surfaces are divided into brick_cells^3 fine cells
+    bakes are cached in cache_dir (None disables disk cache), self.bakes counts bakes done by this field
+    '''
+    def __init__(self, bounds_min: np.ndarray, bounds_max: np.ndarray, cell_size: float = 1.0, brick_cells: int = 8,
+                 cache_dir: str = default_cache_dir):
+        bounds_min = np.asarray(bounds_min, dtype=np.float64)
+        bounds_max = np.asarray(bounds_max, dtype=np.float64)
+        if bounds_min.shape != (3,) or bounds_max.shape != (3,) or np.any(bounds_max <= bounds_min):
+            raise ValueError(f"bounds_max must be greater than bounds_min in every axis, got {bounds_min}, {bounds_max}")
+        if cell_size <= 0:
+            raise ValueError(f"cell_size must be positive, got {cell_size}")
+        if brick_cells < 1:
+            raise ValueError(f"brick_cells must be positive, got {brick_cells}")
+        self.bounds_min = bounds_min
+        self.cell_size = float(cell_size)
+        self.cells = np.maximum(1, np.ceil((bounds_max - bounds_min) / cell_size)).astype(np.int64)
+        self.brick_cells = int(brick_cells)
+        #static objects are evaluated exactly when baked distance is smaller than diagonal of fine cell,
+        #so rays near surfaces do not crawl with steps shortened by interpolation error
+        self.exact_distance = 2 * half_diagonal * self.cell_size / self.brick_cells
+        self.cache_dir = cache_dir
+        self.bakes = 0
+        #the last packed field by dtype, animated scenes pack the same static objects every frame
+        self.key = None
+        self.buffers = {}
+        #the last object buffer returned by attach, version changes whenever it is rebuilt
+        self.attached = None
+        self.attached_inputs = None
+        self.version = 0
+
+    def cache_key(self, static_rows: np.ndarray) -> str:
+        '''
+        Hash of static objects and grid parameters
+        '''
+        params = np.array([layout_version, *self.bounds_min, self.cell_size, *self.cells, self.brick_cells], dtype=np.float64)
+        digest = hashlib.sha256(params.tobytes())
+        digest.update(np.ascontiguousarray(static_rows, dtype=np.float64).tobytes())
+        return digest.hexdigest()
+
+    def bake(self, static_rows: np.ndarray) -> np.ndarray:
+        '''
+        Evaluates static objects (rows with payloads) on coarse grid and in bricks near surfaces,
+        returns float64 rows of header, static objects and flat data (see module docstring)
+        '''
+        static_rows = np.asarray(static_rows, dtype=np.float64)
+        cell_size, brick_cells = self.cell_size, self.brick_cells
+        coarse = scene_distances(self.bounds_min + grid_points(self.cells + 1) * cell_size, static_rows)
+        cells = grid_points(self.cells)
+        centers = scene_distances(self.bounds_min + (cells + 0.5) * cell_size, static_rows)
+        near = np.abs(centers) < brick_band * 2 * half_diagonal * cell_size
+        brick_index = np.full(len(cells), -1.0)
+        brick_index[near] = np.arange(np.count_nonzero(near))
+        fine = grid_points((brick_cells + 1,) * 3)
+        points = (cells[near][:, None, :] * brick_cells + fine[None, :, :]).reshape(-1, 3)
+        bricks = scene_distances(self.bounds_min + points * (cell_size / brick_cells), static_rows)
+
+        row_size = static_rows.shape[1]
+        data = np.concatenate([coarse, brick_index, bricks])
+        data = np.concatenate([data, np.zeros(-len(data) % row_size)])
+        data_offset = (1 + len(static_rows)) * row_size
+        header = np.zeros(row_size)
+        header[0] = static_field_id
+        header[4:7] = self.bounds_min
+        header[7] = cell_size
+        header[8:11] = self.cells
+        header[11] = brick_cells
+        header[12] = self.exact_distance
+        header[13] = len(static_rows)
+        header[14] = data_offset
+        header[15] = data_offset + len(coarse)
+        header[16] = data_offset + len(coarse) + len(brick_index)
+        self.bakes += 1
+        return np.concatenate([header[None, :], static_rows, data.reshape(-1, row_size)])
+
+    def load(self, key: str, static_rows: np.ndarray) -> np.ndarray:
+        '''
+        Returns baked field from disk cache or bakes it and stores it there
+        '''
+        path = os.path.join(self.cache_dir, f"{key}.npy") if self.cache_dir else None
+        if path and os.path.exists(path):
+            return np.load(path)
+        buffer = self.bake(static_rows)
+        if path:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            #other processes never see half written file
+            temporary = f"{path}.{os.getpid()}.tmp"
+            with open(temporary, 'wb') as file:
+                np.save(file, buffer)
+            os.replace(temporary, path)
+        return buffer
+
+    def pack(self, static_rows: np.ndarray, dtype = np.float64) -> np.ndarray:
+        '''
+        Returns baked field of static objects in given float precision, it is baked only when static objects changed
+        '''
+        dtype = np.dtype(dtype)
+        key = self.cache_key(static_rows)
+        if key != self.key:
+            self.key = key
+            self.buffers = {np.dtype(np.float64): self.load(key, static_rows)}
+        if dtype not in self.buffers:
+            buffer = self.buffers[np.dtype(np.float64)]
+            #flat offsets are stored as floats
+            if buffer.size >= 2**np.finfo(dtype).nmant:
+                raise ValueError(f"Static field of {buffer.size} values is too large for {dtype}, use larger cell_size or fewer brick_cells")
+            self.buffers[dtype] = buffer.astype(dtype)
+        return self.buffers[dtype]
+
+    def attach(self, dynamic_rows: np.ndarray, static_rows: np.ndarray, hit_distance: float = 0.0) -> np.ndarray:
+        '''
+        Object buffer with dynamic rows followed by baked field of static rows (both with payloads of their objects),
+        static objects are evaluated exactly at least closer than hit_distance (the largest hit epsilon of the march),
+        so every hit is found on exact surface
+        the previous buffer is returned if nothing changed, so it is not copied and compared every frame (see self.version)
+        '''
+        if len(static_rows) == 0:
+            return dynamic_rows
+        field = self.pack(static_rows, dynamic_rows.dtype)
+        inputs = self.attached_inputs
+        if inputs is not None and inputs[0] is field and inputs[1] == hit_distance and np.array_equal(inputs[2], dynamic_rows):
+            return self.attached
+        objects_buffer = np.concatenate([dynamic_rows, field])
+        header = objects_buffer[len(dynamic_rows)]
+        header[12] = max(header[12], hit_distance)
+        self.attached = objects_buffer
+        self.attached_inputs = (field, hit_distance, dynamic_rows)
+        self.version += 1
+        return objects_buffer
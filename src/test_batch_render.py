@@ -0,0 +1,66 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+from PIL import Image
+from src.batch_render import render_frames, frame_path
+from src.example_worlds import World, world_1, animation_4, legacy_frame_time
+from src.ray_marchobject import Sphere, Box
+
+width, height = 16, 12
+
+class TestBatchRender(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def test_deterministic_animation(self):
+        world_1.animate(2.5)
+        state = [obj.to_array() for obj in world_1.objects]
+        world_1.animate(0.4)
+        world_1.animate(2.5)
+        self.assertTrue(np.array_equal(state, [obj.to_array() for obj in world_1.objects]))
+
+    def test_legacy_animation(self):
+        #old call form animation(objects) advances by one frame of old renderers, one degree of rotation
+        objects = [Box(np.zeros(3), np.ones(3))]
+        animation_4(objects, 2.0)
+        self.assertAlmostEqual(animation_4(objects)[0].rotation_angle, 5 * (2.0 + legacy_frame_time))
+        self.assertAlmostEqual(animation_4(objects)[0].rotation_angle, 5 * (2.0 + 2 * legacy_frame_time))
+
+        #world still takes old animations, which ignore t
+        def step(objects):
+            objects[0].radius += 1
+            return objects
+        world = World([Sphere(np.zeros(3), 1)], step)
+        world.animate(0.5)
+        world.animate(0.5)
+        self.assertEqual(world.objects[0].radius, 3)
+
+    def test_resume(self):
+        output = self.directory.name
+        log = lambda message: None
+        self.assertEqual(render_frames('world_1', width, height, range(0, 4), 2, output, 'npy', backend='cpu', log=log), [0, 1, 2, 3])
+        frames = [np.load(frame_path(output, frame, 'npy')) for frame in range(4)]
+        self.assertEqual(frames[0].shape, (height, width, 3))
+        self.assertFalse(np.array_equal(frames[0], frames[3]))
+
+        #interrupted job left frame 2 missing, only it is rendered again and it is the same as before
+        os.remove(frame_path(output, 2, 'npy'))
+        self.assertEqual(render_frames('world_1', width, height, range(0, 4), 2, output, 'npy', backend='cpu', log=log), [2])
+        self.assertTrue(np.array_equal(np.load(frame_path(output, 2, 'npy')), frames[2]))
+        self.assertEqual(sorted(os.listdir(output)), [f"frame_{frame:05d}.npy" for frame in range(4)])
+
+        render_frames('world_1', width, height, range(3, 4), 2, output, 'png', backend='cpu', log=log)
+        self.assertTrue(np.array_equal(np.asarray(Image.open(frame_path(output, 3, 'png'))), frames[3]))
+
+    def test_invalid_arguments(self):
+        with self.assertRaises(ValueError):
+            render_frames('world_9', width, height, range(2), 5, self.directory.name)
+        with self.assertRaises(ValueError):
+            render_frames('world_1', width, height, range(2), 5, self.directory.name, format='gif')
+        with self.assertRaises(ValueError):
+            render_frames('world_1', width, height, range(2), 0, self.directory.name)
+
+if __name__ == '__main__':
+    unittest.main()
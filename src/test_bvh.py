@@ -0,0 +1,55 @@
+import unittest
+import numpy as np
+from src.bvh import build_bvh, max_leaf_size
+from src.ray_marchobject import Sphere, Box, PlaneY
+
+def rotate(point, axis, angle):
+    angle = np.radians(angle)
+    return (point * np.cos(angle) + np.cross(axis, point) * np.sin(angle)
+            + axis * np.dot(axis, point) * (1 - np.cos(angle)))
+
+class TestBVH(unittest.TestCase):
+    def test_build_bvh(self):
+        rng = np.random.default_rng(0)
+        objects = [Sphere(rng.uniform(-10, 10, 3), 0.5) for _ in range(50)] + [PlaneY(1)]
+        object_buffer, bvh = build_bvh(objects)
+        self.assertEqual(object_buffer.shape[0], len(objects))
+        #unbounded plane goes first in leaf with infinite bounds
+        self.assertEqual(object_buffer[0, 0], 8)
+        self.assertTrue(np.all(np.isinf(bvh[0, :6])))
+
+        covered = []
+        for node in bvh:
+            if node[7] > 0:
+                self.assertLessEqual(node[7], max_leaf_size)
+                for i in range(int(node[6]), int(node[6] + node[7])):
+                    covered.append(i)
+                    center, radius = object_buffer[i, 5:8], object_buffer[i, 4]
+                    if object_buffer[i, 0] == 0:
+                        self.assertTrue(np.all(center - radius >= node[:3]) and np.all(center + radius <= node[3:6]))
+            self.assertGreater(node[8], 0)
+        self.assertEqual(sorted(covered), list(range(len(objects))))
+
+    def test_rotated_bounds(self):
+        box = Box(np.array([1, 2, 3]), np.array([1, 2, 2]), np.array([0, 1, 0]), 45)
+        low, high = box.get_bounds()
+        extent = (1 + 2) / np.sqrt(2)
+        np.testing.assert_allclose(low, [1 - extent, 0, 3 - extent])
+        np.testing.assert_allclose(high, [1 + extent, 4, 3 + extent])
+        #corners of rotated box stay inside bounds for any axis
+        rng = np.random.default_rng(0)
+        for _ in range(20):
+            axis = rng.normal(size=3)
+            axis /= np.linalg.norm(axis)
+            half_sides = rng.uniform(0.1, 2, 3)
+            box = Box(np.zeros(3), half_sides, axis, rng.uniform(0, 360))
+            low, high = box.get_bounds()
+            for corner in np.array(np.meshgrid([-1, 1], [-1, 1], [-1, 1])).T.reshape(-1, 3) * half_sides:
+                for angle in (box.rotation_angle, -box.rotation_angle):
+                    rotated = rotate(corner, axis, angle)
+                    self.assertTrue(np.all(rotated >= low - 1e-9) and np.all(rotated <= high + 1e-9))
+        #rotation around not unit axis is not rigid
+        self.assertIsNone(Box(np.zeros(3), np.ones(3), np.array([1, 1, 0]), 45).get_bounds())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,340 @@
+import unittest
+import numpy as np
+from numba import cuda
+from src.camera import RayMarchCamera, step_heatmap, stack_frames, max_frame_contexts
+from src.ray_march_cuda import march_hit, march_escaped, march_out_of_steps, min_hit_distance, find_closest_obj, get_ray_direction
+from src.ray_march_cpu import cpu_variants, get_variant, progressive_rows
+from src.example_worlds import World, world_1, world_2, world_3, world_4
+from src.ray_marchobject import Sphere, Box, Torus, PlaneY
+
+width, height = 16, 12
+worlds = [world_1, world_2, world_3, world_4]
+
+def make_camera(backend: str = None, width: int = width, height: int = height, **camera_params) -> RayMarchCamera:
+    '''
+    Camera at origin looking along x, the same in tests of every module
+    '''
+    return RayMarchCamera(pos=np.array([0, 0, 0], dtype=np.float64), target=np.array([10, 0, 0], dtype=np.float64),
+                          screne_width=width, screne_height=height, backend=backend, **camera_params)
+
+def render(world, **camera_params):
+    return make_camera(**camera_params).get_window_content(width, height, world.objects)
+
+requires_cuda = unittest.skipUnless(cuda.is_available(), "cuda (or NUMBA_ENABLE_CUDASIM=1) is required")
+
+def backend_tests(check):
+    '''
+    Returns pair of tests which run check(self, backend) on cpu and on cuda, the cuda one is skipped without cuda
+    use as test_x, test_x_cuda = backend_tests(assertX) in body of test class
+    '''
+    def test_cpu(self):
+        check(self, 'cpu')
+    @requires_cuda
+    def test_cuda(self):
+        check(self, 'cuda')
+    return test_cpu, test_cuda
+
+distance = cpu_variants[np.dtype(np.float64)].compile(find_closest_obj)
+ray_direction = cpu_variants[np.dtype(np.float64)].compile(get_ray_direction)
+
+class TestCamera(unittest.TestCase):
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            RayMarchCamera(backend='opengl')
+
+    def test_cpu_backend(self):
+        for world in worlds:
+            image = render(world, backend='cpu')
+            self.assertEqual(image.shape, (width, height, 3))
+            self.assertEqual(image.dtype, np.uint8)
+        self.assertGreater(render(world_1, backend='cpu').max(), 0)
+
+    def test_frame_context_reuse(self):
+        camera = RayMarchCamera(screne_width=width, screne_height=height)
+        context = camera.get_frame_context(width, height)
+        self.assertIs(camera.get_frame_context(width, height), context)
+        self.assertIsNot(camera.get_frame_context(width * 2, height), context)
+        #buffers of previous resolutions are kept up to max_frame_contexts
+        self.assertIs(camera.get_frame_context(width, height), context)
+        for size in range(1, max_frame_contexts + 1):
+            camera.get_frame_context(size, size)
+        self.assertIsNot(camera.get_frame_context(width, height), context)
+        context = camera.get_frame_context(width, height)
+
+        objects_buffer = np.array([obj.to_array() for obj in world_1.objects], dtype=np.float64)
+        bvh = np.zeros((0, 9))
+        self.assertTrue(context.set_objects(objects_buffer, bvh))
+        self.assertFalse(context.set_objects(objects_buffer.copy(), bvh.copy()))
+
+    def test_output_buffer(self):
+        camera = make_camera('cpu')
+        #buffer laid out like pixels of pygame surface
+        out = np.zeros((height, width, 3), dtype=np.uint8).transpose(1, 0, 2)
+        self.assertIs(camera.get_window_content(width, height, world_1.objects, out=out), out)
+        self.assertTrue(np.array_equal(out, camera.get_window_content(width, height, world_1.objects)))
+
+    def test_look_at(self):
+        def make_objects(offset):
+            return [Sphere(np.array([4, 0, 1]) + offset, 0.8, np.array([1, 0, 0])),
+                    Box(np.array([5, 0, -1]) + offset, np.array([0.5, 0.5, 0.5]), np.array([0, 1, 0]), 30, np.array([0, 0, 1])),
+                    PlaneY(1.5)]
+        camera = make_camera('cpu')
+        image = camera.get_window_content(width, height, make_objects(np.zeros(3)), record_march_stats=True)
+        march_stats = camera.march_stats.copy()
+        self.assertTrue(np.any(march_stats[..., 1] == march_hit))
+        #moving camera and scene together gives the same rays, only shading changes as the light stays at its place
+        offset = np.array([-2, 0, 3])
+        camera.look_at(offset, np.array([10, 0, 0]) + offset)
+        camera.get_window_content(width, height, make_objects(offset), record_march_stats=True)
+        self.assertTrue(np.array_equal(camera.march_stats, march_stats))
+        #the centre ray goes to the target also when camera is not at origin
+        direction = np.array(ray_direction(width // 2, height // 2, width, height, *camera.camera_matrices))
+        np.testing.assert_allclose(direction, [1, 0, 0], atol=0.1)
+        camera.look_at(np.array([0, 0, 0]), np.array([10, 0, 0]))
+        self.assertTrue(np.array_equal(camera.get_window_content(width, height, make_objects(np.zeros(3))), image))
+
+    def test_unknown_precision(self):
+        with self.assertRaises(ValueError):
+            RayMarchCamera(precision=np.float16)
+
+    def assertImagesClose(self, image, expected, max_changed=0.02, max_mean=2):
+        difference = np.abs(image.astype(np.int64) - expected.astype(np.int64))
+        #single pixels on object edges can flip between hit and miss
+        self.assertLess(np.mean(difference > 8), max_changed)
+        self.assertLess(difference.mean(), max_mean)
+
+    def test_float32_cpu(self):
+        for world in worlds:
+            self.assertImagesClose(render(world, backend='cpu', precision=np.float32), render(world, backend='cpu'))
+
+    def test_normal_modes(self):
+        with self.assertRaises(ValueError):
+            RayMarchCamera(normal_mode='sobel')
+
+        objects = [Torus(np.array([4, 0, 1.5]), np.array([1, 0.3])),
+                   Sphere(np.array([4, 0, -1.5]), 0.8),
+                   Box(np.array([5, 0, 0]), np.array([0.5, 0.5, 0.5]), np.array([0, 1, 0]), 30, np.array([0, 0, 1])),
+                   PlaneY(1.5)]
+        for world in worlds + [World(objects, None)]:
+            expected = render(world, backend='cpu')
+            for normal_mode in ('tetrahedron', 'analytic'):
+                #shading differs a bit on thin objects and where objects are blended
+                self.assertImagesClose(render(world, backend='cpu', normal_mode=normal_mode), expected, max_changed=0.05)
+
+    def test_bvh(self):
+        rng = np.random.default_rng(0)
+        objects = [Sphere(rng.uniform([4, -3, -3], [8, 3, 3]), rng.uniform(0.1, 0.4), rng.uniform(0, 1, 3)) for _ in range(30)]
+        objects += [Box(rng.uniform([4, -3, -3], [8, 3, 3]), rng.uniform(0.1, 0.3, 3), np.array([0, 1, 0]), 30, rng.uniform(0, 1, 3)) for _ in range(30)]
+        for world in worlds + [World(objects + [PlaneY(2)], None)]:
+            self.assertImagesClose(render(world, backend='cpu', use_bvh=True), render(world, backend='cpu'))
+
+    def test_specialised_kernel(self):
+        with self.assertRaises(ValueError):
+            RayMarchCamera(use_bvh=True, specialise=True)
+
+        for world in worlds:
+            self.assertTrue(np.array_equal(render(world, backend='cpu', specialise=True), render(world, backend='cpu')))
+
+        camera = RayMarchCamera(screne_width=width, screne_height=height, backend='cpu', specialise=True)
+        objects = [Sphere(np.array([3, 0, 0]), 0.5), Box(np.array([3, 1, 0]), np.array([1, 0.1, 1]))]
+        camera.get_window_content(width, height, objects)
+        kernel = camera.get_kernel(camera.frame_context.objects_buffer)
+        #moving objects keeps the kernel, adding object of new type needs new one
+        objects[0].center = np.array([3, 1, 0])
+        camera.get_window_content(width, height, objects)
+        self.assertIs(camera.get_kernel(camera.frame_context.objects_buffer), kernel)
+        camera.get_window_content(width, height, objects + [Torus(np.array([4, 0, 0]))])
+        self.assertIsNot(camera.get_kernel(camera.frame_context.objects_buffer), kernel)
+
+    def test_march_params(self):
+        camera = make_camera('cpu')
+        image = camera.get_window_content(width, height, world_1.objects, record_march_stats=True)
+        stats = camera.march_stats
+        self.assertEqual(stats.shape, (width, height, 2))
+        self.assertTrue(np.all((stats[..., 0] >= 1) & (stats[..., 0] <= 64)))
+        self.assertTrue(np.all(np.isin(stats[..., 1], [march_hit, march_escaped, march_out_of_steps])))
+        self.assertEqual(step_heatmap(stats).shape, (width, height, 3))
+
+        #background is drawn where rays did not hit anything
+        missed = stats[..., 1] != march_hit
+        self.assertTrue(missed.any())
+        red = camera.get_window_content(width, height, world_1.objects, background_color=np.array([1.0, 0, 0]))
+        self.assertTrue(np.all(red[missed] == [255, 0, 0]))
+        self.assertTrue(np.array_equal(red[~missed], image[~missed]))
+        self.assertIsNone(camera.march_stats)
+
+        camera.get_window_content(width, height, world_1.objects, number_of_steps=4, record_march_stats=True)
+        self.assertLessEqual(camera.march_stats[..., 0].max(), 4)
+        self.assertGreater(np.sum(camera.march_stats[..., 1] == march_out_of_steps), np.sum(stats[..., 1] == march_out_of_steps))
+        with self.assertRaises(ValueError):
+            camera.get_window_content(width, height, world_1.objects, number_of_steps=0)
+
+    def test_enhanced_stepping(self):
+        #hit epsilon grows with pixel footprint, so resolution must be high enough for images to be comparable
+        w, h = width * 10, height * 10
+        camera = make_camera('cpu', w, h)
+        for stepping, relaxation in (('overrelaxed', 1.5), ('enhanced', 2.0), ('enhanced', 0.5)):
+            with self.assertRaises(ValueError):
+                camera.get_window_content(w, h, world_1.objects, stepping=stepping, relaxation=relaxation)
+
+        for world in worlds:
+            camera.get_window_content(w, h, world.objects, record_march_stats=True)
+            steps = camera.march_stats[..., 0].mean()
+            image = camera.get_window_content(w, h, world.objects, record_march_stats=True, stepping='enhanced')
+            #failed over-relaxed steps next to surfaces can cost a step
+            self.assertLessEqual(camera.march_stats[..., 0].mean(), steps * 1.1)
+            #rays which ran out of steps can hit now, so image is compared with sphere tracing with large step budget
+            self.assertImagesClose(image, camera.get_window_content(w, h, world.objects, number_of_steps=1024), max_changed=0.05)
+
+    def assertSkippedEmpty(self, camera):
+        #nothing closer than hit distance may lie on the skipped part of any ray
+        context = camera.frame_context
+        for x in range(width):
+            for y in range(height):
+                direction = np.array(ray_direction(x, y, width, height, context.camera_matrices[0], context.camera_matrices[1]))
+                for t in np.linspace(0, context.start_depths[x, y], 16):
+                    dist = distance(*(camera.pos + t * direction), context.objects_buffer, context.bvh)[0]
+                    self.assertGreaterEqual(dist, min_hit_distance)
+
+    def test_depth_prepass(self):
+        with self.assertRaises(ValueError):
+            RayMarchCamera(depth_prepass_tile=-1)
+
+        #thin objects smaller than tiles must not be skipped
+        thin = [Box(np.array([4, 0, 0]), np.array([0.02, 2, 0.02])), Sphere(np.array([3, 0.5, 0.5]), 0.03),
+                Box(np.array([6, -1, 0]), np.array([0.01, 0.01, 3])), PlaneY(1.5)]
+        for world in worlds + [World(thin, None)]:
+            expected = render(world, backend='cpu')
+            camera = make_camera('cpu', depth_prepass_tile=4)
+            self.assertImagesClose(camera.get_window_content(width, height, world.objects), expected)
+            self.assertGreater(camera.frame_context.start_depths.min(), 0)
+            self.assertSkippedEmpty(camera)
+
+    def test_temporal_reprojection(self):
+        objects = [Sphere(np.array([3, 0, 0]), 0.5, np.array([1, 0, 0])),
+                   Box(np.array([4, 0, 0]), np.array([0.1, 1, 1]), np.array([0, 1, 0]), 45, np.array([1, 1, 0])),
+                   Sphere(np.array([8, 1, 2]), 1, np.array([0, 1, 0]))]
+        for depth_prepass_tile in (0, 4):
+            camera = make_camera('cpu', depth_prepass_tile=depth_prepass_tile, temporal_reprojection=True)
+            image = camera.get_window_content(width, height, objects, record_march_stats=True)
+            steps = camera.march_stats[..., 0].sum()
+            #static scene is rendered the same way from depths of previous frame
+            self.assertTrue(np.array_equal(camera.get_window_content(width, height, objects, record_march_stats=True), image))
+            self.assertLess(camera.march_stats[..., 0].sum(), steps / 2)
+
+            #moving objects must never be clipped by depths where rays stopped before they moved
+            for frame in range(1, 6):
+                objects[0].center = np.array([3, 1.5 * np.sin(frame), 0.5 * np.cos(frame)])
+                objects[1].rotation_angle = 45 + 20 * frame
+                objects[2].center = np.array([8 - frame, 1, 2 - frame * 0.5])
+                image = camera.get_window_content(width, height, objects)
+                self.assertImagesClose(image, render(World(objects, None), backend='cpu'))
+                self.assertSkippedEmpty(camera)
+
+    def test_dirty_tiles(self):
+        with self.assertRaises(ValueError):
+            RayMarchCamera(dirty_tile_size=-4)
+
+        objects = [Sphere(np.array([5, 0.5, 1]), 0.2, np.array([1, 0, 0])),
+                   Box(np.array([6, 0, -1]), np.array([0.5, 0.5, 0.5]), np.array([0, 1, 0]), 30, np.array([1, 1, 0])),
+                   PlaneY(1.5)]
+        camera = make_camera('cpu', dirty_tile_size=4)
+        camera.get_window_content(width, height, objects)
+        self.assertEqual(camera.dirty_tile_stats, {'tiles': 12, 'skipped': 0})
+        for frame in range(1, 4):
+            objects[0].center = np.array([5, 0.5 - 0.2 * frame, 1])
+            image = camera.get_window_content(width, height, objects)
+            self.assertGreater(camera.dirty_tile_stats['skipped'], 0)
+            self.assertImagesClose(image, render(World(objects, None), backend='cpu'))
+
+        #nothing changed
+        camera.get_window_content(width, height, objects)
+        self.assertEqual(camera.dirty_tile_stats['skipped'], 12)
+        #unbounded plane moved
+        objects[2].y = 1.4
+        camera.get_window_content(width, height, objects)
+        self.assertEqual(camera.dirty_tile_stats['skipped'], 0)
+        camera.normal_mode = 'tetrahedron'
+        camera.get_window_content(width, height, objects)
+        self.assertEqual(camera.dirty_tile_stats['skipped'], 0)
+
+    def assertProgressive(self, backend: str):
+        camera = make_camera(backend, dirty_tile_size=4)
+        for world in worlds:
+            expected = render(world, backend=backend)
+            passes = list(camera.get_window_content_progressive(width, height, world.objects))
+            self.assertEqual([step for step, _ in passes], [8, 4, 2, 1])
+            #every pixel has color of the corner of its block, which is already final
+            for step, image in passes:
+                corners = expected[::step, ::step].repeat(step, axis=0).repeat(step, axis=1)[:width, :height]
+                self.assertTrue(np.array_equal(image, corners))
+
+        #refinement stops when the loop is left, next frame is rendered whole again
+        for step, image in camera.get_window_content_progressive(width, height, world_2.objects):
+            break
+        self.assertEqual(step, 8)
+        self.assertTrue(np.array_equal(camera.get_window_content(width, height, world_2.objects), render(world_2, backend=backend)))
+        self.assertEqual(camera.dirty_tile_stats['skipped'], 0)
+
+        #passes can be written into different buffers
+        buffers = [np.zeros((width, height, 3), dtype=np.uint8) for _ in range(2)]
+        passes = camera.get_window_content_progressive(width, height, world_1.objects, steps=(2, 1), out=buffers[0])
+        self.assertIs(next(passes)[1], buffers[0])
+        self.assertIs(passes.send(buffers[1])[1], buffers[1])
+        with self.assertRaises(ValueError):
+            next(camera.get_window_content_progressive(width, height, world_1.objects, steps=(8, 3, 1)))
+
+    def test_progressive(self):
+        self.assertProgressive('cpu')
+
+        #pixels of previous grid are reused
+        camera = RayMarchCamera(screne_width=width, screne_height=height, backend='cpu')
+        context = camera.get_frame_context(width, height)
+        camera.upload_world(context, world_1.objects, 64, min_hit_distance, 100, np.zeros(3), 'sphere', 1.2)
+        result = np.full((width, height, 3), 7.0)
+        get_variant(progressive_rows, np.float64)(result, context.no_march_stats, context.no_start_depths, 4, 8, 0.0, 0.0, 0.0, context.camera_matrices,
+                                        context.objects_buffer, context.bvh, 0, context.march_params)
+        self.assertTrue(np.all(result[::8, ::8] == 7))
+        self.assertTrue(np.all(result[4::8, ::4] != 7))
+
+    @requires_cuda
+    def test_progressive_cuda(self):
+        self.assertProgressive('cuda')
+
+    def assertFramesMatch(self, backend: str):
+        def animation(objects, t):
+            objects[0].center = np.array([5, -1 + 1.5 * t, 0])
+            return objects
+        def animated_world():
+            return World([Sphere(np.array([5, -1, 0]), 1, np.array([1, 0, 0])),
+                          Box(np.array([6, 0, 2]), np.array([1, 1, 1]), np.array([0, 1, 0]), 30, np.array([1, 1, 0]))], animation)
+        frame_buffers = stack_frames(animated_world(), 5)
+        self.assertEqual(frame_buffers.shape[:2], (5, 2))
+        camera = make_camera(backend)
+        #batches of two frames
+        frames = camera.get_frames_content(width, height, frame_buffers, batch_bytes=2 * (width * height * 3 + frame_buffers[0].nbytes))
+        self.assertEqual(frames.shape, (5, width, height, 3))
+        world = animated_world()
+        for i, frame in enumerate(frames):
+            world.animate(i / 5)
+            self.assertTrue(np.array_equal(frame, camera.get_window_content(width, height, world.objects)))
+        self.assertFalse(np.array_equal(frames[0], frames[-1]))
+        with self.assertRaises(ValueError):
+            camera.get_frames_content(width, height, frame_buffers, batch_bytes=100)
+
+    test_frames_content, test_frames_content_cuda = backend_tests(assertFramesMatch)
+
+    @requires_cuda
+    def test_cpu_matches_cuda(self):
+        for world in worlds:
+            cpu_image = render(world, backend='cpu').astype(np.int64)
+            cuda_image = render(world, backend='cuda').astype(np.int64)
+            self.assertLessEqual(np.abs(cpu_image - cuda_image).max(), 1)
+
+    @requires_cuda
+    def test_float32_cuda(self):
+        for world in worlds:
+            self.assertImagesClose(render(world, backend='cuda', precision=np.float32), render(world, backend='cuda'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+from PIL import Image, ImageSequence
+from src.frame_encoder import FrameEncoder, frame_to_image
+
+width, height = 16, 12
+
+def make_frames(count: int) -> list:
+    frames = []
+    for i in range(count):
+        frame = np.zeros((width, height, 3), dtype=np.uint8)
+        frame[i:i + 4, :, 0] = 255
+        frame[:, 2:5, 1] = 40 * i
+        frames.append(frame)
+    return frames
+
+class TestFrameEncoder(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def test_gif(self):
+        frames = make_frames(5)
+        path = os.path.join(self.directory.name, 'animation.gif')
+        with FrameEncoder(path, fps=10) as encoder:
+            for frame in frames:
+                encoder.write(frame)
+        self.assertEqual(encoder.frames_written, 5)
+        image = Image.open(path)
+        self.assertEqual(image.n_frames, 5)
+        self.assertEqual(image.size, (width, height))
+        self.assertEqual(image.info['duration'], 100)
+        self.assertEqual(image.info['loop'], 0)
+        for decoded, frame in zip(ImageSequence.Iterator(image), frames):
+            self.assertTrue(np.array_equal(np.asarray(decoded.convert('RGB')), np.asarray(frame_to_image(frame))))
+
+    def test_png_and_raw(self):
+        frames = make_frames(3)
+        directory = os.path.join(self.directory.name, 'frames')
+        raw_path = os.path.join(self.directory.name, 'frames.raw')
+        with FrameEncoder(directory, format='png') as png, FrameEncoder(raw_path) as raw:
+            for frame in frames:
+                png.write(frame)
+                raw.write(frame)
+        self.assertEqual(sorted(os.listdir(directory)), [f"frame_{i:05d}.png" for i in range(3)])
+        decoded = np.asarray(Image.open(os.path.join(directory, 'frame_00002.png')))
+        self.assertTrue(np.array_equal(decoded, np.asarray(frame_to_image(frames[2]))))
+        raw_frames = np.fromfile(raw_path, dtype=np.uint8).reshape(3, height, width, 3)
+        self.assertTrue(np.array_equal(raw_frames[1], np.asarray(frame_to_image(frames[1]))))
+
+    def test_errors(self):
+        with self.assertRaises(ValueError):
+            FrameEncoder('animation.mp4', format='mp4')
+        with self.assertRaises(ValueError):
+            FrameEncoder('animation.gif', fps=0)
+        encoder = FrameEncoder(os.path.join(self.directory.name, 'missing', 'animation.gif'), max_queued=1)
+        for frame in make_frames(4):
+            try:
+                encoder.write(frame)
+            except RuntimeError:
+                break
+        with self.assertRaises(RuntimeError):
+            encoder.close()
+        with self.assertRaises(ValueError):
+            encoder.write(make_frames(1)[0])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+import unittest
+import numpy as np
+from src.camera import stack_frames
+from src.test_camera import make_camera, backend_tests
+from src.example_worlds import World
+from src.scene import Scene
+from src.static_field import scene_distances
+from src.ray_marchobject import Sphere, Box, PlaneY, Instances, with_payloads
+
+width, height = 32, 24
+
+def make_group() -> Instances:
+    rng = np.random.default_rng(0)
+    prototype = Sphere(np.zeros(3), 0.3, np.array([1, 0, 0]))
+    group = Instances.grid(prototype, (4, 1, 5), np.array([0.9, 0, 0.8]), origin=np.array([3, 0.5, -1.6]),
+                           scales=rng.uniform(0.6, 1.2, 20), colors=rng.uniform(0.2, 1, (20, 3)))
+    return group
+
+def explicit_spheres(group: Instances) -> list:
+    return [Sphere(offset, 0.3 * scale, color) for offset, scale, color in zip(group.offsets, group.scales, group.colors)]
+
+class TestInstances(unittest.TestCase):
+    def test_pack(self):
+        group = make_group()
+        row, payload = group.pack()
+        self.assertIs(group.pack()[1], payload)
+        self.assertEqual(row[0], group.id)
+        self.assertEqual(row[12], 20)
+        self.assertEqual(row[13], len(payload))
+        self.assertTrue(np.array_equal(payload[0], group.prototype.to_array()))
+
+        #every instance is listed in every cell its bounds grown by margin overlap
+        flat = np.concatenate([row, payload.ravel()])
+        cells = row[8:11].astype(int)
+        starts = flat[int(row[14]):int(row[14]) + np.prod(cells) + 1].astype(int)
+        lists = flat[int(row[15]):int(row[16])].astype(int)
+        low, high = group.instance_bounds()
+        for cell in range(np.prod(cells)):
+            cell_min = row[4:7] + np.array(np.unravel_index(cell, cells)) * row[7]
+            overlap = np.all((low - row[11] <= cell_min + row[7]) & (high + row[11] >= cell_min), axis=1)
+            self.assertEqual(sorted(lists[starts[cell]:starts[cell + 1]]), list(np.flatnonzero(overlap)))
+
+        #changed instance changes row, so it is noticed by reprojection
+        group.offsets = group.offsets + 1
+        self.assertFalse(np.array_equal(group.to_array(), row))
+        np.testing.assert_allclose(group.get_bounds()[0], low.min(axis=0) + 1)
+
+    def test_distances(self):
+        group = make_group()
+        buffer = with_payloads([group], group.to_array()[None, :])
+        explicit = np.array([obj.to_array() for obj in explicit_spheres(group)])
+        low, high = group.get_bounds()
+        points = np.random.default_rng(1).uniform(low - 2, high + 2, (20000, 3))
+        exact = scene_distances(points, explicit)
+        instanced = scene_distances(points, buffer)
+        #instances farther than margin are replaced by lower bound
+        self.assertTrue(np.all(instanced <= exact + 1e-9))
+        near = exact < group.margin
+        self.assertTrue(np.any(near))
+        #objects closer to each other than blend_distance are smoothly blended in order of evaluation
+        np.testing.assert_allclose(instanced[near], exact[near], atol=0.01)
+
+    def assertRender(self, backend: str):
+        group = make_group()
+        plane = PlaneY(1.5, np.array([0, 0.8, 0.8]))
+        reference = make_camera(backend, width, height)
+        expected = reference.get_window_content(width, height, [plane] + explicit_spheres(group), record_march_stats=True)
+        for world, camera_params in (([plane, group], {}), ([plane, group], {'use_bvh': True}), (Scene([plane, group]), {})):
+            camera = make_camera(backend, width, height, **camera_params)
+            image = camera.get_window_content(width, height, world, record_march_stats=True)
+            #rays take other steps near instances, so they stop at other points of the hit epsilon band
+            same = np.all(np.abs(image.astype(int) - expected.astype(int)) <= 24, axis=-1)
+            self.assertGreater(np.mean(same), 0.97)
+            self.assertGreater(np.mean(camera.march_stats[..., 1] == reference.march_stats[..., 1]), 0.97)
+
+        with self.assertRaises(ValueError):
+            make_camera(backend, width, height, specialise=True).get_window_content(width, height, [plane, group])
+        #ray must not stop at lower bound of instances which were not evaluated
+        with self.assertRaises(ValueError):
+            make_camera(backend, width, height).get_window_content(width, height, [plane, group], min_hit_distance=group.margin)
+        with self.assertRaises(ValueError):
+            make_camera(backend, width, height).get_window_content(width, height, [plane, group], stepping='enhanced')
+        with self.assertRaises(ValueError):
+            make_camera(backend, width, height).get_frames_content(width, height, stack_frames(World([plane, group], lambda objects, t: objects), 1), min_hit_distance=group.margin)
+
+    test_render, test_render_cuda = backend_tests(assertRender)
+
+    def test_errors(self):
+        prototype = Box(np.zeros(3), np.ones(3) * 0.2, np.array([0, 1, 0]), 30)
+        offsets = np.zeros((2, 3))
+        with self.assertRaises(ValueError):
+            Instances(PlaneY(1), offsets)
+        with self.assertRaises(ValueError):
+            Instances(Instances(prototype, offsets), offsets)
+        with self.assertRaises(ValueError):
+            Instances(prototype, np.zeros((0, 3)))
+        with self.assertRaises(ValueError):
+            Instances(prototype, offsets, scales=np.array([1, 0]))
+        with self.assertRaises(ValueError):
+            Instances(prototype, offsets, colors=np.ones((3, 3)))
+        with self.assertRaises(ValueError):
+            Instances(prototype, offsets, margin=0)
+
+if __name__ == '__main__':
+    unittest.main()
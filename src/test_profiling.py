@@ -0,0 +1,118 @@
+import copy
+import json
+import os
+import tempfile
+import threading
+import unittest
+import numpy as np
+from src.camera import stack_frames
+from src.profiling import StageStats, Profiler, format_summary
+from src.example_worlds import world_1, world_3
+from src.test_camera import make_camera, backend_tests
+
+width, height = 16, 12
+
+class TestProfiling(unittest.TestCase):
+    def test_stage_stats(self):
+        stats = StageStats(window=100)
+        for duration in range(1, 201):
+            stats.add('kernel', duration * 10**6)
+        #only the last 100 samples are in the window
+        self.assertAlmostEqual(stats.percentile('kernel', 50), 150.5)
+        summary = stats.summary((50, 90))
+        self.assertEqual(summary['kernel']['count'], 200)
+        self.assertAlmostEqual(summary['kernel']['max_ms'], 200)
+        self.assertAlmostEqual(summary['kernel']['p90_ms'], 190.1)
+        self.assertIn('p90_ms', format_summary(summary))
+        with self.assertRaises(ValueError):
+            StageStats(window=0)
+
+    def test_frames(self):
+        frames = []
+        profiler = Profiler(callbacks=[lambda name, stages: frames.append((name, stages))])
+        with profiler.frame('outer'):
+            with profiler.stage('a'):
+                pass
+            with profiler.frame('inner'):
+                with profiler.stage('a'):
+                    pass
+                with profiler.stage('b'):
+                    pass
+        #callbacks get only the outermost frame, with repeated stages summed
+        self.assertEqual([name for name, _ in frames], ['outer'])
+        self.assertEqual(set(frames[0][1]), {'a', 'b', 'inner', 'outer'})
+        self.assertEqual(profiler.summary()['a']['count'], 2)
+
+        #stages of other threads do not belong to the frame
+        with profiler.frame('outer'):
+            def other_thread():
+                with profiler.stage('c'):
+                    pass
+            thread = threading.Thread(target=other_thread)
+            thread.start()
+            thread.join()
+            with profiler.stage('d'):
+                pass
+        self.assertEqual(set(frames[1][1]), {'d', 'outer'})
+
+        #failed frame does not call callbacks and does not leak into the next one
+        with self.assertRaises(KeyError):
+            with profiler.frame('outer'):
+                with profiler.stage('e'):
+                    raise KeyError()
+        with profiler.frame('outer'):
+            pass
+        self.assertEqual(len(frames), 3)
+        self.assertEqual(set(frames[2][1]), {'outer'})
+
+    def test_trace(self):
+        with self.assertRaises(ValueError):
+            Profiler().dump_trace('trace.json')
+        profiler = Profiler(trace=True)
+        with profiler.frame():
+            with profiler.stage('kernel'):
+                pass
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'trace.json')
+            profiler.dump_trace(path)
+            with open(path) as file:
+                trace = json.load(file)
+        events = [event for event in trace['traceEvents'] if event['ph'] == 'X']
+        self.assertEqual([event['name'] for event in events], ['kernel', 'frame'])
+        kernel, frame = events
+        self.assertGreaterEqual(kernel['ts'], frame['ts'])
+        self.assertLessEqual(kernel['ts'] + kernel['dur'], frame['ts'] + frame['dur'])
+
+    def assertCameraStages(self, backend: str):
+        frames = []
+        profiler = Profiler(callbacks=[lambda name, stages: frames.append((name, stages))])
+        camera = make_camera(backend, profiler=profiler, temporal_reprojection=True, dirty_tile_size=4)
+        image = camera.get_window_content(width, height, world_1.objects)
+        camera.get_window_content(width, height, world_1.objects)
+        self.assertTrue(np.array_equal(image, make_camera(backend).get_window_content(width, height, world_1.objects)))
+        self.assertEqual([name for name, _ in frames], ['get_window_content'] * 2)
+        #second frame of the same scene reuses all tiles
+        self.assertTrue({'pack', 'upload', 'changed_boxes', 'kernel', 'to_uint8'} <= set(frames[0][1]))
+        self.assertIn('dirty_tiles', frames[1][1])
+        for stage, duration in frames[1][1].items():
+            self.assertLessEqual(duration, frames[1][1]['get_window_content'], stage)
+
+        frames.clear()
+        #stack_frames animates objects in place, shared world is left as other tests expect it
+        camera.get_frames_content(width, height, stack_frames(copy.deepcopy(world_3), 3))
+        self.assertEqual([name for name, _ in frames], ['get_frames_content'])
+        self.assertIn('kernel', frames[0][1])
+
+        #every pass of progressive render is reported before it is yielded, no cuda events are left pending
+        frames.clear()
+        for number, (step, image) in enumerate(camera.get_window_content_progressive(width, height, world_1.objects, steps=(4, 2, 1))):
+            self.assertEqual(len(frames), number + 1)
+            self.assertIn('progressive_pass', frames[-1][1])
+            self.assertEqual(profiler.pending_events(), [])
+        self.assertEqual([name for name, _ in frames], ['get_window_content_progressive'] * 3)
+        self.assertIn('upload', frames[0][1])
+
+    test_camera_stages, test_camera_stages_cuda = backend_tests(assertCameraStages)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,142 @@
+import threading
+import time
+import unittest
+import numpy as np
+from src.render_worker import RenderWorker
+
+def wait_for_frame(worker: RenderWorker, timeout: float = 5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        frame = worker.acquire()
+        if frame is not None:
+            return frame
+        time.sleep(0.001)
+    raise TimeoutError("Worker did not finish frame")
+
+def make_buffers() -> list:
+    return [np.zeros((4, 3, 3), dtype=np.uint8) for _ in range(3)]
+
+class TestRenderWorker(unittest.TestCase):
+    def test_latest_request(self):
+        started = threading.Event()
+        release = threading.Event()
+        rendered = []
+        def render(value, out):
+            rendered.append(value)
+            if value == 0:
+                started.set()
+                release.wait()
+            out[...] = value
+
+        worker = RenderWorker(render, make_buffers())
+        self.assertIsNone(worker.acquire())
+        worker.request(0)
+        started.wait()
+        #requests posted during render replace each other
+        for value in range(1, 5):
+            worker.request(value)
+        release.set()
+        while worker.frames_rendered < 2:
+            time.sleep(0.001)
+        #only the newest finished frame is presented
+        self.assertEqual(wait_for_frame(worker)[0, 0, 0], 4)
+        self.assertIsNone(worker.acquire())
+        worker.stop()
+        self.assertEqual(rendered, [0, 4])
+        self.assertEqual(worker.frames_rendered, 2)
+
+    def test_presented_frame_is_kept(self):
+        buffers = make_buffers()
+        def render(value, out):
+            out[...] = value
+        worker = RenderWorker(render, buffers)
+        worker.request(1)
+        presented = wait_for_frame(worker)
+        for value in range(2, 10):
+            worker.request(value)
+            while worker.frames_rendered < value:
+                time.sleep(0.001)
+            self.assertTrue(np.all(presented == 1))
+        frame = wait_for_frame(worker)
+        self.assertEqual(frame[0, 0, 0], 9)
+        self.assertTrue(any(frame is buffer for buffer in buffers))
+        worker.stop()
+
+    def test_result(self):
+        def render(value, out):
+            out[...] = value
+            return value * 10
+        worker = RenderWorker(render, make_buffers())
+        self.assertIsNone(worker.front_result)
+        for value in range(1, 4):
+            worker.request(value)
+            frame = wait_for_frame(worker)
+            #result belongs to the acquired frame
+            self.assertEqual(worker.front_result, frame[0, 0, 0] * 10)
+        worker.stop()
+
+    def test_initial_front(self):
+        buffers = make_buffers()
+        buffers[1][...] = 7
+        worker = RenderWorker(lambda value, out: out.fill(value), buffers, front=1)
+        for value in range(3):
+            worker.request(value)
+            while worker.frames_rendered <= value:
+                time.sleep(0.001)
+        #presented buffer is kept until newer frame is acquired
+        self.assertTrue(np.all(buffers[1] == 7))
+        self.assertEqual(wait_for_frame(worker)[0, 0, 0], 2)
+        worker.stop()
+
+    def test_passes(self):
+        started = threading.Event()
+        release = threading.Event()
+        closed = []
+        def render(value, out):
+            try:
+                for step in (8, 4, 2, 1):
+                    if value == 0 and step == 4:
+                        started.set()
+                        release.wait()
+                    out[...] = step
+                    out = yield value, step
+            finally:
+                closed.append(value)
+
+        worker = RenderWorker(render, make_buffers())
+        worker.request(1)
+        while worker.busy or worker.frames_rendered < 4:
+            time.sleep(0.001)
+        #every pass is published and the last one is acquired
+        self.assertEqual(worker.frames_rendered, 4)
+        self.assertEqual(wait_for_frame(worker)[0, 0, 0], 1)
+        self.assertEqual(worker.front_result, (1, 1))
+
+        #newer request stops refinement after the current pass
+        worker.request(0)
+        started.wait()
+        worker.request(2)
+        release.set()
+        while worker.busy or worker.frames_rendered < 10:
+            time.sleep(0.001)
+        worker.stop()
+        self.assertEqual(wait_for_frame(worker)[0, 0, 0], 1)
+        self.assertEqual(worker.front_result, (2, 1))
+        self.assertEqual(closed, [1, 0, 2])
+        self.assertEqual(worker.frames_rendered, 10)
+
+    def test_error(self):
+        with self.assertRaises(ValueError):
+            RenderWorker(lambda value, out: None, make_buffers()[:2])
+        def render(value, out):
+            raise KeyError(value)
+        worker = RenderWorker(render, make_buffers())
+        worker.request(1)
+        worker.thread.join(5)
+        with self.assertRaises(RuntimeError):
+            worker.acquire()
+        with self.assertRaises(RuntimeError):
+            worker.stop()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,33 @@
+import unittest
+from src.resolution_scaler import ResolutionScaler
+
+class TestResolutionScaler(unittest.TestCase):
+    def test_levels(self):
+        scaler = ResolutionScaler(800, 600, budget=0.1, scales=(1.0, 0.5, 0.25))
+        self.assertEqual(scaler.resolutions, [(800, 600), (400, 300), (200, 150)])
+        self.assertEqual(scaler.resolution, (800, 600))
+        for params in [dict(budget=0), dict(budget=0.1, scales=(0.5, 1.0)), dict(budget=0.1, scales=(1.0, 0)),
+                       dict(budget=0.1, hysteresis=1), dict(budget=0.1, patience=0)]:
+            with self.assertRaises(ValueError):
+                ResolutionScaler(800, 600, **params)
+
+    def test_update(self):
+        scaler = ResolutionScaler(800, 600, budget=0.1, scales=(1.0, 0.5, 0.25), hysteresis=0.2, patience=3)
+        #frame within the hysteresis band keeps the level
+        self.assertEqual(scaler.update(0, 0.115), 0)
+        #slow frame goes straight to the largest level which fits into budget
+        self.assertEqual(scaler.update(0, 0.3), 1)
+        self.assertEqual(scaler.update(0, 10), 2)
+        #level goes up only after patience frames which predict it fits with margin
+        self.assertEqual(scaler.update(2, 0.019), 2)
+        self.assertEqual(scaler.update(2, 0.019), 2)
+        self.assertEqual(scaler.update(2, 0.019), 1)
+        #frames close to the budget reset patience
+        for frame_time in [0.019, 0.019, 0.025, 0.019, 0.019]:
+            self.assertEqual(scaler.update(1, frame_time), 1)
+        self.assertEqual(scaler.update(1, 0.019), 0)
+        #frames of other levels which were in flight are scaled by their number of pixels
+        self.assertEqual(scaler.update(2, 0.02), 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+import unittest
+import numpy as np
+from src.test_camera import make_camera
+from src.scene import Scene
+from src.ray_marchobject import Sphere, Box, Torus, PlaneY
+
+width, height = 16, 12
+
+def make_objects():
+    return [Box(np.array([4, 0, -1]), np.array([0.5, 0.5, 0.5]), np.array([0, 1, 0]), 30, np.array([1, 1, 0])),
+            Sphere(np.array([3, 0, 0]), 0.5, np.array([1, 0, 0])),
+            PlaneY(1.5),
+            Sphere(np.array([5, -1, 1]), 0.7, np.array([0, 0, 1])),
+            Torus(np.array([6, 0, 1]), np.array([1, 0.3]))]
+
+class TestScene(unittest.TestCase):
+    def test_packing(self):
+        objects = make_objects()
+        scene = Scene(objects)
+        self.assertEqual(len(scene), len(objects))
+        #rows keep order of the objects
+        self.assertEqual(scene.objects, objects)
+        self.assertTrue(np.array_equal(scene.buffer, [obj.to_array() for obj in objects]))
+
+        version = scene.version
+        scene.pack()
+        self.assertEqual(scene.version, version)
+
+        objects[1].center = np.array([3, 1, 0])
+        objects[0].rotation_angle += 10
+        buffer = scene.pack()
+        self.assertGreater(scene.version, version)
+        for obj in objects:
+            self.assertTrue(np.array_equal(buffer[obj._row], obj.to_array()))
+        self.assertTrue(np.allclose(scene.bounds[objects[1]._row][0], [2.5, 0.5, -0.5]))
+
+        scene.detach()
+        objects[1].radius = 2
+        self.assertEqual(scene.pack()[1, 4], 0.5)
+
+    def test_render_scene(self):
+        objects = make_objects()
+        scene = Scene(objects)
+        camera = make_camera('cpu')
+        fresh = make_camera('cpu')
+        for frame in range(3):
+            objects[1].center = np.array([3, 0.3 * frame, 0])
+            objects[0].rotation_angle = 30 + 15 * frame
+            image = camera.get_window_content(width, height, scene)
+            #the same as list of objects, near objects are blended in the same order
+            self.assertTrue(np.array_equal(image, fresh.get_window_content(width, height, objects)))
+            self.assertIs(camera.frame_context.objects_buffer, scene.buffer)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+import tempfile
+import unittest
+import numpy as np
+from src.test_camera import make_camera, backend_tests
+from src.scene import Scene
+from src.static_field import StaticField, scene_distances
+from src.ray_marchobject import Sphere, Box, Cylinder, PlaneY
+
+width, height = 32, 24
+bounds_min, bounds_max = np.array([-1, -3, -4]), np.array([9, 3, 4])
+
+def make_objects():
+    objects = [PlaneY(1.5, np.array([0, 0.8, 0.8])),
+               Sphere(np.array([3, 0, 0]), 0.5, np.array([1, 0, 0])),
+               Box(np.array([5, 0.5, -1.5]), np.array([0.5, 1, 0.5]), np.array([0, 1, 0]), 30, np.array([1, 1, 0])),
+               Cylinder(np.array([5, 0.5, 1.5]), 0.5, 1, np.array([1, 0, 1]), rotation_dir=np.array([0, 1, 0]))]
+    for obj in objects:
+        obj.static = not isinstance(obj, Sphere)
+    return objects
+
+class TestStaticField(unittest.TestCase):
+    def test_cache(self):
+        objects = make_objects()
+        rows = np.array([obj.to_array() for obj in objects])
+        static = np.array([obj.static for obj in objects])
+        attach = lambda field, rows, static: field.attach(rows[~static], rows[static])
+        with tempfile.TemporaryDirectory() as directory:
+            field = StaticField(bounds_min, bounds_max, cell_size=1, brick_cells=4, cache_dir=directory)
+            buffer = attach(field, rows, static)
+            self.assertEqual(field.bakes, 1)
+            #unchanged frame gets the same buffer
+            version = field.version
+            self.assertIs(attach(field, rows, static), buffer)
+            self.assertEqual(field.version, version)
+            self.assertTrue(np.array_equal(buffer[0], rows[1]))
+
+            #the same static objects are loaded from disk by other field
+            other = StaticField(bounds_min, bounds_max, cell_size=1, brick_cells=4, cache_dir=directory)
+            self.assertTrue(np.array_equal(attach(other, rows, static), buffer))
+            self.assertEqual(other.bakes, 0)
+
+            #moving dynamic object does not bake again, moving static one does
+            rows[1, 5] += 1
+            self.assertTrue(np.array_equal(attach(field, rows, static)[0], rows[1]))
+            self.assertGreater(field.version, version)
+            rows[0, 4] += 1
+            attach(field, rows, static)
+            self.assertEqual(field.bakes, 2)
+            self.assertIs(field.attach(rows, rows[:0]), rows)
+
+    def test_lower_bound(self):
+        objects = make_objects()
+        rows = np.array([obj.to_array() for obj in objects if obj.static])
+        field = StaticField(bounds_min, bounds_max, cell_size=1, brick_cells=4, cache_dir=None)
+        buffer = field.attach(rows[:0], rows)
+        points = np.random.default_rng(0).uniform(bounds_min - 1, bounds_max + 1, (20000, 3))
+        exact = scene_distances(points, rows)
+        baked = scene_distances(points, buffer)
+        #baked distance never overshoots surfaces and it is exact close to them
+        self.assertTrue(np.all(baked <= exact + 1e-9))
+        near = exact < field.exact_distance / 2
+        self.assertTrue(np.any(near))
+        self.assertTrue(np.allclose(baked[near], exact[near]))
+        self.assertGreater(np.mean(baked[~near]), 0)
+
+    def assertRender(self, backend: str):
+        objects = make_objects()
+        reference = make_camera(backend, width, height)
+        for world in (objects, Scene(make_objects())):
+            field = StaticField(bounds_min, bounds_max, cell_size=1, brick_cells=4, cache_dir=None)
+            camera = make_camera(backend, width, height, static_field=field)
+            world_objects = world.objects if isinstance(world, Scene) else world
+            #dynamic objects come before the baked ones, so objects are blended in the same order
+            ordered = [obj for obj in world_objects if not obj.static] + [obj for obj in world_objects if obj.static]
+            for frame in range(2):
+                ordered[0].center = np.array([3, 0.5 * frame, 0])
+                image = camera.get_window_content(width, height, world, record_march_stats=True)
+                expected = reference.get_window_content(width, height, ordered, record_march_stats=True)
+                #rays take different steps, so they stop at other points of the hit epsilon band, which changes shading a bit
+                same = np.all(np.abs(image.astype(int) - expected.astype(int)) <= 24, axis=-1)
+                self.assertGreater(np.mean(same), 0.97)
+                self.assertGreater(np.mean(camera.march_stats[..., 1] == reference.march_stats[..., 1]), 0.97)
+            self.assertEqual(field.bakes, 1)
+
+        with self.assertRaises(ValueError):
+            make_camera(backend, width, height, static_field=field, use_bvh=True)
+
+    test_render, test_render_cuda = backend_tests(assertRender)
+
+    def test_errors(self):
+        with self.assertRaises(ValueError):
+            StaticField(bounds_max, bounds_min)
+        with self.assertRaises(ValueError):
+            StaticField(bounds_min, bounds_max, cell_size=0)
+        with self.assertRaises(ValueError):
+            StaticField(bounds_min, bounds_max, brick_cells=0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+import unittest
+import numpy as np
+from src.camera import RayMarchCamera
+from src.test_camera import make_camera
+from src.tile_scheduler import TileScheduler
+from src.example_worlds import world_2
+from src.scene import Scene
+from src.static_field import StaticField
+from src.ray_marchobject import Sphere, PlaneY, Instances
+
+width, height = 16, 12
+
+class TestTileScheduler(unittest.TestCase):
+    def test_matches_camera(self):
+        camera = make_camera('cpu')
+        expected = camera.get_window_content(width, height, world_2.objects)
+        #tiles do not divide the frame evenly
+        with TileScheduler(camera, width, height, workers=2, tile_size=5) as scheduler:
+            self.assertEqual(len(scheduler.tiles), 12)
+            self.assertTrue(np.array_equal(scheduler.render(world_2.objects), expected))
+            self.assertTrue(np.all(scheduler.tile_times > 0))
+            camera.look_at(np.array([0, 1, 0]), np.array([10, 0, 1]))
+            self.assertTrue(np.array_equal(scheduler.render(Scene(world_2.objects)), camera.get_window_content(width, height, world_2.objects)))
+            #larger scene does not fit into the shared scene block of the previous frames
+            generation = scheduler.generation
+            objects = world_2.objects + [Sphere(np.array([6, -1 + 0.1 * i, 2]), 0.2) for i in range(4 * len(world_2.objects))]
+            self.assertTrue(np.array_equal(scheduler.render(objects), camera.get_window_content(width, height, objects)))
+            self.assertGreater(scheduler.generation, generation)
+            #instances are followed by their payload rows
+            group = Instances.grid(Sphere(np.zeros(3), 0.3, np.array([1, 0, 0])), (3, 1, 4), np.array([0.9, 0, 0.8]), origin=np.array([4, 0, -1.2]))
+            objects = [PlaneY(1.5), group]
+            self.assertTrue(np.array_equal(scheduler.render(objects), camera.get_window_content(width, height, objects)))
+            with self.assertRaises(ValueError):
+                scheduler.render(objects, min_hit_distance=group.margin)
+        self.assertIsNone(scheduler.memory)
+        self.assertIsNone(scheduler.scene_memory)
+
+    def test_invalid_arguments(self):
+        camera = RayMarchCamera(screne_width=width, screne_height=height, backend='cpu')
+        with self.assertRaises(ValueError):
+            TileScheduler(camera, width, height, tile_size=0)
+        with self.assertRaises(ValueError):
+            TileScheduler(camera, width, height, workers=0)
+        #options which tiles would ignore
+        field = StaticField(np.array([-1, -1, -1]), np.array([1, 1, 1]), cache_dir=None)
+        for camera_params in ({'backend': 'cuda'}, {'specialise': True}, {'static_field': field}, {'depth_prepass_tile': 4},
+                              {'temporal_reprojection': True}, {'dirty_tile_size': 4}):
+            camera = RayMarchCamera(screne_width=width, screne_height=height, backend='cpu')
+            for name, value in camera_params.items():
+                setattr(camera, name, value)
+            with self.assertRaises(ValueError):
+                TileScheduler(camera, width, height, workers=1)
+
+if __name__ == '__main__':
+    unittest.main()
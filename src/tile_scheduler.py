@@ -0,0 +1,221 @@
+'''
+Rendering of one frame by pool of worker processes on CPU.
+Frame is split into tiles which workers take one by one from shared task queue, so worker which got cheap tiles
+(sky exits after one step) takes more of them while others march expensive ones (fuzzy spheres use the whole budget).
+Tiles which were the slowest in previous frame are queued first. Workers write pixels into framebuffer in shared memory.
+Scene of the frame (camera matrices, object buffer, BVH and march parameters) is written once per frame into another
+shared block described by small shared header, so tasks carry only tile coordinates.
+Workers run on one machine, there is no path over several devices. Tiles pay off only when the processes have cores
+to themselves, with few cores single get_window_content (numba threads of one process) is faster, see bench_tiles.
+'''
+import multiprocessing
+import time
+import numba
+import numpy as np
+from multiprocessing import shared_memory
+from typing import Union
+from src.camera import RayMarchCamera, to_uint8, check_instance_margins
+from src.ray_march_cuda import normal_modes, pack_march_params, object_row_size
+import src.ray_march_cuda as ray_march_cuda
+from src.ray_march_cpu import get_variant, ray_march_tile
+from src.bvh import build_bvh, empty_bvh, bvh_node_size
+from src.scene import Scene
+from src.ray_marchobject import with_payloads
+
+#header of the scene is [frame, generation of scene block, origin x, y, z, normal mode, object rows, bvh nodes, march params]
+scene_header_size = 9
+camera_matrices_size = 2 * 4 * 4
+
+#state of the worker process, it is set by _init_worker
+_worker = {}
+
+def _init_worker(name: str, shape: tuple, dtype: str, header_name: str) -> None:
+    '''
+    Attaches framebuffer and scene header in shared memory, it runs once in every worker process
+    '''
+    #parallelism comes from the processes, kernel is still compiled as parallel because numba optimises it better
+    numba.set_num_threads(1)
+    memory = shared_memory.SharedMemory(name=name)
+    _worker['memory'] = memory
+    _worker['framebuffer'] = np.ndarray(shape, dtype=dtype, buffer=memory.buf)
+    header_memory = shared_memory.SharedMemory(name=header_name)
+    _worker['header_memory'] = header_memory
+    _worker['header'] = np.ndarray(scene_header_size, dtype=np.float64, buffer=header_memory.buf)
+    _worker['dtype'] = np.dtype(dtype)
+    _worker['kernel'] = get_variant(ray_march_tile, dtype)
+    _worker['no_march_stats'] = np.zeros((0, 0, 2), dtype=np.int32)
+    _worker['no_start_depths'] = np.zeros((0, 0), dtype=dtype)
+    _worker['frame'] = -1
+    _worker['generation'] = -1
+    _worker['scene_memory'] = None
+
+def scene_block_name(header_name: str, generation: int) -> str:
+    return f"{header_name}_{generation}"
+
+def _worker_scene() -> tuple:
+    '''
+    Arguments of the kernel for the current frame, views into scene block are made again only when frame changes
+    '''
+    header = _worker['header']
+    if header[0] != _worker['frame']:
+        generation = int(header[1])
+        if generation != _worker['generation']:
+            #views must be dropped before the old block is closed
+            _worker['scene'] = None
+            if _worker['scene_memory'] is not None:
+                _worker['scene_memory'].close()
+            _worker['scene_memory'] = shared_memory.SharedMemory(name=scene_block_name(_worker['header_memory'].name, generation))
+            _worker['generation'] = generation
+        dtype = _worker['dtype']
+        rows, nodes, params = int(header[6]), int(header[7]), int(header[8])
+        values = np.ndarray(camera_matrices_size + rows * object_row_size + nodes * bvh_node_size + params, dtype=dtype,
+                            buffer=_worker['scene_memory'].buf)
+        objects_end = camera_matrices_size + rows * object_row_size
+        bvh_end = objects_end + nodes * bvh_node_size
+        origin_x, origin_y, origin_z = header[2:5].astype(dtype)
+        _worker['scene'] = (origin_x, origin_y, origin_z, values[:camera_matrices_size].reshape(2, 4, 4),
+                            values[camera_matrices_size:objects_end].reshape(rows, object_row_size),
+                            values[objects_end:bvh_end].reshape(nodes, bvh_node_size), int(header[5]), values[bvh_end:])
+        _worker['frame'] = header[0]
+    return _worker['scene']
+
+def _render_tile(task: tuple) -> tuple:
+    '''
+    Renders tile into shared framebuffer, returns index of the tile and time it took
+    '''
+    index, (first_x, first_y, last_x, last_y) = task
+    origin_x, origin_y, origin_z, camera_matrices, objects_buffer, bvh, normal_mode, march_params = _worker_scene()
+    start = time.perf_counter()
+    _worker['kernel'](_worker['framebuffer'], _worker['no_march_stats'], _worker['no_start_depths'], first_x, first_y, last_x, last_y,
+                      origin_x, origin_y, origin_z, camera_matrices, objects_buffer, bvh, normal_mode, march_params)
+    return index, time.perf_counter() - start
+
+def check_camera(camera: RayMarchCamera) -> None:
+    '''
+    Raises ValueError for camera options which tiles do not support, so they are not silently ignored
+    '''
+    if camera.backend != 'cpu':
+        raise ValueError("Tile scheduler renders only with cpu backend")
+    unsupported = [name for name, used in (('specialise', camera.specialise), ('static_field', camera.static_field is not None),
+                                           ('depth_prepass_tile', camera.depth_prepass_tile > 0),
+                                           ('temporal_reprojection', camera.temporal_reprojection),
+                                           ('dirty_tile_size', camera.dirty_tile_size > 0)) if used]
+    if unsupported:
+        raise ValueError(f"Tile scheduler does not support camera options {', '.join(unsupported)}")
+
+class TileScheduler:
+    '''
+    Renders frames of camera with cpu backend in tiles of tile_size by pool of workers processes (by default one per core)
+    numba in every worker runs on single thread and every worker compiles the kernel when it gets its first tile.
+    self.tile_times holds render time of every tile of the last frame [tiles_x, tiles_y]
+    camera must not use specialised kernels, static field, depth prepass, reprojection or dirty tiles (see check_camera)
+    '''
+    def __init__(self, camera: RayMarchCamera, pixel_width: int, pixel_height: int, workers: int = None, tile_size: int = 32):
+        check_camera(camera)
+        if tile_size < 1:
+            raise ValueError(f"tile_size must be positive, got {tile_size}")
+        if workers is not None and workers < 1:
+            raise ValueError(f"workers must be positive, got {workers}")
+        self.camera = camera
+        self.pixel_width = pixel_width
+        self.pixel_height = pixel_height
+        self.tile_size = tile_size
+        self.workers = workers or multiprocessing.cpu_count()
+        tiles_x = (pixel_width + tile_size - 1) // tile_size
+        tiles_y = (pixel_height + tile_size - 1) // tile_size
+        self.tiles = [(x * tile_size, y * tile_size, min((x + 1) * tile_size, pixel_width), min((y + 1) * tile_size, pixel_height))
+                      for x in range(tiles_x) for y in range(tiles_y)]
+        self.tile_times = np.zeros((tiles_x, tiles_y))
+
+        self.shape = (pixel_width, pixel_height, 3)
+        self.memory = shared_memory.SharedMemory(create=True, size=int(np.prod(self.shape)) * camera.dtype.itemsize)
+        self.framebuffer = np.ndarray(self.shape, dtype=camera.dtype, buffer=self.memory.buf)
+        self.header_memory = shared_memory.SharedMemory(create=True, size=scene_header_size * 8)
+        self.header = np.ndarray(scene_header_size, dtype=np.float64, buffer=self.header_memory.buf)
+        self.header[:] = 0
+        self.scene_memory = None
+        self.generation = 0
+        self.frame = 0
+        #workers are spawned, forking after numba started its threads for parallel kernels hangs this process on exit
+        context = multiprocessing.get_context('spawn')
+        self.pool = context.Pool(self.workers, initializer=_init_worker,
+                                 initargs=(self.memory.name, self.shape, camera.dtype.str, self.header_memory.name))
+
+    def render(self, world: Union[list, Scene], number_of_steps: int = ray_march_cuda.number_of_steps,
+               min_hit_distance: float = ray_march_cuda.min_hit_distance, max_trace_distance: float = ray_march_cuda.max_trace_distance,
+               background_color: np.ndarray = ray_march_cuda.background_color) -> np.ndarray:
+        '''
+        Renders frame of world from current pose of the camera, returns matrix [pixel_width, pixel_height, 3] like get_window_content
+        it uses plain sphere tracing and BVH if camera uses it, camera options are checked again as they can be changed
+        '''
+        camera = self.camera
+        check_camera(camera)
+        objects = world.objects if isinstance(world, Scene) else world
+        if camera.use_bvh:
+            objects_buffer, bvh = build_bvh(objects, camera.dtype)
+        else:
+            rows = world.pack().astype(camera.dtype) if isinstance(world, Scene) else np.array([obj.to_array() for obj in objects], dtype=camera.dtype)
+            objects_buffer = with_payloads(objects, rows)
+            bvh = empty_bvh(camera.dtype)
+        march_params = pack_march_params(number_of_steps, min_hit_distance, max_trace_distance, background_color, dtype=camera.dtype)
+        check_instance_margins(objects_buffer, march_params)
+        self.upload_scene(objects_buffer, bvh, march_params)
+
+        #the slowest tiles of previous frame go first, so no worker is left with expensive tile at the end
+        order = np.argsort(-self.tile_times.ravel(), kind='stable')
+        tasks = [(index, self.tiles[index]) for index in order]
+        for index, elapsed in self.pool.imap_unordered(_render_tile, tasks, chunksize=1):
+            self.record_time(index, elapsed)
+        return to_uint8(self.framebuffer)
+
+    def upload_scene(self, objects_buffer: np.ndarray, bvh: np.ndarray, march_params: np.ndarray) -> None:
+        '''
+        Writes scene of the frame into shared scene block (new larger block is made when it does not fit) and its header,
+        workers are idle between frames, so nobody reads the block while it is written
+        '''
+        values = np.concatenate([self.camera.camera_matrices.ravel(), objects_buffer.ravel(), bvh.ravel(), march_params.ravel()])
+        if self.scene_memory is None or self.scene_memory.size < values.nbytes:
+            self.close_scene()
+            self.generation += 1
+            #block grows with some reserve, so scene growing by few objects does not make new block every frame
+            self.scene_memory = shared_memory.SharedMemory(create=True, size=2 * values.nbytes,
+                                                           name=scene_block_name(self.header_memory.name, self.generation))
+        np.ndarray(len(values), dtype=values.dtype, buffer=self.scene_memory.buf)[:] = values
+        self.frame += 1
+        self.header[:] = [self.frame, self.generation, *self.camera.pos, normal_modes.index(self.camera.normal_mode),
+                          len(objects_buffer), len(bvh), len(march_params)]
+
+    def close_scene(self) -> None:
+        if self.scene_memory is not None:
+            self.scene_memory.close()
+            self.scene_memory.unlink()
+            self.scene_memory = None
+
+    def record_time(self, index: int, elapsed: float) -> None:
+        self.tile_times.ravel()[index] = elapsed
+
+    def close(self) -> None:
+        '''
+        Stops workers and frees shared framebuffer and scene
+        '''
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
+        if self.memory is not None:
+            self.framebuffer = None
+            self.memory.close()
+            self.memory.unlink()
+            self.memory = None
+        if self.header_memory is not None:
+            self.close_scene()
+            self.header = None
+            self.header_memory.close()
+            self.header_memory.unlink()
+            self.header_memory = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()